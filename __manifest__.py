@@ -15,6 +15,7 @@
     'data': [
         'security/ir.model.access.csv',
         'data/data.xml',
+        'data/zatca_cron.xml',
         'views/res_config_settings.xml',
         'views/res_partner.xml',
         'views/res_company.xml',
@@ -22,5 +23,10 @@
         'views/account_tax.xml',
         'views/product_product.xml',
         'views/eway_config.xml',
+        'views/zatca_submission.xml',
+        'views/zatca_egs_unit.xml',
+        'views/zatca_compliance_run.xml',
+        'views/zatca_validation_message.xml',
+        'views/zatca_batch.xml',
     ],
 }
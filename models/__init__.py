@@ -3,4 +3,5 @@
 from . import account_tax, account_move
 from . import sale_order, sale_order_line
 from . import res_company, res_partner, product_product, res_config_settings
-from . import configuration
\ No newline at end of file
+from . import configuration, zatca_invoice_chain, zatca_submission, zatca_egs_unit, zatca_compliance_run
+from . import zatca_xml_blob, zatca_invoice_document, zatca_validation_message
\ No newline at end of file
@@ -1,25 +1,31 @@
 import os
-from cryptography.hazmat.backends import default_backend
 from odoo import api, fields, models, exceptions
-from cryptography import x509
-from decimal import Decimal
 import lxml.etree as ET
-import requests
 import hashlib
 import base64
-import math
 import uuid
 import json
+import logging
+
+from ..tools import certificate as signing_certificate, client, dispatcher, hashing, money, pool, signing, totals, ubl
+
+_logger = logging.getLogger(__name__)
 
 
 class AccountMove(models.Model):
     _inherit = "account.move"
 
-    zatca_hash_cleared_invoice = fields.Binary("ZATCA returned cleared invoice", attachment=True, readonly=1)
+    # ZATCA artifacts live in zatca.invoice.document, the XML compressed in zatca.xml.blob;
+    # none of the fields below is read along with the move
+    zatca_document_id = fields.Many2one('zatca.invoice.document', readonly=1, copy=False)
+    zatca_invoice_blob_id = fields.Many2one(related='zatca_document_id.invoice_blob_id', prefetch=False)
+    zatca_cleared_blob_id = fields.Many2one(related='zatca_document_id.cleared_blob_id', prefetch=False)
+    zatca_hash_cleared_invoice = fields.Binary("ZATCA returned cleared invoice", prefetch=False,
+                                               compute='_compute_zatca_hash_cleared_invoice')
     zatca_hash_cleared_invoice_name = fields.Char()
-    xml_sign_char_data = fields.Text()
+    xml_sign_char_data = fields.Text(compute='_compute_zatca_invoice', prefetch=False)
 
-    zatca_invoice = fields.Binary("ZATCA generated invoice", attachment=True, readonly=1)
+    zatca_invoice = fields.Binary("ZATCA generated invoice", compute='_compute_zatca_invoice', prefetch=False)
     zatca_invoice_name = fields.Char()
     credit_debit_reason = fields.Char(string="Reasons for issuance of credit / debit note",
                                    help="Reasons as per Article 40 (paragraph 1) of KSA VAT regulations")
@@ -32,13 +38,66 @@ class AccountMove(models.Model):
 
 
 
-    zatca_compliance_invoices_api = fields.Html(readonly=1)
+    zatca_compliance_invoices_api = fields.Html(related='zatca_document_id.validation_result', prefetch=False)
 
     # Never show these fields on front
     invoice_uuid = fields.Char('zatca uuid', readonly=1)
     zatca_invoice_hash = fields.Char(readonly=1)
-    zatca_hash_invoice = fields.Binary("ZATCA generated invoice for hash", attachment=True, readonly=1)
+    zatca_hash_invoice = fields.Binary("ZATCA generated invoice for hash", compute='_compute_zatca_hash_invoice',
+                                       prefetch=False)
     zatca_hash_invoice_name = fields.Char(readonly=1)
+    # SHA-256 of the inputs of the generated document, see _zatca_prepare_changed
+    zatca_input_fingerprint = fields.Char(readonly=1, copy=False)
+    zatca_reporting_status = fields.Char('ZATCA Reporting Status', readonly=1, copy=False, index=True)
+
+    def _compute_zatca_invoice(self):
+        contents = self._zatca_xml_contents('zatca_invoice')
+        for move in self:
+            content = contents.get(move.id)
+            move.zatca_invoice = base64.b64encode(content) if content else False
+            move.xml_sign_char_data = content.decode('UTF-8') if content else False
+
+    def _compute_zatca_hash_invoice(self):
+        contents = self._zatca_xml_contents('zatca_invoice')
+        for move in self:
+            content = contents.get(move.id)
+            move.zatca_hash_invoice = base64.b64encode(move._zatca_hash_xml(content)[1]) if content else False
+
+    def _compute_zatca_hash_cleared_invoice(self):
+        contents = self._zatca_xml_contents('zatca_hash_cleared_invoice')
+        for move in self:
+            content = contents.get(move.id)
+            move.zatca_hash_cleared_invoice = base64.b64encode(content) if content else False
+
+    def _zatca_xml_contents(self, res_field):
+        """Return the raw XML of the moves for 'zatca_invoice' or 'zatca_hash_cleared_invoice', by move id.
+
+        Documents generated before the blob storage are read from their former attachments.
+        """
+        blob_field = 'zatca_invoice_blob_id' if res_field == 'zatca_invoice' else 'zatca_cleared_blob_id'
+        contents = {move.id: move[blob_field]._content() for move in self if move[blob_field]}
+        legacy_ids = [move_id for move_id in self.ids if move_id not in contents]
+        if legacy_ids:
+            attachments = self.env['ir.attachment'].sudo().search([('res_model', '=', 'account.move'),
+                                                                   ('res_field', '=', res_field),
+                                                                   ('res_id', 'in', legacy_ids)])
+            for attachment in attachments:
+                contents[attachment.res_id] = attachment.raw
+        return contents
+
+    def _zatca_documents(self):
+        """Return the ZATCA documents of the moves, created for the moves without one."""
+        missing = self.filtered(lambda m: not m.zatca_document_id)
+        if missing:
+            documents = self.env['zatca.invoice.document'].sudo().create([{'move_id': move.id} for move in missing])
+            for move, document in zip(missing, documents):
+                move.zatca_document_id = document
+        return self.mapped('zatca_document_id')
+
+    def _zatca_invoice_xml(self):
+        """Return the raw generated XML of the move, False when not generated yet."""
+        self.ensure_one()
+        return self._zatca_xml_contents('zatca_invoice').get(self.id, False)
 
     @api.onchange('invoice_date', 'highest_name', 'company_id')
     def _onchange_invoice_date(self):
@@ -55,110 +114,330 @@ class AccountMove(models.Model):
             else:
                 self._onchange_recompute_dynamic_lines()
 
+    def _post(self, soft=True):
+        posted = super(AccountMove, self)._post(soft)
+        # ZATCA submissions are sent by the queue cron, posting only enqueues them
+        posted._zatca_enqueue()
+        return posted
+
+    def _zatca_enqueue(self, kind=None):
+        """Queue the ZATCA submission of the customer invoices of companies configured for ZATCA.
+
+        :param kind: submission kind, by default clearance for standard invoices and
+                     reporting for simplified ones
+        """
+        configurations = self.env['zatca.einvoice.configuration']
+        moves = self.filtered(lambda m: m.is_sale_document(include_receipts=True)
+                              and configurations._get_snapshot(m.company_id.id).configuration_id)
+        submissions = self.env['zatca.submission'].sudo()
+        # a move posted again, after a reset to draft, is not submitted twice
+        queued = set((job.move_id.id, job.kind) for job in submissions.search(
+            [('move_id', 'in', moves.ids), ('state', 'in', ('pending', 'in_flight'))]))
+        vals_list = []
+        for move in moves:
+            vals = {'move_id': move.id, 'kind': kind or move._zatca_submission_kind()}
+            if (move.id, vals['kind']) not in queued:
+                vals_list.append(vals)
+        return submissions.create(vals_list)
+
+    def _zatca_submission_kind(self):
+        # simplified invoices (tax category O) are reported, standard ones cleared
+        if 'O' in self.invoice_line_ids.tax_ids.mapped('classified_tax_category'):
+            return 'reporting'
+        return 'clearance'
+
     def create_xml_file(self, previous_hash=0):
-        amount_verification = 0  # for debug mode
-        conf = self.env['ir.config_parameter'].sudo()
+        return self.create_xml_files(previous_hash=previous_hash)
+
+    def create_xml_files(self, previous_hash=0):
+        """Generate the ZATCA XML of every move of the recordset.
+
+        Companies, partners, lines, taxes and products are prefetched for the whole
+        batch and the attachments are written in bulk, by blocks of moves. With
+        'zatca.generation_processes' above 1, rendering, hashing and signing are fanned
+        out to worker processes, see ``tools.pool``.
+        """
+        # PIH chain follows the move ids
+        moves = self.sorted('id')
+        moves.mapped('company_id.state_id.name')
+        moves.mapped('company_id.country_id.code')
+        moves.mapped('partner_id.state_id.name')
+        moves.mapped('partner_id.country_id.code')
+        hash_method = self._zatca_hash_method()
+        processes = int(self.env['ir.config_parameter'].sudo().get_param('zatca.generation_processes', 0) or 0)
+        processes = processes if len(moves) > 1 else 0
+
+        chains = moves._zatca_lock_chains()
+        count = 0
+        with pool.executor(processes) as executor:
+            for start in range(0, len(moves), 1000):
+                block = moves[start:start + 1000]
+                # documents whose inputs did not change are kept, with their ICV
+                prepared = block._zatca_prepare_changed(previous_hash, block._zatca_line_metadata())
+                block = block.browse(list(prepared))
+                if executor:
+                    generated = block._zatca_generate_parallel(executor, processes, hash_method, chains, prepared)
+                else:
+                    generated = block._zatca_generate_serial(hash_method, chains, prepared)
+                block._zatca_store_generated(generated)
+                count += len(block)
+        _logger.info("ZATCA: XML generated for %s move(s), %s unchanged.", count, len(moves) - count)
+
+    def _zatca_prepare_changed(self, previous_hash, metadata):
+        """Return the document data of the moves to generate, by move id.
+
+        Moves already generated are left out when the fingerprint of their inputs is
+        the one stored at their last generation; the new fingerprint is stored on the
+        others. Each move is signed with the certificate of its company.
+
+        Moves cleared or reported, or being sent, are never generated again: their
+        document, ICV and hash are the ones ZATCA holds. Moves generated before the
+        fingerprints are taken as generated from their current inputs, the fingerprint
+        of which is stored.
+        """
+        prepared = {}
+        certificates = {}
+        sending = set(self.env['zatca.submission'].sudo().search([
+            ('move_id', 'in', self.ids), ('state', '=', 'in_flight'), ('kind', '!=', 'compliance'),
+        ]).mapped('move_id').ids)
+        for move in self:
+            if move.zatca_invoice_name and (move.id in sending or move._zatca_submitted('clearance')
+                                            or move._zatca_submitted('reporting')):
+                continue
+            if move.company_id not in certificates:
+                certificates[move.company_id] = move._zatca_certificate_values()
+            certificate = certificates[move.company_id]
+            data = move._zatca_prepare_invoice_data(certificate, previous_hash, metadata)
+            fingerprint = move._zatca_fingerprint(data, certificate)
+            if move.zatca_invoice_name and move.zatca_input_fingerprint in (False, fingerprint):
+                if not move.zatca_input_fingerprint:
+                    move.zatca_input_fingerprint = fingerprint
+                continue
+            move.zatca_input_fingerprint = fingerprint
+            prepared[move.id] = data
+        return prepared
+
+    def _zatca_fingerprint(self, data, certificate):
+        """Return the SHA-256 of the document inputs: prepared data, but the signing time, and certificate."""
+        values = dict(data, certificate=certificate['digest'])
+        if values.get('signature'):
+            values['signature'] = dict(values['signature'], signing_time=None)
+        return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()
+
+    def _zatca_lock_chains(self):
+        """Lock the chain heads of the move companies, return them by company, without signer yet.
+
+        BR-KSA-26: all the chains of a batch are locked up front, in company id order, see
+        ``zatca.invoice.chain._lock_for_companies``; taken one move at a time, two batches
+        mixing companies could lock them crosswise.
+        """
+        heads = self.env['zatca.invoice.chain'].sudo()._lock_for_companies(self.mapped('company_id'))
+        return dict((company, (chain, None)) for company, chain in heads.items())
+
+    def _zatca_chain(self, chains):
+        """Return the locked chain head and the signer of the move company, see ``_zatca_lock_chains``."""
+        chain, signer = chains[self.company_id]
+        if signer is None:
+            signer = self._zatca_signer()
+            chains[self.company_id] = (chain, signer)
+        return chain, signer
+
+    def _zatca_line_metadata(self):
+        """Return the values of the lines of the moves, their taxes and products, by id.
+
+        One ``read()`` per model for the whole recordset, line values are then looked up
+        in plain dicts:
+
+        * ``lines``: move id -> list of ``(line id, quantity, price unit, discount, tax ids, product id)``
+        * ``taxes``: tax id -> ``(category, percent, exemption code, exemption text)``
+        * ``products``: product id -> ``(name, item identification or False)``
+        * ``references``: move id -> billing references, see ``_zatca_billing_references``
+        """
+        lines = {}
+        tax_ids = set()
+        product_ids = set()
+        for line in self.mapped('invoice_line_ids').read(
+                ['move_id', 'quantity', 'price_unit', 'discount', 'tax_ids', 'product_id'], load=None):
+            lines.setdefault(line['move_id'], []).append((line['id'], line['quantity'], line['price_unit'],
+                                                          line['discount'], line['tax_ids'], line['product_id']))
+            tax_ids.update(line['tax_ids'])
+            product_ids.add(line['product_id'])
+        taxes = {tax['id']: (tax['classified_tax_category'], tax['amount'], tax['tax_exemption_code'],
+                             tax['tax_exemption_text'])
+                 for tax in self.env['account.tax'].browse(tax_ids).read(
+                     ['classified_tax_category', 'amount', 'tax_exemption_code', 'tax_exemption_text'])}
+        products = {product['id']: (str(product['name']), (str(product['code_type']), str(product['barcode']))
+                                    if product['barcode'] and product['code_type'] else False)
+                    for product in self.env['product.product'].browse(product_ids - {False}).read(
+                        ['name', 'barcode', 'code_type'])}
+        products[False] = ('False', False)
+        return {'lines': lines, 'taxes': taxes, 'products': products, 'references': self._zatca_billing_references()}
+
+    def _zatca_billing_references(self):
+        """Return the ``(id, issue date)`` of the invoices the credit and debit notes refer to, by move id (BR-KSA-56).
+
+        The original invoice is the reversed entry of a credit note and the debit origin
+        of a debit note. Notes without one, e.g. imported, fall back on the invoice names
+        of their reference, 'Reversal of: <name>[, <name>...][, <reason>]', searched once
+        for the whole recordset within the note companies.
+        """
+        notes = self.filtered(lambda m: m.move_type == 'out_refund' or m.debit_origin_id)
+        originals = {}
+        names = {}
+        for note in notes:
+            original = note.reversed_entry_id or note.debit_origin_id
+            if original:
+                originals[note.id] = original
+            elif note.ref and note.ref.startswith('Reversal of: '):
+                names[note.id] = [name.strip() for name in note.ref[len('Reversal of: '):].split(',')]
+        if names:
+            found = {}
+            for move in self.search([('name', 'in', list({name for values in names.values() for name in values})),
+                                     ('company_id', 'in', notes.mapped('company_id').ids),
+                                     ('state', '=', 'posted'),
+                                     ('move_type', 'in', ('out_invoice', 'out_receipt'))]):
+                found[(move.company_id.id, move.name)] = move
+            for note in self.browse(list(names)):
+                keys = [(note.company_id.id, name) for name in names[note.id]]
+                originals[note.id] = self.browse().concat(*[found[key] for key in keys if key in found])
+        return dict((note_id, [(original.id, original.datetime_field.strftime('%Y-%m-%d'))
+                               for original in records])
+                    for note_id, records in originals.items())
+
+    def _zatca_generate_serial(self, hash_method, chains, prepared):
+        """Yield ``(move, file name specification, invoice hash, hashed document, document)`` tuples.
+
+        :param prepared: document data of the moves by move id, see ``_zatca_prepare_changed``
+        """
+        for move in self:
+            chain, signer = move._zatca_chain(chains)
+            # one tree per invoice: built, hashed, completed with its digest and serialized once
+            file_name_specification, invoice = move._zatca_build_xml(chain, prepared[move.id])
+            invoice_hash, hash_xml = hashing.invoice_hash(invoice, hash_method)
+            signing.sign_invoice(invoice, invoice_hash, signer)
+            chain.last_hash = invoice_hash
+            chain.last_move_id = move
+            yield move, file_name_specification, invoice_hash, hash_xml, ubl.serialize(invoice)
+
+    def _zatca_generate_parallel(self, executor, processes, hash_method, chains, prepared):
+        """Same as ``_zatca_generate_serial``, with the CPU bound work done by a process pool."""
+        entries = []
+        for move in self:
+            chain, signer = move._zatca_chain(chains)
+            file_name_specification, data = move._zatca_build_data(chain, prepared[move.id])
+            entries.append((move, chain, signer, file_name_specification, data))
+        chunksize = pool.chunksize(len(entries), processes)
+
+        rendered = executor.map(pool.render, [(entry[4], hash_method) for entry in entries], chunksize=chunksize)
+        hashes = []
+        for (move, chain, signer, file_name_specification, data), (hash_parts, document_parts) in zip(entries, rendered):
+            # chained in move order, each hash is the PIH of the next invoice
+            invoice_hash, hash_xml = pool.chain_hash(hash_parts, chain.last_hash)
+            hashes.append((signer, chain.last_hash, invoice_hash, hash_xml, document_parts))
+            chain.last_hash = invoice_hash
+            chain.last_move_id = move
+
+        signatures = executor.map(pool.sign, [(entry[2], entry[0].value) for entry in hashes], chunksize=chunksize)
+        for entry, (signer, previous, invoice_hash, hash_xml, document_parts), signature_value in zip(entries, hashes, signatures):
+            ubl_2_1 = pool.complete(document_parts, previous, invoice_hash, signature_value)
+            yield entry[0], entry[3], invoice_hash, hash_xml, ubl_2_1
+
+    def _zatca_store_generated(self, generated):
+        # only the document is stored, the hashed document is derived from it on demand
+        documents = []
+        for move, file_name_specification, invoice_hash, hash_xml, ubl_2_1 in generated:
+            move.zatca_invoice_name = file_name_specification + ".xml"
+            move.zatca_hash_invoice_name = file_name_specification + "_hash.xml"
+            move.zatca_invoice_hash = invoice_hash
+            documents.append((move, ubl_2_1))
+        blobs = self.env['zatca.xml.blob']._store([ubl_2_1 for move, ubl_2_1 in documents])
+        self.browse([move.id for move, ubl_2_1 in documents])._zatca_documents()
+        for move, ubl_2_1 in documents:
+            move.zatca_document_id.invoice_blob_id = blobs[ubl_2_1]
+
+    def _zatca_certificate_values(self):
+        """Return the values of the certificate of the move company, the one of its private key."""
+        value = self.env['zatca.einvoice.configuration']._get_snapshot(self.company_id.id).certificate
+        if not value:
+            raise exceptions.ValidationError('ZATCA certificate is missing in the configuration of %s'
+                                             % self.company_id.name)
+        try:
+            certificate = signing_certificate.load(value)
+        except ValueError as e:
+            raise exceptions.ValidationError('ZATCA certificate in the configuration of %s is invalid: %s'
+                                             % (self.company_id.name, e))
+        return {'certificate': certificate.certificate, 'digest': certificate.digest,
+                'issuer': certificate.issuer, 'serial_number': certificate.serial_number}
+
+    def _zatca_signer(self):
+        value = self.env['zatca.einvoice.configuration']._get_snapshot(self.company_id.id).private_key
+        if not value:
+            raise exceptions.ValidationError('ZATCA private key is missing in the configuration of %s'
+                                             % self.company_id.name)
+        try:
+            return signing.load(value)
+        except (TypeError, ValueError) as e:
+            # TypeError: a key encrypted with a password
+            raise exceptions.ValidationError('ZATCA private key in the configuration of %s is invalid: %s'
+                                             % (self.company_id.name, e))
+
+    def _zatca_build_xml(self, chain, data):
+        """Build the UBL 2.1 document of a single move.
+
+        :param chain: locked ``zatca.invoice.chain`` of the move company, gives PIH and ICV
+        :param data: document data, see ``_zatca_prepare_invoice_data``
+        :return: tuple of the file name specification (without extension) and the root
+                 element of the document, its invoice digest is still empty.
+        """
+        file_name_specification, data = self._zatca_build_data(chain, data)
+        return file_name_specification, ubl.build_invoice(data)
+
+    def _zatca_build_data(self, chain, data):
+        """Return the file name specification and the prepared ``data`` of a move completed with its chain values.
+
+        The invoice counter (KSA-16) is allocated here, the previous invoice hash (KSA-13)
+        is the current chain head.
+        """
+        data['ksa_13'] = chain.last_hash
+        data['ksa_16'] = chain._next_icv()
+        file_name_specification = str(data['seller']['vat']) + "_" + self.datetime_field.strftime('%Y%m%d') + "T" + self.datetime_field.strftime('%H%M%SZ') + "_" + str(self.id)
+        return file_name_specification, data
+
+    def _zatca_prepare_invoice_data(self, certificate, previous_hash=0, metadata=None):
+        """Collect the values of the UBL 2.1 document of a single move, see ``tools.ubl``.
+
+        The chain values, previous invoice hash (KSA-13) and invoice counter (KSA-16),
+        are left to the caller.
+
+        :param metadata: line values of a batch of moves including this one, see
+                         ``_zatca_line_metadata``; by default read for this move only
+        """
+        self.ensure_one()
+        metadata = metadata or self._zatca_line_metadata()
+        invoice_lines = metadata['lines'].get(self.id, [])
+        # first tax of each line, "O" without taxes
+        line_taxes = [metadata['taxes'][tax_ids[0]] if tax_ids else ("O", 0, False, False)
+                      for line_id, quantity, price_unit, discount, tax_ids, product_id in invoice_lines]
         # No longer needed
         # if not previous_hash:
         #     self.create_xml_file(previous_hash=1)
-
-        # STEP # 3 in "5. Signing Process"
-        # in https://zatca.gov.sa/ar/E-Invoicing/Introduction/Guidelines/Documents/E-invoicing%20Detailed%20Technical%20Guidelines.pdf
-        conf = self.env['ir.config_parameter'].sudo()
-        original_certificate = conf.get_param("csr_certificate", '')
-        certificate = original_certificate
-        sha_256_3 = hashlib.sha256(certificate.encode())
-        base_64_3 = base64.b64encode(sha_256_3.hexdigest().encode()).decode('UTF-8')
-        if certificate.find('-----BEGIN CERTIFICATE-----') < 0:
-            for x in range(1, math.ceil(len(certificate) / 64)):
-                certificate = certificate[:64 * x] + '\n' + certificate[64 * x:]
-            certificate = "-----BEGIN CERTIFICATE-----\n" + certificate + "\n-----END CERTIFICATE-----"
-        cert = x509.load_pem_x509_certificate(certificate.encode(), default_backend())
-
-        signature_certificate = '''<ds:Object>
-                                <xades:QualifyingProperties Target="signature" xmlns:xades="http://uri.etsi.org/01903/v1.3.2#">
-                                    <xades:SignedProperties Id="xadesSignedProperties">
-                                        <xades:SignedSignatureProperties>
-                                            <xades:SigningTime>''' + fields.datetime.now().strftime('%Y-%m-%dT%H:%M:%SZ') + '''</xades:SigningTime>
-                                            <xades:SigningCertificate>
-                                                <xades:Cert>
-                                                    <xades:CertDigest>
-                                                        <ds:DigestMethod Algorithm="http://www.w3.org/2001/04/xmlenc#sha256"/>
-                                                        <ds:DigestValue>''' + str(base_64_3) + '''</ds:DigestValue>
-                                                    </xades:CertDigest>
-                                                    <xades:IssuerSerial>
-                                                        <ds:X509IssuerName>''' + str(cert.issuer.rfc4514_string()) + '''</ds:X509IssuerName>
-                                                        <ds:X509SerialNumber>''' + str(cert.serial_number) + '''</ds:X509SerialNumber>
-                                                    </xades:IssuerSerial>
-                                                </xades:Cert>
-                                            </xades:SigningCertificate>
-                                        </xades:SignedSignatureProperties>
-                                    </xades:SignedProperties>
-                                </xades:QualifyingProperties>
-                            </ds:Object>'''
-        # STEP # 5 in "5. Signing Process"
-        # in https://zatca.gov.sa/ar/E-Invoicing/Introduction/Guidelines/Documents/E-invoicing%20Detailed%20Technical%20Guidelines.pdf
-
-        ubl_2_1 = '''
-                <Invoice xmlns="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"
-                 xmlns:cac="urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2"
-                 xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2"
-                 xmlns:ext="urn:oasis:names:specification:ubl:schema:xsd:CommonExtensionComponents-2">
-                <sig:UBLDocumentSignatures xmlns:sac="urn:oasis:names:specification:ubl:schema:xsd:SignatureAggregateComponents-2"
-                                           xmlns:sbc="urn:oasis:names:specification:ubl:schema:xsd:SignatureBasicComponents-2"
-                                           xmlns:sig="urn:oasis:names:specification:ubl:schema:xsd:CommonSignatureComponents-2">
-                    <sac:SignatureInformation>
-                        <cbc:ID>urn:oasis:names:specification:ubl:signature:1</cbc:ID>
-                        <sbc:ReferencedSignatureID>urn:oasis:names:specification:ubl:signature:Invoice</sbc:ReferencedSignatureID>
-                        <ds:Signature Id="signature" xmlns:ds="http://www.w3.org/2000/09/xmldsig#">'''
-        ubl_2_1 += signature_certificate
-        ubl_2_1 += '''  </ds:Signature>
-                    </sac:SignatureInformation>
-                </sig:UBLDocumentSignatures>
-                </Invoice>'''
-
-        # signature_xml = ET.fromstring(signature_certificate)
-        signature_xml = ET.fromstring(ubl_2_1)
-        signature_xml = signature_xml.getroottree()
-        len(base64.b64decode('NGFlMThlNzUxY2FjMzg2NTExZTE0NTkzODg3ZGFmMjA5YzEyMWVhY2ViOTI5ZDA3Mzk1YTM4YjYyZTUwMzE0Mg=='))
-        hash = "4ae18e751cac386511e14593887daf209c121eaceb929d07395a38b62e503142"
-
-        signature = '''      <ds:SignedInfo>
-                                <ds:CanonicalizationMethod Algorithm="http://www.w3.org/2006/12/xml-c14n11"/>
-                                <ds:SignatureMethod Algorithm="http://www.w3.org/2001/04/xmldsig-more#rsa-sha256"/>
-                                <ds:Reference Id="invoiceSignedData" URI="">
-                                    <ds:Transforms>
-                                        <ds:Transform Algorithm="http://www.w3.org/TR/1999/REC-xpath-19991116">
-                                            <ds:XPath>not(//ancestor-or-self::ext:UBLExtensions)</ds:XPath>
-                                        </ds:Transform>
-                                        <ds:Transform Algorithm="http://www.w3.org/TR/1999/REC-xpath-19991116">
-                                            <ds:XPath>not(//ancestor-or-self::cac:Signature)</ds:XPath>
-                                        </ds:Transform>
-                                        <ds:Transform Algorithm="http://www.w3.org/TR/1999/REC-xpath-19991116">
-                                            <ds:XPath>not(//ancestor-or-self::cac:AdditionalDocumentReference[cbc:ID="QR"])</ds:XPath>
-                                        </ds:Transform>
-                                        <ds:Transform Algorithm="http://www.w3.org/2006/12/xml-c14n11"/>
-                                    </ds:Transforms>
-                                    <ds:DigestMethod Algorithm="http://www.w3.org/2001/04/xmlenc#sha256"/>
-                                    <ds:DigestValue>zatca_invoice_hash</ds:DigestValue>
-                                </ds:Reference>
-                                <ds:Reference Type="http://www.w3.org/2000/09/xmldsig#SignatureProperties" URI="#xadesSignedProperties">
-                                    <ds:DigestMethod Algorithm="http://www.w3.org/2001/04/xmlenc#sha256"/>
-                                    <ds:DigestValue>skZ+8g6hyUFzbbTZvJZRyAREMiM=</ds:DigestValue>
-                                </ds:Reference>
-                            </ds:SignedInfo>
-                            <ds:SignatureValue>J3dQSz3nEQd8wagH2CBlip1fj03NTccYAQTGiU/4IhBYzylKxjB09OMBb5vXj2Lv7eXhciRoMmvSF+A9eIUd2a4b5aEm7VBkxIbyGgltNHR8u3oZ7Ee+HNWRAQU+IFCKpZoVA68Bo/g4Gy3pqNQoC7AOghUUXTjvFEBcHVgpt/5wDC8U3PwNfx9hzpU00t/b042GyLECGjPDzr8mGbI09mobT7sSb9oPPzxsC71dph+oU0ug+TAh2NheVih+HWCe870hFJvH3mZ9YcC/lcMXb80Ot+LSjgV8gcTSDz/BaOYLjEGvZrOxmoK2doUZNPi811tbq6nC4jjlrU+NRr5kQA==</ds:SignatureValue>
-                            <ds:KeyInfo>
-                                <ds:X509Data>
-                                    <ds:X509Certificate>''' + str(original_certificate) + '''</ds:X509Certificate>
-                                </ds:X509Data>
-                            </ds:KeyInfo>'''
-        # signature = ''
+        signature = {
+            # digests and signature value are filled in once the invoice hash is known
+            'signature_method': signing.SIGNATURE_METHOD,
+            'invoice_digest': '',
+            'signed_properties_digest': '',
+            'signature_value': '',
+            'certificate': str(certificate['certificate']),
+            'signing_time': fields.datetime.now().strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'certificate_digest': str(certificate['digest']),
+            'issuer': str(certificate['issuer']),
+            'serial_number': str(certificate['serial_number']),
+        }
         # UBL 2.1 sequence
         if self.company_id.currency_id.name != 'SAR':
             # BR-KSA-CL-02
             raise exceptions.ValidationError('currency must be SAR')
-        if len(self.invoice_line_ids.ids) <= 0:
+        if not invoice_lines:
             raise exceptions.MissingError('at least one invoice line is required.')
         if self.datetime_field > fields.Datetime.now():
             raise exceptions.ValidationError('Date should be less then or equal to today.')
@@ -168,7 +447,8 @@ class AccountMove(models.Model):
             raise exceptions.ValidationError('Some Values are missing in Company Address')
 
         bt_3 = '383' if self.debit_origin_id.id else ('381' if self.move_type == 'out_refund' else '388')
-        is_tax_invoice = 0 if 'O' in self.invoice_line_ids.tax_ids.mapped('classified_tax_category') else 1
+        is_tax_invoice = 0 if any(metadata['taxes'][tax_id][0] == 'O' for line in invoice_lines
+                                  for tax_id in line[4]) else 1
 
         if is_tax_invoice and not self.partner_id.district or not self.partner_id.building_no or\
                 not self.partner_id.additional_no or not self.partner_id.city or not self.partner_id.zip or\
@@ -179,40 +459,7 @@ class AccountMove(models.Model):
 
         self.invoice_uuid = self.invoice_uuid if self.invoice_uuid and self.invoice_uuid != '' else str(str(uuid.uuid4()))
 
-        ksa_16 = int(self.env['ir.config_parameter'].sudo().get_param('zatca.icv_counter'))
-        ksa_16 += 1
-        self.env['ir.config_parameter'].sudo().set_param('zatca.icv_counter', str(ksa_16))
-
         company_vat = 0
-        # BR-KSA-26
-        ksa_13 = 0
-        previous_invoice = self.env['account.move']
-        if self.env['account.move'].search([('id', '<', self.id), ('state', '=', 'posted')]).mapped('id'):
-            id = max(self.env['account.move'].search([('id', '<', self.id), ('state', '=', 'posted')]).mapped('id'))
-            previous_invoice = self.env['account.move'].browse(id)
-            if previous_invoice:
-                if not previous_invoice.zatca_invoice_hash:
-
-                    # previous_invoice.hashed_invoice = "NWZlY2ViNjZmZmM4NmYzOGQ5NTI3ODZjNmQ2OTZjNzljMmRiYzIzOWRkNGU5MWI0NjcyOWQ3M2EyN2ZiNTdlOQ=="
-                    previous_invoice.zatca_invoice_hash = "NWZlY2ViNjZmZmM4NmYzOGQ5NTI3ODZjNmQ2OTZjNzljMmRiYzIzOWRkNGU5MWI0NjcyOWQ3M2EyN2ZiNTdlOQ=="
-                    ksa_13 = previous_invoice.zatca_invoice_hash
-                    print(previous_invoice,'previous_invoice')
-                else:
-                    ksa_13 = previous_invoice.zatca_invoice_hash
-                    print('1234')
-            else:
-                ksa_13 = "NWZlY2ViNjZmZmM4NmYzOGQ5NTI3ODZjNmQ2OTZjNzljMmRiYzIzOWRkNGU5MWI0NjcyOWQ3M2EyN2ZiNTdlOQ=="
-                print('123')
-        else:
-            self.zatca_invoice_hash = "NWZlY2ViNjZmZmM4NmYzOGQ5NTI3ODZjNmQ2OTZjNzljMmRiYzIzOWRkNGU5MWI0NjcyOWQ3M2EyN2ZiNTdlOQ=="
-            ksa_13 =self.zatca_invoice_hash
-        # binary_nodes.text = "NWZlY2ViNjZmZmM4NmYzOGQ5NTI3ODZjNmQ2OTZjNzljMmRiYzIzOWRkNGU5MWI0NjcyOWQ3M2EyN2ZiNTdlOQ=="
-        # binary_nodes.text = pih
-
-        # if not self.zatca_invoice_hash:
-        #     self.zatca_invoice_hash =
-        # ksa_13 = base64.b64encode(bytes(hashlib.sha256(str(ksa_13).encode('utf-8')).hexdigest(), encoding='utf-8')).decode('UTF-8')
-        # self.zatca_invoice_hash = ksa_13
         # signature = 0 if is_tax_invoice else 1
         is_third_party_invoice = 0
         is_nominal_invoice = 0
@@ -233,537 +480,168 @@ class AccountMove(models.Model):
             if len(str(self.company_id.vat))[0] != '3' or len(str(self.company_id.vat))[-1] != '3':
                 raise exceptions.ValidationError('Vat must start/end with 3')
 
-        document_level_allowance_charge = 0
-        vat_tax = 0
         bt_31 = self.company_id.vat
-        bg_23_list = {}
         bt_92 = 0  # No document level allowance, in default odoo
-        bt_106 = float(round(Decimal(str(0)), 2))  # Sum of bt-131 Calculated in invoice line loop.
-        bt_107 = float(round(Decimal(str(bt_92)), 2))
-        delivery = 1
-        not_know = 0
         bt_81 = 10 if 'cash' else (30 if 'credit' else (42 if 'bank account' else (48 if 'bank card' else 1)))
         if bt_3 == '388':
             bt_81 = 48
-        accounting_seller_party = 0
         bt_1 = self.id  # may be name is better
-        ubl_2_1 = '''
-        <Invoice xmlns="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"
-                 xmlns:cac="urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2"
-                 xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2"
-                 xmlns:ext="urn:oasis:names:specification:ubl:schema:xsd:CommonExtensionComponents-2">'''
-        # if not ksa_13 and signature:  # need to check this
-        if signature and not previous_hash:
-            ubl_2_1 += '''
-            <ext:UBLExtensions>'''
-            if signature:
-                ubl_2_1 += '''
-                <ext:UBLExtension>
-                    <ext:ExtensionURI>urn:oasis:names:specification:ubl:dsig:enveloped:xades</ext:ExtensionURI>
-                    <ext:ExtensionContent>
-                        <sig:UBLDocumentSignatures xmlns:sac="urn:oasis:names:specification:ubl:schema:xsd:SignatureAggregateComponents-2" 
-                                                   xmlns:sbc="urn:oasis:names:specification:ubl:schema:xsd:SignatureBasicComponents-2"
-                                                   xmlns:sig="urn:oasis:names:specification:ubl:schema:xsd:CommonSignatureComponents-2">
-                            <sac:SignatureInformation>
-                                <cbc:ID>urn:oasis:names:specification:ubl:signature:1</cbc:ID>
-                                <sbc:ReferencedSignatureID>urn:oasis:names:specification:ubl:signature:Invoice</sbc:ReferencedSignatureID>
-                                <ds:Signature Id="signature" xmlns:ds="http://www.w3.org/2000/09/xmldsig#">'''
-                ubl_2_1 += signature
-                ubl_2_1 += signature_certificate
-                ubl_2_1 += '''  </ds:Signature>
-                            </sac:SignatureInformation>
-                        </sig:UBLDocumentSignatures>
-                    </ext:ExtensionContent>
-                </ext:UBLExtension>      '''
-            ubl_2_1 += '''
-            </ext:UBLExtensions>'''
-        if not previous_hash:
-            ubl_2_1 += '''
-                <cbc:UBLVersionID>2.1</cbc:UBLVersionID>'''
-        ubl_2_1 += '''
-            <cbc:ProfileID>reporting:1.0</cbc:ProfileID>
-            <cbc:ID>''' + str(bt_1) + '''</cbc:ID>
-            <cbc:UUID>''' + self.invoice_uuid + '''</cbc:UUID>
-            <cbc:IssueDate>''' + self.datetime_field.strftime('%Y-%m-%d') + '''</cbc:IssueDate>
-            <cbc:IssueTime>''' + self.datetime_field.strftime('%H:%M:%SZ') + '''</cbc:IssueTime>
-            <cbc:DueDate>''' + self.invoice_date_due.strftime('%Y-%m-%d') + '''</cbc:DueDate>
-            <cbc:InvoiceTypeCode name="''' + ksa_2 + '''">''' + bt_3 + '''</cbc:InvoiceTypeCode>
-            <cbc:DocumentCurrencyCode>SAR</cbc:DocumentCurrencyCode>
-            <cbc:TaxCurrencyCode>SAR</cbc:TaxCurrencyCode>'''
-        if self.purchase_id.id:
-            ubl_2_1 += '''
-            <cac:OrderReference>
-                <cbc:ID>''' + str(self.purchase_id) + '''</cbc:ID>
-            </cac:OrderReference>'''
+        data = {
+            'signature': signature if not previous_hash else False,
+            'bt_1': bt_1,
+            'uuid': self.invoice_uuid,
+            'issue_date': self.datetime_field.strftime('%Y-%m-%d'),
+            'issue_time': self.datetime_field.strftime('%H:%M:%SZ'),
+            'due_date': self.invoice_date_due.strftime('%Y-%m-%d'),
+            'ksa_2': ksa_2,
+            'bt_3': bt_3,
+            'order_reference': str(self.purchase_id) if self.purchase_id.id else False,
+            'billing_references': [],
+            'qr': str(self.decoded_data),
+        }
         if bt_3 != '388':  # BR-KSA-56
-            bt_25 = str(self.ref.replace('Reversal of: ', '')[0: self.ref.replace('Reversal of: ', '').find(',')])
-            bt_25 = self.env['account.move'].search([('name', '=', bt_25)])
-            ubl_2_1 += '''
-            <cac:BillingReference>
-                <cac:InvoiceDocumentReference>
-                    <cbc:ID>''' + str(bt_25.id) + '''</cbc:ID>
-                    <cbc:IssueDate>''' + str(bt_25.datetime_field.strftime('%Y-%m-%d')) + '''</cbc:IssueDate>
-                </cac:InvoiceDocumentReference>
-            </cac:BillingReference>'''
-        ubl_2_1 += '''
-            <cac:AdditionalDocumentReference>
-                <cbc:ID>ICV</cbc:ID>
-                <cbc:UUID>''' + str(ksa_16) + '''</cbc:UUID>
-            </cac:AdditionalDocumentReference>
-            <cac:AdditionalDocumentReference>
-                <cbc:ID>PIH</cbc:ID>
-                <cac:Attachment>
-                    <cbc:EmbeddedDocumentBinaryObject mimeCode="text/plain">''' + str(ksa_13) + '''</cbc:EmbeddedDocumentBinaryObject>
-                </cac:Attachment>
-            </cac:AdditionalDocumentReference>'''
-        # <cbc:EmbeddedDocumentBinaryObject mimeCode="text/plain">''' + str(self.l10n_sa_qr_code_str) + '''</cbc:EmbeddedDocumentBinaryObject>
-
-        if not previous_hash:
-            ubl_2_1 += '''<cac:AdditionalDocumentReference>
-                <cbc:ID>QR</cbc:ID>
-                <cac:Attachment>
-                    <cbc:EmbeddedDocumentBinaryObject mimeCode="text/plain">''' + str(self.decoded_data) + '''</cbc:EmbeddedDocumentBinaryObject>
-                </cac:Attachment>
-            </cac:AdditionalDocumentReference>'''
-        if not previous_hash:
-            if signature:  # BR-KSA-60
-                ubl_2_1 += '''
-            <cac:Signature>
-                <cbc:ID>urn:oasis:names:specification:ubl:signature:Invoice</cbc:ID>
-                <cbc:SignatureMethod>urn:oasis:names:specification:ubl:dsig:enveloped:xades</cbc:SignatureMethod>
-            </cac:Signature>'''
-        ubl_2_1 += '''
-            <cac:AccountingSupplierParty>
-                <cac:Party>'''
-        ubl_2_1 += '''
-                    <cac:PartyIdentification>
-                        <cbc:ID schemeID="''' + self.company_id.license + '''">''' + self.company_id.license_no + '''</cbc:ID>
-                    </cac:PartyIdentification>
-                    <cac:PostalAddress>
-                        <cbc:StreetName>''' + self.company_id.street + '''</cbc:StreetName>'''
-        if self.company_id.street2:
-            ubl_2_1 += '''
-                        <cbc:AdditionalStreetName>''' + self.company_id.street2 + '''</cbc:AdditionalStreetName>'''
+            data['billing_references'] = metadata['references'].get(self.id, [])
+
         if len(str(self.company_id.additional_no)) != 4:
             raise exceptions.ValidationError('Company/Seller Additional Number must be exactly 4 digits')
         if len(str(self.company_id.zip)) != 5:
             raise exceptions.ValidationError('Company/Seller PostalZone/Zip must be exactly 5 digits')
-        ubl_2_1 += '''  <cbc:BuildingNumber>''' + str(self.company_id.building_no) + '''</cbc:BuildingNumber>
-                        <cbc:PlotIdentification>''' + str(self.company_id.additional_no) + '''</cbc:PlotIdentification>
-                        <cbc:CitySubdivisionName>''' + self.company_id.district + '''</cbc:CitySubdivisionName>
-                        <cbc:CityName>''' + self.company_id.city + '''</cbc:CityName>
-                        <cbc:PostalZone>''' + str(self.company_id.zip) + '''</cbc:PostalZone>
-                        <cbc:CountrySubentity>''' + self.company_id.state_id.name + '''</cbc:CountrySubentity>
-                        <cac:Country>
-                            <cbc:IdentificationCode>''' + self.company_id.country_id.code + '''</cbc:IdentificationCode>
-                        </cac:Country>
-                    </cac:PostalAddress>
-                    <cac:PartyTaxScheme>
-                        <cbc:CompanyID>''' + bt_31 + '''</cbc:CompanyID>
-                        <cac:TaxScheme>
-                            <cbc:ID>VAT</cbc:ID>
-                        </cac:TaxScheme>
-                    </cac:PartyTaxScheme>
-                    <cac:PartyLegalEntity>
-                        <cbc:RegistrationName>''' + self.company_id.name + '''</cbc:RegistrationName>
-                    </cac:PartyLegalEntity>
-                </cac:Party>
-            </cac:AccountingSupplierParty>
-            <cac:AccountingCustomerParty>
-                <cac:Party>
-                    <cac:PartyIdentification>
-                        <cbc:ID schemeID="''' + self.partner_id.buyer_identification + '''">''' + self.partner_id.buyer_identification_no + '''</cbc:ID>
-                    </cac:PartyIdentification>'''
+        data['seller'] = {
+            'identification': self.company_id.license,
+            'identification_no': self.company_id.license_no,
+            'address': {
+                'street': self.company_id.street,
+                'street2': self.company_id.street2,
+                'building_no': str(self.company_id.building_no),
+                'additional_no': str(self.company_id.additional_no),
+                'district': self.company_id.district,
+                'city': self.company_id.city,
+                'zip': str(self.company_id.zip),
+                'state': self.company_id.state_id.name,
+                'country': self.company_id.country_id.code,
+            },
+            'tax_scheme': True,
+            'vat': bt_31,
+            'registration_name': self.company_id.name,
+        }
+        data['buyer'] = {
+            'identification': self.partner_id.buyer_identification,
+            'identification_no': self.partner_id.buyer_identification_no,
+        }
         if is_tax_invoice:  # Not applicable for simplified tax invoices and associated credit notes and debit notes
-            ubl_2_1 += '''
-                    <cac:PostalAddress>
-                        <cbc:StreetName>''' + self.partner_id.street + '''</cbc:StreetName>'''
-            if self.partner_id.street2:
-                ubl_2_1 += '''
-                        <cbc:AdditionalStreetName>''' + self.partner_id.street2 + '''</cbc:AdditionalStreetName>'''
-            ubl_2_1 += '''
-                        <cbc:BuildingNumber>''' + str(self.partner_id.building_no) + '''</cbc:BuildingNumber>'''
-            if self.partner_id.additional_no:
-                ubl_2_1 += '''
-                        <cbc:PlotIdentification>''' + str(self.partner_id.additional_no) + '''</cbc:PlotIdentification>'''
-            ubl_2_1 += '''
-                        <cbc:CitySubdivisionName>''' + self.partner_id.district + '''</cbc:CitySubdivisionName>
-                        <cbc:CityName>''' + self.partner_id.city + '''</cbc:CityName>
-                        <cbc:PostalZone>''' + str(self.partner_id.zip) + '''</cbc:PostalZone>
-                        <cbc:CountrySubentity>''' + self.partner_id.state_id.name + '''</cbc:CountrySubentity>
-                        <cac:Country>
-                            <cbc:IdentificationCode>''' + self.partner_id.country_id.code + '''</cbc:IdentificationCode>
-                        </cac:Country>
-                    </cac:PostalAddress>
-                    <cac:PartyTaxScheme>'''
-            if self.partner_id.vat and not is_exports_invoice:  # BR-KSA-46
-                ubl_2_1 += '''
-                        <cbc:CompanyID>''' + self.partner_id.vat + '''</cbc:CompanyID>'''
-            ubl_2_1 += '''
-                        <cac:TaxScheme>
-                            <cbc:ID>VAT</cbc:ID>
-                        </cac:TaxScheme>
-                    </cac:PartyTaxScheme>'''
+            data['buyer'].update({
+                'address': {
+                    'street': self.partner_id.street,
+                    'street2': self.partner_id.street2,
+                    'building_no': str(self.partner_id.building_no),
+                    'additional_no': self.partner_id.additional_no and str(self.partner_id.additional_no),
+                    'district': self.partner_id.district,
+                    'city': self.partner_id.city,
+                    'zip': str(self.partner_id.zip),
+                    'state': self.partner_id.state_id.name,
+                    'country': self.partner_id.country_id.code,
+                },
+                'tax_scheme': True,
+                # BR-KSA-46
+                'vat': self.partner_id.vat if not is_exports_invoice else False,
+            })
         bt_121 = 0  # in ['VATEX-SA-EDU', 'VATEX-SA-HEA']
         # BR-KSA-25 and BR-KSA-42
         if is_tax_invoice or ((not is_tax_invoice or ksa_2) and bt_121) or \
                 (not is_tax_invoice and is_summary_invoice):
-            ubl_2_1 += '''
-                    <cac:PartyLegalEntity>
-                        <cbc:RegistrationName>''' + self.partner_id.name + '''</cbc:RegistrationName>
-                    </cac:PartyLegalEntity>'''
+            data['buyer']['registration_name'] = self.partner_id.name
         if bt_121 in ['VATEX-SA-EDU', 'VATEX-SA-HEA'] and self.partner_id.buyer_identification != 'NAT':  #BR-KSA-49
             message = "As tax exemption reason code is in 'VATEX-SA-EDU', 'VATEX-SA-HEA'"
             message += " then Buyer Identification must be 'NAT'"
             raise exceptions.ValidationError(message)
-        ubl_2_1 += '''
-                </cac:Party>
-            </cac:AccountingCustomerParty>'''
-        latest_delivery_date = 1 if not is_tax_invoice and is_summary_invoice else 0
-        if delivery and ((bt_3 == '388' and ksa_2[:2] == '01' or not is_tax_invoice and is_summary_invoice) or (latest_delivery_date and not_know)):
-            ubl_2_1 += '''
-            <cac:Delivery>'''
+        if bt_3 == '388' and ksa_2[:2] == '01' or not is_tax_invoice and is_summary_invoice:
             ksa_5 = self.l10n_sa_delivery_date
-            if bt_3 == '388' and ksa_2[:2] == '01' or not is_tax_invoice and is_summary_invoice:
-                ubl_2_1 += '''
-                <cbc:ActualDeliveryDate>''' + str(ksa_5.strftime('%Y-%m-%d')) + '''</cbc:ActualDeliveryDate>'''
-            if latest_delivery_date and not_know:
-                ksa_24 = self.l10n_sa_delivery_date
-                if ksa_24 < ksa_5:
-                    raise exceptions.ValidationError('LatestDeliveryDate must be less then or equal to ActualDeliveryDate')
-                ubl_2_1 += '''
-                <cbc:LatestDeliveryDate> ''' + str(ksa_24.strftime('%Y-%m-%d')) + ''' </cbc:LatestDeliveryDate> '''
-            if not_know:
-                ubl_2_1 += '''
-                <cac:DeliveryLocation>
-                    <cac:Address>
-                        <cac:Country>
-                            <cbc:IdentificationCode>''' + "" + '''</cbc:IdentificationCode>
-                        </cac:Country>
-                    </cac:Address>
-                </cac:DeliveryLocation'''
-            ubl_2_1 += '''
-            </cac:Delivery>'''
+            data['delivery_date'] = str(ksa_5.strftime('%Y-%m-%d'))
         if is_tax_invoice or bt_3 != '388':
-            ubl_2_1 += '''<cac:PaymentMeans>'''
-            if is_tax_invoice:
-                ubl_2_1 += '''
-                <cbc:PaymentMeansCode>''' + str(bt_81) + '''</cbc:PaymentMeansCode>'''
-            if bt_3 != '388':
-                ubl_2_1 += '''
-                <cbc:InstructionNote>''' + str(self.credit_debit_reason) + '''</cbc:InstructionNote>'''
-            ubl_2_1 += '''
-            </cac:PaymentMeans>'''
-        if document_level_allowance_charge:
-            bt_96 = float(round(Decimal(str(0)), 2))
-            bt_96 = 100 if bt_96 > 100 else (0 if bt_96 < 0 else bt_96)
-            ubl_2_1 += '''
-            <cac:AllowanceCharge>
-                <cbc:ChargeIndicator>false</cbc:ChargeIndicator>
-                <cbc:AllowanceChargeReason>Discount</cbc:AllowanceChargeReason>
-                <cbc:Amount currencyID="SAR">''' + str(bt_92) + '''</cbc:Amount>
-                <cbc:BaseAmount currencyID="SAR">''' + str(bt_92) + '''</cbc:BaseAmount>
-                <cac:TaxCategory>
-                    <cbc:ID>''' + "0" + '''</cbc:ID>
-                    <cbc:Percent>''' + str(bt_96) + '''</cbc:Percent>
-                    <cac:TaxScheme>
-                        <cbc:ID>''' + "0" + '''</cbc:ID>
-                    </cac:TaxScheme>
-                </cac:TaxCategory>
-            </cac:AllowanceCharge>'''
-        invoice_line_xml = ''
-        for invoice_line_id in self.invoice_line_ids:
-            if invoice_line_id.discount:
-                bt_137 = float(round(Decimal(str(invoice_line_id.price_unit * invoice_line_id.quantity)), 2))
-                bt_138 = invoice_line_id.discount  # BR-KSA-DEC-01 for BT-138 only done
-                bt_136 = float(round(Decimal(str(bt_137 * bt_138 / 100)), 2))
-            else:
-                bt_136 = float(round(Decimal(str(0)), 2))
-                bt_137 = float(round(Decimal(str(0)), 2))
-                bt_138 = invoice_line_id.discount  # BR-KSA-DEC-01 for BT-138 only done
-            bt_129 = invoice_line_id.quantity
-            bt_147 = 0  # NO ITEM PRICE DISCOUNT bt_148 * invoice_line_id.discount/100 if invoice_line_id.discount else 0
-            bt_148 = invoice_line_id.price_unit
-            bt_146 = bt_148 - bt_147
-            bt_149 = 1  # ??
-            bt_131 = float(round(Decimal(str(((bt_146 / bt_149) * bt_129))), 2))
-            bt_131 -= float(round(Decimal(str(bt_136)), 2))
-            bt_131 = float(round(Decimal(str(bt_131)), 2))
-            bt_106 += float(round(Decimal(str(bt_131)), 2))
-            bt_106 = float(round(Decimal(str(bt_106)), 2))
-            bt_151 = invoice_line_id.tax_ids.classified_tax_category if invoice_line_id.tax_ids else "O"
-            bt_152 = float(round(Decimal(str(invoice_line_id.tax_ids.amount)), 2)) if invoice_line_id.tax_ids else 0
-            bt_152 = 100 if bt_152 > 100 else (0 if bt_152 < 0 else bt_152)
-
-            if bt_151 == "Z":
-                bt_152 = 0
-                if not bg_23_list.get("Z", False):
-                    bg_23_list["Z"] = {'bt_116': 0, 'bt_121': invoice_line_id.tax_ids.tax_exemption_code,
-                                       'bt_120': invoice_line_id.tax_ids.tax_exemption_text,
-                                       'bt_119': bt_152, 'bt_117': 0}
-                bg_23_list["Z"]['bt_116'] += bt_131
-                # bg_23_list = ["Z"]  # BR-Z-01
-            elif bt_151 == "E":
-                bt_152 = 0
-                if not bg_23_list.get("E", False):
-                    bg_23_list["E"] = {'bt_116': 0, 'bt_121': invoice_line_id.tax_ids.tax_exemption_code,
-                                       'bt_120': invoice_line_id.tax_ids.tax_exemption_text,
-                                       'bt_119': bt_152, 'bt_117': 0}
-                bg_23_list["E"]['bt_116'] += bt_131
-                # bg_23_list = ["E"]  # BR-E-01
-            elif bt_151 == "S":
-                if not bg_23_list.get("S", False):
-                    bg_23_list["S"] = {'bt_116': 0, 'bt_119': bt_152, 'bt_117': 0}
-                bg_23_list["S"]['bt_116'] += bt_131
-                # bg_23_list = ["E"]  # BR-S-09
-            elif bt_151 == "O":
-                bt_152 = 0
-                if not bg_23_list.get("O", False):
-                    bg_23_list["O"] = {'bt_116': 0, 'bt_121': 'Not subject to VAT',
-                                       'bt_120': 'Not subject to VAT', 'bt_119': 0, 'bt_117': 0}
-                bg_23_list["O"]['bt_116'] += bt_131
-                # bg_23_list = ["O"]  # BR-O-01
-
-            invoice_line_xml += '''
-            <cac:InvoiceLine>
-                <cbc:ID>''' + str(invoice_line_id.id) + '''</cbc:ID>
-                <cbc:InvoicedQuantity unitCode="PCE">''' + str(bt_129) + '''</cbc:InvoicedQuantity>
-                <cbc:LineExtensionAmount currencyID="SAR">''' + str(bt_131) + '''</cbc:LineExtensionAmount>'''
-            if invoice_line_id.discount: #line_allowance_charge:
-                invoice_line_xml += '''
-                <cac:AllowanceCharge>
-                    <cbc:ChargeIndicator>false</cbc:ChargeIndicator>
-                    <cbc:AllowanceChargeReasonCode>95</cbc:AllowanceChargeReasonCode>
-                    <cbc:AllowanceChargeReason>Discount</cbc:AllowanceChargeReason>'''
-                # invoice_line_xml += '''
-                #     <cbc:MultiplierFactorNumeric>''' + str(bt_138) + '''</cbc:MultiplierFactorNumeric>'''
-                invoice_line_xml += '''
-                    <cbc:Amount currencyID="SAR">''' + str(bt_136) + '''</cbc:Amount>'''
-                # invoice_line_xml += '''
-                #     <cbc:BaseAmount currencyID="SAR">''' + str(bt_137) + '''</cbc:BaseAmount>'''
-                if bt_151 != 'O':
-                    invoice_line_xml += '''
-                        <cac:TaxCategory>
-                            <cbc:ID>S</cbc:ID>
-                            <cbc:Percent>15</cbc:Percent>
-                            <cac:TaxScheme>
-                                <cbc:ID>VAT</cbc:ID>
-                            </cac:TaxScheme>
-                        </cac:TaxCategory>'''
-                invoice_line_xml += '''
-                    </cac:AllowanceCharge>'''
-            ksa_11 = float(round(Decimal(str(bt_131 * bt_152/100)), 2))  #BR-KSA-50
-            ksa_12 = float(round(Decimal(str(bt_131 + ksa_11)), 2))  # BR-KSA-51
-            if is_tax_invoice:
-                invoice_line_xml += '''
-                <cac:TaxTotal>'''
-                if is_tax_invoice:  #BR-KSA-52 and BR-KSA-53
-                    invoice_line_xml += '''
-                    <cbc:TaxAmount currencyID="SAR">''' + str(ksa_11) + '''</cbc:TaxAmount>
-                    <cbc:RoundingAmount currencyID="SAR">''' + str(ksa_12) + '''</cbc:RoundingAmount>'''
-                invoice_line_xml += '''
-                </cac:TaxTotal>'''
-            invoice_line_xml += '''
-                <cac:Item>
-                    <cbc:Name>''' + str(invoice_line_id.product_id.name) + '''</cbc:Name>'''
-            if invoice_line_id.product_id.barcode and invoice_line_id.product_id.code_type:
-                invoice_line_xml += '''
-                    <cac:StandardItemIdentification>
-                        <cbc:ID schemeID="''' + str(invoice_line_id.product_id.code_type) + '''">''' + str(invoice_line_id.product_id.barcode) + '''</cbc:ID>
-                    </cac:StandardItemIdentification>'''
-            invoice_line_xml += '''
-                    <cac:ClassifiedTaxCategory>
-                        <cbc:ID>''' + str(bt_151) + '''</cbc:ID>'''
-            if bt_151 != 'O':
-                invoice_line_xml += '''
-                        <cbc:Percent>''' + str(bt_152) + '''</cbc:Percent>'''
-            invoice_line_xml += '''
-                        <cac:TaxScheme>
-                            <cbc:ID>VAT</cbc:ID>
-                        </cac:TaxScheme>
-                    </cac:ClassifiedTaxCategory>
-                </cac:Item>
-                <cac:Price>
-                    <cbc:PriceAmount currencyID="SAR">''' + str(bt_146) + '''</cbc:PriceAmount>
-                    <cbc:BaseQuantity unitCode="PCE">''' + str(bt_149) + '''</cbc:BaseQuantity>
-                </cac:Price>
-            </cac:InvoiceLine>'''
-        bt_110 = float(round(Decimal(str(0)), 2))  # Sum of bt-117 Calculated in bg_23 loop
-        tax_subtotal_xml = ''
-        for bg_23 in bg_23_list.keys():
-            bt_116 = float(round(Decimal(str(bg_23_list[bg_23]['bt_116'])), 2))
-            bt_119 = bg_23_list[bg_23]['bt_119']
-            bt_118 = bg_23
-            if bt_118 == "S":
-                bt_117 = float(round(Decimal(str(bt_116 * (bt_119 / 100))), 2))
-                bt_110 += bt_117
+            data['payment_means'] = {
+                'code': str(bt_81) if is_tax_invoice else False,
+                'instruction_note': str(self.credit_debit_reason) if bt_3 != '388' else False,
+            }
+
+        bt_149 = 1  # ??
+        bt_147 = 0  # NO ITEM PRICE DISCOUNT bt_148 * invoice_line_id.discount/100 if invoice_line_id.discount else 0
+        amounts = totals.compute(
+            [line[1] for line in invoice_lines],
+            [line[2] - bt_147 for line in invoice_lines],  # BT-146
+            [line[3] for line in invoice_lines],  # BR-KSA-DEC-01 for BT-138 only done
+            [tax[0] for tax in line_taxes],  # BT-151
+            [tax[1] for tax in line_taxes],  # BT-152
+            allowance=money.to_halalas(bt_92),
+            prepaid=money.to_halalas(self.amount_total) - money.to_halalas(self.amount_residual),
+        )
+
+        lines = []
+        products = metadata['products']
+        for (line_id, quantity, price_unit, discount, tax_ids, product_id), tax, line_amounts in zip(
+                invoice_lines, line_taxes, amounts.lines):
+            name, item_identification = products[product_id]
+            lines.append({
+                'id': line_id,
+                'bt_129': money.plain(quantity),
+                'bt_131': money.format(line_amounts.bt_131),
+                'bt_136': money.format(line_amounts.bt_136) if discount else None,
+                'tax_total': is_tax_invoice,
+                'ksa_11': money.format(line_amounts.ksa_11),
+                'ksa_12': money.format(line_amounts.ksa_12),
+                'name': name,
+                'item_identification': item_identification,
+                'bt_151': tax[0],
+                'bt_152': money.format(line_amounts.bt_152),
+                'bt_146': money.plain(price_unit - bt_147),
+                'bt_149': money.plain(bt_149),
+            })
+        data['lines'] = lines
+
+        tax_subtotals = []
+        for subtotal in amounts.subtotals:
+            if subtotal.bt_118 == "O":  # BR-O-01
+                exemption = ('Not subject to VAT', 'Not subject to VAT')
+            elif subtotal.bt_118 in ("Z", "E"):  # BR-Z-01, BR-E-01
+                exemption = line_taxes[subtotal.line][2:]
             else:
-                bt_117 = float(round(Decimal(str(0)), 2))
-            tax_subtotal_xml += '''
-            <cac:TaxSubtotal>
-                <cbc:TaxableAmount currencyID="SAR">''' + str(bt_116) + '''</cbc:TaxableAmount>
-                <cbc:TaxAmount currencyID="SAR">''' + str(bt_117) + '''</cbc:TaxAmount>
-                <cac:TaxCategory>
-                    <cbc:ID>''' + str(bt_118) + '''</cbc:ID>'''
-            if bt_118 != "O":
-                tax_subtotal_xml += '''
-                    <cbc:Percent>''' + str(bt_119) + '''</cbc:Percent>'''
-            if bt_118 != "S" and bt_118 in ['E', 'O', 'Z']:
-                bt_120 = bg_23_list[bg_23]['bt_120']
-                bt_121 = bg_23_list[bg_23]['bt_121']
-                tax_subtotal_xml += '''
-                    <cbc:TaxExemptionReasonCode>''' + str(bt_121) + '''</cbc:TaxExemptionReasonCode>
-                    <cbc:TaxExemptionReason>''' + str(bt_120) + '''</cbc:TaxExemptionReason>'''
-            tax_subtotal_xml += '''
-                    <cac:TaxScheme>
-                        <cbc:ID>VAT</cbc:ID>
-                    </cac:TaxScheme>
-                </cac:TaxCategory>
-            </cac:TaxSubtotal>'''
-        bt_109 = float(round(Decimal(str(bt_106 - bt_107)), 2))
-        bt_111 = bt_110  # Same as bt-110
-        bt_112 = float(round(Decimal(str(bt_109 + bt_110)), 2))
-        bt_113 = float(round(Decimal(str(self.amount_total - self.amount_residual)), 2))
-        bt_115 = float(round(Decimal(str(bt_112 - bt_113)), 2))
-        ubl_2_1 += '''
-            <cac:TaxTotal>
-                <cbc:TaxAmount currencyID="SAR">''' + str(bt_110) + '''</cbc:TaxAmount>'''
-        ubl_2_1 += tax_subtotal_xml
-        ubl_2_1 += '''
-            </cac:TaxTotal>
-            <cac:TaxTotal>
-                <cbc:TaxAmount currencyID="SAR">''' + str(bt_111) + '''</cbc:TaxAmount>
-            </cac:TaxTotal>'''
-        ubl_2_1 += '''
-            <cac:LegalMonetaryTotal>
-                <cbc:LineExtensionAmount currencyID="SAR">''' + str(bt_106) + '''</cbc:LineExtensionAmount>
-                <cbc:TaxExclusiveAmount currencyID="SAR">''' + str(bt_109) + (" | " + str(self.amount_untaxed) if amount_verification else '') +'''</cbc:TaxExclusiveAmount>
-                <cbc:TaxInclusiveAmount currencyID="SAR">''' + str(bt_112) + (" | " + str(self.amount_total) if amount_verification else '') + '''</cbc:TaxInclusiveAmount>'''
-        if not_know:
-            ubl_2_1 += '''
-                <cbc:ChargeTotalAmount currencyID="SAR">''' + str("0") + '''</cbc:ChargeTotalAmount>'''
-        if bt_113:
-            ubl_2_1 += '''
-                <cbc:PrepaidAmount currencyID="SAR">''' + str(bt_113) + '''</cbc:PrepaidAmount>'''
-        if not_know:
-            ubl_2_1 += '''
-                <cbc:PayableRoundingAmount currencyID="SAR">''' + str("0") + '''</cbc:PayableRoundingAmount>'''
-        ubl_2_1 += '''
-                <cbc:PayableAmount currencyID="SAR">''' + str(bt_115 if bt_115 > 0 else 0) + (" | " + str(self.amount_residual) if amount_verification else '') + '''</cbc:PayableAmount>
-            </cac:LegalMonetaryTotal>'''
-        ubl_2_1 += invoice_line_xml
-        ubl_2_1 += '''
-        </Invoice>'''
-
-        file_name_specification = str(bt_31) + "_" + self.datetime_field.strftime('%Y%m%d') + "T" + self.datetime_field.strftime('%H%M%SZ') + "_" + str(self.id)
-        self.zatca_invoice_name = file_name_specification + ".xml"
-        self.hash_with_c14n_canonicalization(xml=ubl_2_1)
-        # zatca_invoice_hash
-        ubl_2_1 = ubl_2_1.replace('zatca_invoice_hash', str(self.zatca_invoice_hash))
-
-        atts = self.env['ir.attachment'].sudo().search([('res_model', '=', 'account.move'), ('res_field', '=', 'zatca_invoice'),
-                                                        ('res_id', 'in', self.ids)])
-        # self.xml_sign_char_data = ubl_2_1
-        self.xml_sign_char_data = ubl_2_1
-        if atts:
-            atts.sudo().write({'datas': base64.b64encode(bytes(ubl_2_1, 'utf-8'))})
-        else:
-            atts.sudo().create([{
-                'name': file_name_specification + ".xml",
-                'res_model': 'account.move',
-                'res_field': 'zatca_invoice',
-                'res_id': self.id,
-                'type': 'binary',
-                'datas': base64.b64encode(bytes(ubl_2_1, 'utf-8')),
-                'mimetype': 'text/xml',
-                # 'datas_fname': file_name_specification + ".xml"
-            }])
-        print("ZATCA: xml invoice & hash invoice generated.")
-
-    def generate_signature(self):
-        # STEP # 1 => DONE  => NOT NEEDED, DONE ABOVE
-        # STEP # 2
-        # hash = xQ93zdUB9jwWLb7Oy1uPeKKAlmkaGfZHmEOWU7xvHvE=
-        f = open('zatcaprivatekey.pem', 'r')
-        private_key = f.read()
-        digital_signature = '?'
-        # STEP # 3 => DONE  => NOT NEEDED, DONE ABOVE
-        # STEP # 4 => DONE  => NOT NEEDED, DONE ABOVE
-        # STEP # 5
-        # STEP # 6 => Partially DONE
+                exemption = (None, None)
+            tax_subtotals.append({'bt_116': money.format(subtotal.bt_116), 'bt_117': money.format(subtotal.bt_117),
+                                  'bt_118': subtotal.bt_118, 'bt_119': money.format(subtotal.bt_119),
+                                  'bt_120': exemption[1], 'bt_121': exemption[0]})
+        data['tax_subtotals'] = tax_subtotals
+        data.update({
+            'bt_106': money.format(amounts.bt_106),
+            'bt_109': money.format(amounts.bt_109),
+            'bt_110': money.format(amounts.bt_110),
+            'bt_111': money.format(amounts.bt_110),  # Same as bt-110
+            'bt_112': money.format(amounts.bt_112),
+            'bt_113': money.format(amounts.bt_113) if amounts.bt_113 else False,
+            'bt_115': money.format(max(amounts.bt_115, 0)),
+        })
+        return data
 
     def compliance_invoices_api(self):
         # link = "https://gw-apic-gov.gazt.gov.sa/e-invoicing/developer-portal"
         # endpoint = '/compliance/invoices'
+        return self._zatca_submit('compliance')
 
-        link = self.env['zatca.einvoice.configuration'].search([('company_id','=',self.env.user.company_id.id)]).compliance_url
-
-        conf = self.env['ir.config_parameter'].sudo()
+    def invoices_clearance_single_api(self):
+        # link = "https://gw-apic-gov.gazt.gov.sa/e-invoicing/developer-portal"
+        # endpoint = '/invoices/clearance/single'
+        return self._zatca_submit('clearance')
 
-        user = conf.get_param("zatca_sb_bsToken", False)
-        password = conf.get_param("zatca_sb_secret", False)
-        auth = base64.b64encode(('%s:%s' % (user, password)).encode('utf-8')).decode('utf-8')
-        headers = {'accept': 'application/json',
-                   'Accept-Language': 'en',
-                   'Accept-Version': 'V2',
-                   'Authorization': 'Basic ' + auth,
-                   'Content-Type': 'application/json'}
+    def invoices_reporting_single_api(self):
+        # link = "https://gw-apic-gov.gazt.gov.sa/e-invoicing/developer-portal"
+        # endpoint = '/invoices/reporting/single'
+        return self._zatca_submit('reporting')
 
-        data = {
-            'invoiceHash': self.zatca_invoice_hash,
-            # 'invoiceHash': self.hash_with_c14n_canonicalization(api_invoice=1),
-            'uuid': self.invoice_uuid,
-            'invoice': self.zatca_invoice.decode('UTF-8'),
-        }
+    def _zatca_submit(self, kind):
+        """Submit the generated invoice to ZATCA right away and show the validation results."""
+        self.ensure_one()
+        link, headers, data = self._zatca_api_request(kind)
         try:
-            # req = requests.post(link + endpoint, headers=headers, data=json.dumps(data))
-            req = requests.post(link, headers=headers, data=json.dumps(data))
-            if req.status_code == 500:
-                raise exceptions.AccessError('Invalid Request, \ncontact system administer')
-            elif req.status_code == 401:
-                raise exceptions.AccessError('Unauthorized Request, \nUpdate configuration for sandbox')
-            elif req.status_code in [200, 400]:
-                response = json.loads(req.text)
-                string = "<table style='width:100%'>"
-                string += "<tr><td  colspan='6'><b>validationResults</b></td></tr>"
-
-                for key, value in response['validationResults'].items():
-                    if type(value) == list:
-                        string += "<tr><td  colspan='6'><center><b>" + key + "</b></center></td></tr>"
-                        qty = 1
-                        for val in value:
-                            color = 'green' if str(val['status']).lower() == 'pass' else 'red'
-                            string += "<tr>"
-                            string += "<td colspan='2' style='border: 1px solid black;'>" + str(qty) + "</td>"
-                            string += "<td  style='border: 1px solid black;'><b>" + 'type' + "</b></td>"
-                            string += "<td  style='border: 1px solid black;'><b>" + 'code' + "</b></td>"
-                            string += "<td  style='border: 1px solid black;'><b>" + 'category' + "</b></td>"
-                            string += "<td  style='border: 1px solid black;'><b>" + 'status' + "</b></td>"
-                            string += "</tr>"
-                            string += "<tr>"
-                            string += "<td  style='border: 1px solid black;' colspan='2'></td>"
-                            string += "<td  style='border: 1px solid black;color: " + color + ";'>" + str(val['type']) + "</td>"
-                            string += "<td  style='border: 1px solid black;color: " + color + ";'>" + str(val['code']) + "</td>"
-                            string += "<td  style='border: 1px solid black;color: " + color + ";'>" + str(val['category']) + "</td>"
-                            string += "<td  style='border: 1px solid black;color: " + color + ";'>" + str(val['status']) + "</td>"
-                            string += "</tr>"
-                            string += "<tr>"
-                            string += "<td colspan='2'  style='border: 1px solid black;'><b>" + 'message' + "</b></td>"
-                            string += "<td colspan='4'  style='border: 1px solid black;color: " + color + ";'>" + str(val['message']) + "</td>"
-                            string += "</tr>"
-                            qty += 1
-                    else:
-                        string += "<tr>"
-                        string += "<td>" + key + "</td><td colspan='3'>" + str(value) + "</td>"
-                        string += "</tr>"
-                string += "<tr><td colspan='2'><b>reportingStatus</b></td><td colspan='4'>" + str(response['reportingStatus']) + "</td></tr>"
-                string += "<tr><td colspan='2'><b>clearanceStatus</b></td><td colspan='4'>" + str(response['clearanceStatus']) + "</td></tr>"
-                string += "<tr><td colspan='2'><b>qrSellertStatus</b></td><td colspan='4'>" + str(response['qrSellertStatus']) + "</td></tr>"
-                string += "<tr><td colspan='2'><b>qrBuyertStatus </b></td><td colspan='4'>" + str(response['qrBuyertStatus'])+ "</td></tr>"
-                string += "</table>"
-
-                json_iterated = string
-                self.zatca_compliance_invoices_api = json_iterated
+            req = client.post(link, headers, data, **self.env['zatca.einvoice.configuration']._http_options())
+            self._zatca_api_response(kind, req.status_code, req.text)
             return {
                 'type': 'ir.actions.act_window',
                 'name': "acv",
@@ -775,240 +653,223 @@ class AccountMove(models.Model):
         except Exception as e:
             raise exceptions.AccessDenied(e)
 
-    def invoices_clearance_single_api(self):
-        # link = "https://gw-apic-gov.gazt.gov.sa/e-invoicing/developer-portal"
-        # endpoint = '/invoices/clearance/single'
-
-        link = self.env['zatca.einvoice.configuration'].search([('company_id','=',self.env.user.company_id.id)]).clearance_url
-
-
-
-        conf = self.env['ir.config_parameter'].sudo()
-
-        user = conf.get_param("zatca_bsToken", False)
-        password = conf.get_param("zatca_secret", False)
-        auth = base64.b64encode(('%s:%s' % (user, password)).encode('utf-8')).decode('utf-8')
-        headers = {'accept': 'application/json',
-                   'Accept-Language': 'en',
-                   'Clearance-Status': '1',
-                   'Accept-Version': 'V2',
-                   'Authorization': 'Basic ' + auth,
-                   'Content-Type': 'application/json'}
+    def _zatca_api_request(self, kind):
+        """Return the url, headers and json body of a ZATCA submission of the move.
+
+        :param kind: 'compliance' (sandbox), 'clearance' (standard) or 'reporting' (simplified)
+        """
+        self.ensure_one()
+        link, headers = self._zatca_api_endpoint(kind)
+        return link, headers, self._zatca_api_body()
+
+    def _zatca_api_endpoint(self, kind):
+        """Return the url and headers of the ZATCA submissions of ``kind``, see ``_zatca_api_request``."""
+        snapshot = self.env['zatca.einvoice.configuration']._get_snapshot(self.company_id.id)
+        if kind == 'compliance':
+            link = snapshot.compliance_url
+            headers = dict(snapshot.sandbox_headers)
+        else:
+            link = snapshot.clearance_url if kind == 'clearance' else snapshot.reporting_url
+            headers = dict(snapshot.production_headers)
+            headers['Clearance-Status'] = '1'
+        return link, headers
 
+    def _zatca_api_body(self):
+        self.ensure_one()
         data = {
             'invoiceHash': self.zatca_invoice_hash,
             # 'invoiceHash': self.hash_with_c14n_canonicalization(api_invoice=1),
             'uuid': self.invoice_uuid,
-            'invoice': self.zatca_invoice.decode('UTF-8'),
+            'invoice': base64.b64encode(self._zatca_invoice_xml()).decode('UTF-8'),
         }
-        try:
-            # req = requests.post(link + endpoint, headers=headers, data=json.dumps(data))
-            req = requests.post(link, headers=headers, data=json.dumps(data))
-            if req.status_code == 500:
-                raise exceptions.AccessError('Invalid Request, \ncontact system administer')
-            elif req.status_code == 401:
-                raise exceptions.AccessError('Unauthorized Request, \nUpdate configuration for production')
-            elif req.status_code in [200, 400]:
-                response = json.loads(req.text)
-                string = "<table style='width:100%'>"
-                string += "<tr><td  colspan='6'><b>validationResults</b></td></tr>"
-
-                for key, value in response['validationResults'].items():
-                    if type(value) == list:
-                        string += "<tr><td  colspan='6'><center><b>" + key + "</b></center></td></tr>"
-                        qty = 1
-                        for val in value:
-                            color = 'green' if str(val['status']).lower() == 'pass' else 'red'
-                            string += "<tr>"
-                            string += "<td colspan='2' style='border: 1px solid black;'>" + str(qty) + "</td>"
-                            string += "<td  style='border: 1px solid black;'><b>" + 'type' + "</b></td>"
-                            string += "<td  style='border: 1px solid black;'><b>" + 'code' + "</b></td>"
-                            string += "<td  style='border: 1px solid black;'><b>" + 'category' + "</b></td>"
-                            string += "<td  style='border: 1px solid black;'><b>" + 'status' + "</b></td>"
-                            string += "</tr>"
-                            string += "<tr>"
-                            string += "<td  style='border: 1px solid black;' colspan='2'></td>"
-                            string += "<td  style='border: 1px solid black;color: " + color + ";'>" + str(val['type']) + "</td>"
-                            string += "<td  style='border: 1px solid black;color: " + color + ";'>" + str(val['code']) + "</td>"
-                            string += "<td  style='border: 1px solid black;color: " + color + ";'>" + str(val['category']) + "</td>"
-                            string += "<td  style='border: 1px solid black;color: " + color + ";'>" + str(val['status']) + "</td>"
-                            string += "</tr>"
-                            string += "<tr>"
-                            string += "<td colspan='2'  style='border: 1px solid black;'><b>" + 'message' + "</b></td>"
-                            string += "<td colspan='4'  style='border: 1px solid black;color: " + color + ";'>" + str(val['message']) + "</td>"
-                            string += "</tr>"
-                            qty += 1
-                    else:
-                        string += "<tr>"
-                        string += "<td>" + key + "</td><td colspan='3'>" + str(value) + "</td>"
-                        string += "</tr>"
-                string += "<tr><td colspan='2'><b>clearanceStatus</b></td><td colspan='4'>" + str(response['clearanceStatus']) + "</td></tr>"
-                string += "<tr><td colspan='2'><b>clearedInvoice</b></td><td colspan='4'>" + str(response['clearedInvoice']) + "</td></tr>"
-                string += "</table>"
-
-                json_iterated = string
-                self.zatca_compliance_invoices_api = json_iterated
-
-                file_name_specification = str(self.company_id.vat) + "_" + self.datetime_field.strftime('%Y%m%d') + "T" + self.datetime_field.strftime('%H%M%SZ') + "_" + str(self.id)
-                atts = self.env['ir.attachment'].sudo().search([('res_model', '=', 'account.move'),
-                                                                ('res_field', '=', 'zatca_hash_cleared_invoice'),
-                                                                ('res_id', 'in', self.ids)])
-                if response['clearedInvoice']:
-                    if atts:
-                        atts.sudo().write({'datas': base64.b64encode(bytes(response['clearedInvoice'], 'utf-8'))})
-                    else:
-                        atts.sudo().create([{
-                            'name': file_name_specification + 'cleared' + ".xml",
-                            'res_model': 'account.move',
-                            'res_field': 'zatca_hash_cleared_invoice',
-                            'res_id': self.id,
-                            'type': 'binary',
-                            'datas': base64.b64encode(bytes(response['clearedInvoice'], 'utf-8')),
-                            'mimetype': 'text/xml',
-                        }])
-                    self.zatca_hash_cleared_invoice_name = file_name_specification + 'hash' + ".xml"
-            return {
-                'type': 'ir.actions.act_window',
-                'name': "acv",
-                'res_model': 'account.move',
-                'view_mode': 'form',
-                'res_id': self.id,
-                'views': [(self.env.ref('invoice_zatca_integrations.zatca_response').id, 'form')],
-            }
-        except Exception as e:
-            raise exceptions.AccessDenied(e)
-
-    def invoices_reporting_single_api(self):
-        # link = "https://gw-apic-gov.gazt.gov.sa/e-invoicing/developer-portal"
-        # endpoint = '/invoices/reporting/single'
-
-        link = self.env['zatca.einvoice.configuration'].search([('company_id','=',self.env.user.company_id.id)]).reporting_url
+        return json.dumps(data)
 
+    def invoices_reporting_batch_api(self):
+        """Report the simplified invoices of the recordset to ZATCA concurrently.
 
+        Moves are handled by chunks of 'zatca.reporting_batch_size': the missing XML is
+        generated, the chunk is sent by the asyncio dispatcher with at most
+        'zatca.reporting_max_in_flight' requests in flight and 'zatca.reporting_rate'
+        requests per second (0: unlimited), and the reporting statuses are written back
+        with one write per status value. The work is committed after every chunk.
+        """
         conf = self.env['ir.config_parameter'].sudo()
-
-        user = conf.get_param("zatca_bsToken", False)
-        password = conf.get_param("zatca_secret", False)
-        auth = base64.b64encode(('%s:%s' % (user, password)).encode('utf-8')).decode('utf-8')
-        headers = {'accept': 'application/json',
-                   'Accept-Language': 'en',
-                   'Clearance-Status': '1',
-                   'Accept-Version': 'V2',
-                   'Authorization': 'Basic ' + auth,
-                   'Content-Type': 'application/json'}
-
-        data = {
-            'invoiceHash': self.zatca_invoice_hash,
-            # 'invoiceHash': self.hash_with_c14n_canonicalization(api_invoice=1),
-            'uuid': self.invoice_uuid,
-            'invoice': self.zatca_invoice.decode('UTF-8'),
+        batch_size = int(conf.get_param('zatca.reporting_batch_size', 500))
+        max_in_flight = int(conf.get_param('zatca.reporting_max_in_flight', dispatcher.DEFAULT_MAX_IN_FLIGHT))
+        rate = float(conf.get_param('zatca.reporting_rate', 0) or 0)
+        options = self.env['zatca.einvoice.configuration']._http_options()
+
+        moves = self.filtered(lambda m: m.state == 'posted' and m.zatca_reporting_status != 'REPORTED'
+                              and m._zatca_submission_kind() == 'reporting').sorted('id')
+        statuses = {}
+        for start in range(0, len(moves), batch_size):
+            chunk = moves[start:start + batch_size]
+            chunk.filtered(lambda m: not m.zatca_invoice_name).create_xml_files()
+            # release the chain locks before the HTTP calls
+            self.env.cr.commit()
+            calls = [(move.id,) + move._zatca_api_request('reporting') for move in chunk]
+            results = dispatcher.dispatch(calls, max_in_flight, rate, **options)
+            for status, move_ids in chunk._zatca_reporting_results(results).items():
+                chunk.browse(move_ids).write({'zatca_reporting_status': status})
+                statuses[status] = statuses.get(status, 0) + len(move_ids)
+            # answered here, the queued submissions of these moves are not sent again
+            self.env['zatca.submission']._settle('reporting', results)
+            # ZATCA has the chunk: keep its statuses whatever happens to the next chunks
+            self.env.cr.commit()
+            # the XML of the chunk is not needed anymore
+            chunk.invalidate_cache(['zatca_invoice', 'xml_sign_char_data'])
+            chunk.mapped('zatca_invoice_blob_id').invalidate_cache(['data'])
+
+        message = ', '.join('%s: %s' % (status, count) for status, count in sorted(statuses.items()))
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'ZATCA Reporting',
+                'message': message or 'No simplified invoice to report.',
+                'sticky': False,
+            },
         }
+
+    def _zatca_batch_generate(self, failed):
+        """Generate the missing XML of the moves, see ``zatca.batch``; errors are put in ``failed`` by move id."""
+        moves = self.filtered(lambda m: not m.zatca_invoice_name)
         try:
-            # req = requests.post(link + endpoint, headers=headers, data=json.dumps(data))
-            req = requests.post(link, headers=headers, data=json.dumps(data))
-            if req.status_code == 500:
-                raise exceptions.AccessError('Invalid Request, \ncontact system administer')
-            elif req.status_code == 401:
-                raise exceptions.AccessError('Unauthorized Request, \nUpdate configuration for production')
-            elif req.status_code in [200, 400]:
-                response = json.loads(req.text)
-                string = "<table style='width:100%'>"
-                string += "<tr><td  colspan='6'><b>validationResults</b></td></tr>"
-
-                for key, value in response['validationResults'].items():
-                    if type(value) == list:
-                        string += "<tr><td  colspan='6'><center><b>" + key + "</b></center></td></tr>"
-                        qty = 1
-                        for val in value:
-                            color = 'green' if str(val['status']).lower() == 'pass' else 'red'
-                            string += "<tr>"
-                            string += "<td colspan='2' style='border: 1px solid black;'>" + str(qty) + "</td>"
-                            string += "<td  style='border: 1px solid black;'><b>" + 'type' + "</b></td>"
-                            string += "<td  style='border: 1px solid black;'><b>" + 'code' + "</b></td>"
-                            string += "<td  style='border: 1px solid black;'><b>" + 'category' + "</b></td>"
-                            string += "<td  style='border: 1px solid black;'><b>" + 'status' + "</b></td>"
-                            string += "</tr>"
-                            string += "<tr>"
-                            string += "<td  style='border: 1px solid black;' colspan='2'></td>"
-                            string += "<td  style='border: 1px solid black;color: " + color + ";'>" + str(val['type']) + "</td>"
-                            string += "<td  style='border: 1px solid black;color: " + color + ";'>" + str(val['code']) + "</td>"
-                            string += "<td  style='border: 1px solid black;color: " + color + ";'>" + str(val['category']) + "</td>"
-                            string += "<td  style='border: 1px solid black;color: " + color + ";'>" + str(val['status']) + "</td>"
-                            string += "</tr>"
-                            string += "<tr>"
-                            string += "<td colspan='2'  style='border: 1px solid black;'><b>" + 'message' + "</b></td>"
-                            string += "<td colspan='4'  style='border: 1px solid black;color: " + color + ";'>" + str(val['message']) + "</td>"
-                            string += "</tr>"
-                            qty += 1
-                    else:
-                        string += "<tr>"
-                        string += "<td>" + key + "</td><td colspan='3'>" + str(value) + "</td>"
-                        string += "</tr>"
-                string += "<tr><td colspan='2'><b>reportingStatus</b></td><td colspan='4'>" + str(response['reportingStatus']) + "</td></tr>"
-                string += "</table>"
-
-                json_iterated = string
-                self.zatca_compliance_invoices_api = json_iterated
-            return {
-                'type': 'ir.actions.act_window',
-                'name': "acv",
-                'res_model': 'account.move',
-                'view_mode': 'form',
-                'res_id': self.id,
-                'views': [(self.env.ref('invoice_zatca_integrations.zatca_response').id, 'form')],
-            }
-        except Exception as e:
-            raise exceptions.AccessDenied(e)
+            with self.env.cr.savepoint():
+                moves.create_xml_files()
+            return
+        except Exception:
+            pass
+        # one of the moves fails: again move by move, to keep the others
+        for move in moves:
+            try:
+                with self.env.cr.savepoint():
+                    move.create_xml_files()
+            except Exception as e:
+                failed[move.id] = 'generation: %s' % e
+
+    def _zatca_batch_submit(self, kind, failed):
+        """Submit the generated XML of the moves concurrently, see ``zatca.batch``.
+
+        Moves ZATCA already accepted for their kind are skipped, the pending queued
+        submissions of the moves answered are closed.
+        """
+        calls = []
+        kinds = {}
+        for move in self:
+            kinds[move.id] = kind or move._zatca_submission_kind()
+            if move._zatca_submitted(kinds[move.id]):
+                # reported or cleared meanwhile, e.g. by the submission queue
+                continue
+            try:
+                calls.append((move.id,) + move._zatca_api_request(kinds[move.id]))
+            except Exception as e:
+                failed[move.id] = 'submission: %s' % e
+        conf = self.env['ir.config_parameter'].sudo()
+        results = dispatcher.dispatch(
+            calls, int(conf.get_param('zatca.reporting_max_in_flight', dispatcher.DEFAULT_MAX_IN_FLIGHT)),
+            float(conf.get_param('zatca.reporting_rate', 0) or 0),
+            **self.env['zatca.einvoice.configuration']._http_options())
+        for move in self.browse(list(results)):
+            status_code, text, error = results[move.id]
+            if error:
+                failed[move.id] = 'submission: %s' % error
+                continue
+            try:
+                with self.env.cr.savepoint():
+                    move._zatca_api_response(kinds[move.id], status_code, text)
+                if status_code not in (200, 202):
+                    # rejected, the validation messages are stored on the move
+                    failed[move.id] = 'submission: HTTP %s' % status_code
+            except Exception as e:
+                failed[move.id] = 'submission: %s' % e
+        # answered here, the queued submissions of these moves are not sent again
+        for submission_kind in set(kinds.values()):
+            self.env['zatca.submission']._settle(submission_kind, dict(
+                (move_id, result) for move_id, result in results.items() if kinds[move_id] == submission_kind))
+
+    def _zatca_reporting_results(self, results):
+        """Group the moves by reporting status; the validation results are kept for the others than REPORTED.
+
+        :param results: dict mapping a move id to a ``(status_code, text, exception)`` tuple
+        :return: dict mapping a reporting status to a list of move ids
+        """
+        statuses = {}
+        answers = []
+        for move in self:
+            status_code, text, error = results.get(move.id, (None, None, None))
+            if error or status_code not in (200, 202, 400):
+                status = 'ERROR'
+            else:
+                response = json.loads(text)
+                status = response.get('reportingStatus') or 'ERROR'
+                if status_code != 200:
+                    # 202 reported with warnings, 400 rejected: worth showing on the move
+                    answers.append((move, 'reporting', response, ['reportingStatus']))
+            statuses.setdefault(status, []).append(move.id)
+        self.env['zatca.validation.message']._store(answers)
+        return statuses
+
+    def _zatca_api_response(self, kind, status_code, text):
+        """Store the ZATCA answer to a submission of the move, see ``_zatca_api_request``."""
+        self.ensure_one()
+        if status_code == 500:
+            raise exceptions.AccessError('Invalid Request, \ncontact system administer')
+        elif status_code == 401:
+            raise exceptions.AccessError('Unauthorized Request, \nUpdate configuration for %s'
+                                         % ('sandbox' if kind == 'compliance' else 'production'))
+        elif status_code in [200, 202, 400]:
+            # 202: reported or cleared with warnings
+            response = json.loads(text)
+            if kind == 'compliance':
+                status_keys = ['reportingStatus', 'clearanceStatus', 'qrSellertStatus', 'qrBuyertStatus']
+            elif kind == 'clearance':
+                status_keys = ['clearanceStatus', 'clearedInvoice']
+            else:
+                status_keys = ['reportingStatus']
+            self.env['zatca.validation.message']._store([(self, kind, response, status_keys)])
+            document = self.zatca_document_id
+            if kind == 'reporting':
+                self.zatca_reporting_status = response.get('reportingStatus')
 
-    def hash_with_c14n_canonicalization(self, api_invoice=0, xml=0):
-        invoice = base64.b64decode(self.zatca_invoice).decode() if not xml else xml
-        xml_file = ET.fromstring(invoice)
-        if not api_invoice:
-            xsl_file = ET.fromstring('''<xsl:stylesheet xmlns:xsl="http://www.w3.org/1999/XSL/Transform"
-                            xmlns:xs="http://www.w3.org/2001/XMLSchema"
-                            xmlns="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"
-                            xmlns:cac="urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2"
-                            xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2"
-                            xmlns:ext="urn:oasis:names:specification:ubl:schema:xsd:CommonExtensionComponents-2"
-                            exclude-result-prefixes="xs"
-                            version="2.0">
-                <xsl:output omit-xml-declaration="yes" encoding="utf-8" indent="no"/>
-                <xsl:template match="node() | @*">
-                    <xsl:copy>
-                        <xsl:apply-templates select="node() | @*"/>
-                    </xsl:copy>
-                </xsl:template>
-                <xsl:template match="//*[local-name()='Invoice']//*[local-name()='UBLExtensions']"></xsl:template>
-                <xsl:template match="//*[local-name()='AdditionalDocumentReference'][cbc:ID[normalize-space(text()) = 'QR']]"></xsl:template>
-                 <xsl:template match="//*[local-name()='Invoice']/*[local-name()='Signature']"></xsl:template>
-            </xsl:stylesheet>''')
-            transform = ET.XSLT(xsl_file.getroottree())
-            transformed_xml = transform(xml_file.getroottree())
-        else:
-            transformed_xml = xml_file.getroottree()
-        sha256_hash = hashlib.sha256()
-        sha256_hash.update(ET.tostring(transformed_xml))
-        generated_hash = sha256_hash.hexdigest()
-        base64_encoded = base64.b64encode(sha256_hash.digest()).decode()
-        if not api_invoice:
-            self.zatca_invoice_hash = base64_encoded
-        else:
-            return base64_encoded
+            if kind == 'clearance' and response['clearedInvoice']:
+                file_name_specification = str(self.company_id.vat) + "_" + self.datetime_field.strftime('%Y%m%d') + "T" + self.datetime_field.strftime('%H%M%SZ') + "_" + str(self.id)
+                # the cleared invoice comes base64 encoded
+                cleared_invoice = base64.b64decode(response['clearedInvoice'])
+                document.cleared_blob_id = self.env['zatca.xml.blob']._store([cleared_invoice])[cleared_invoice]
+                self.zatca_hash_cleared_invoice_name = file_name_specification + 'cleared' + ".xml"
+
+    def _zatca_submitted(self, kind):
+        """Whether ZATCA already accepted the move for a submission of ``kind``."""
+        self.ensure_one()
+        if kind == 'reporting':
+            return self.zatca_reporting_status == 'REPORTED'
+        return kind == 'clearance' and bool(self.zatca_cleared_blob_id)
+
+    def _zatca_validation_results_html(self, response, status_keys):
+        messages = self.env['zatca.validation.message']
+        validation_status, values = messages._parse(response)
+        return messages._render(validation_status, values, [(key, response.get(key)) for key in status_keys])
 
-        atts = self.env['ir.attachment'].sudo().search([('res_model', '=', 'account.move'),
-                                                        ('res_field', '=', 'zatca_hash_invoice'),
-                                                        ('res_id', 'in', self.ids)])
-        if atts:
-            atts.sudo().write({'datas': base64.b64encode(ET.tostring(transformed_xml))})
-        else:
-            atts.sudo().create([{
-                'name': self.zatca_invoice_name.replace('.xml', '_hash.xml'),
-                'res_model': 'account.move',
-                'res_field': 'zatca_hash_invoice',
-                'res_id': self.id,
-                'type': 'binary',
-                'datas': base64.b64encode(ET.tostring(transformed_xml)),
-                'mimetype': 'text/xml',
-            }])
+    def hash_with_c14n_canonicalization(self, api_invoice=0, xml=0):
+        invoice = self._zatca_invoice_xml() if not xml else xml
+        if api_invoice:
+            xml_file = ET.fromstring(invoice)
+            return base64.b64encode(hashlib.sha256(ET.tostring(xml_file.getroottree())).digest()).decode()
+        # the hashed document itself is derived from the invoice, see zatca_hash_invoice
+        self.zatca_invoice_hash = self._zatca_hash_xml(invoice)[0]
         self.zatca_hash_invoice_name = self.zatca_invoice_name.replace('.xml', '_hash.xml')
 
+    def _zatca_hash_xml(self, xml, method=None):
+        """Return the base64 invoice hash of ``xml`` and the transformed document it is computed on.
+
+        :param xml: serialized document or an already built root element
+        """
+        method = method or self._zatca_hash_method()
+        invoice = xml if isinstance(xml, ET._Element) else ET.fromstring(xml)
+        return hashing.invoice_hash(invoice, method)
+
+    def _zatca_hash_method(self):
+        """Invoice hash implementation, set 'zatca.hash_method' to 'c14n' to skip the XSLT transform."""
+        method = self.env['ir.config_parameter'].sudo().get_param('zatca.hash_method', 'xslt')
+        return method if method in hashing.HASH_METHODS else 'xslt'
@@ -1,12 +1,20 @@
 # -*- coding: utf-8 -*-
 # Part of Odoo. See LICENSE file for full copyright and licensing details.
 
-from odoo import api, fields, models, _
+from odoo import api, fields, models, tools, _
 from datetime import date
 from datetime import datetime
 from datetime import datetime, timedelta
 from odoo.exceptions import UserError, ValidationError
+import base64
 import calendar
+from collections import namedtuple
+
+from ..tools import client
+
+# immutable, shared by every caller of the ormcache
+ZatcaConfig = namedtuple('ZatcaConfig', ['configuration_id', 'compliance_url', 'clearance_url', 'reporting_url',
+                                         'sandbox_headers', 'production_headers', 'certificate', 'private_key'])
 
 
 class ZatcaEinvoiceConfiguration(models.Model):
@@ -26,11 +34,85 @@ class ZatcaEinvoiceConfiguration(models.Model):
     company_id = fields.Many2one('res.company',string='Company Name')
     certificate = fields.Char(string='Certificate')
     private_key = fields.Char(string="Private Key")
+    csr = fields.Char(string="CSR")
     hash = fields.Char(string="Hash")
     xml_file_text = fields.Text(string="XML DATA")
 
 
 
+    def init(self):
+        # the certificate used to be a global setting: it goes to the configuration, when only one
+        conf = self.env['ir.config_parameter'].sudo()
+        certificate = conf.get_param('csr_certificate')
+        configurations = self.sudo().with_context(active_test=False).search([])
+        if certificate and len(configurations) == 1 and not configurations.certificate:
+            configurations.certificate = certificate
+            conf.set_param('csr_certificate', False)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        records = super(ZatcaEinvoiceConfiguration, self).create(vals_list)
+        self.clear_caches()
+        return records
+
+    def write(self, vals):
+        res = super(ZatcaEinvoiceConfiguration, self).write(vals)
+        self.clear_caches()
+        return res
+
+    def unlink(self):
+        res = super(ZatcaEinvoiceConfiguration, self).unlink()
+        self.clear_caches()
+        return res
+
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_snapshot(self, company_id):
+        """Return the ZATCA configuration of a company as an immutable ``ZatcaConfig``.
+
+        The urls and the prebuilt authentication headers are computed once per company
+        and worker. Certificate and private key both come from the configuration of the
+        company; they are kept as stored and only parsed when a document is signed, see
+        ``account.move._zatca_certificate_values`` and ``_zatca_signer``, so that a wrong
+        value cannot break the posting of invoices. The cache is
+        cleared when a configuration is changed, and by ``ir.config_parameter`` for the
+        tokens.
+        """
+        configuration = self.sudo().search([('company_id', '=', company_id)], limit=1)
+        conf = self.env['ir.config_parameter'].sudo()
+        return ZatcaConfig(
+            configuration_id=configuration.id,
+            compliance_url=configuration.compliance_url,
+            clearance_url=configuration.clearance_url,
+            reporting_url=configuration.reporting_url,
+            sandbox_headers=self._auth_headers(conf.get_param("zatca_sb_bsToken", False),
+                                               conf.get_param("zatca_sb_secret", False)),
+            production_headers=self._auth_headers(conf.get_param("zatca_bsToken", False),
+                                                  conf.get_param("zatca_secret", False)),
+            certificate=configuration.certificate,
+            private_key=configuration.private_key,
+        )
+
+    @api.model
+    def _auth_headers(self, user, password):
+        auth = base64.b64encode(('%s:%s' % (user, password)).encode('utf-8')).decode('utf-8')
+        return (('accept', 'application/json'),
+                ('Accept-Language', 'en'),
+                ('Accept-Version', 'V2'),
+                ('Authorization', 'Basic ' + auth),
+                ('Content-Type', 'application/json'))
+
+    @api.model
+    def _http_options(self):
+        """Return the keyword arguments of the ZATCA gateway calls, see ``tools.client.post``."""
+        conf = self.env['ir.config_parameter'].sudo()
+        connect_timeout, read_timeout = client.DEFAULT_TIMEOUT
+        return {
+            'timeout': (float(conf.get_param('zatca.connect_timeout', connect_timeout) or connect_timeout),
+                        float(conf.get_param('zatca.read_timeout', read_timeout) or read_timeout)),
+            'retries': int(conf.get_param('zatca.http_retries', client.DEFAULT_RETRIES)),
+        }
+
     def create_access(self):
         import requests
         from dateutil.relativedelta import relativedelta
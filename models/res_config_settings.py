@@ -1,9 +1,9 @@
 # -*- coding: utf-8 -*-
 from odoo import fields, models, exceptions
-import requests
 import base64
 import json
-import os
+
+from ..tools import certificate as signing_certificate, client, csr as zatca_csr
 
 
 class ResConfigSettings(models.TransientModel):
@@ -25,73 +25,53 @@ class ResConfigSettings(models.TransientModel):
     csr_industry_business_category = fields.Char("Industry",
                                                  config_parameter='csr_industry_business_category', required="1")  # BusinessCategory
     csr_otp = fields.Char("Otp", config_parameter='csr_otp', required="1")
-    csr_certificate = fields.Char("Certificate", config_parameter='csr_certificate', required="1")
+    # kept with the private key, in the ZATCA configuration of the company
+    csr_certificate = fields.Char("Certificate", required="1")
     csr_public_key = fields.Char(string="Publice key")
-    def generate_zatca_certificate(self):
-        try:
-            conf = self.env['ir.config_parameter'].sudo()
-            config_cnf = '''
-                oid_section = OIDs
-                [ OIDs ]
-                certificateTemplateName= 1.3.6.1.4.1.311.20.2
-                [ req ]
-                default_bits = 2048
-                emailAddress = myEmail@gmail.com
-                req_extensions = v3_req
-                x509_extensions = v3_ca
-                prompt = no
-                default_md = sha256
-                req_extensions = req_ext
-                distinguished_name = dn
-                [ dn ]
-                C = ''' + str(conf.get_param("csr_country_name", '')) + '''
-                OU = ''' + str(conf.get_param("csr_organization_unit_name", '')) + '''
-                O = ''' + str(conf.get_param("csr_organization_name", '')) + '''
-                CN = ''' + str(conf.get_param("csr_common_name", '')) + '''
-                [ v3_req ]
-                basicConstraints = CA:FALSE
-                keyUsage = digitalSignature, nonRepudiation, keyEncipherment
-                [ req_ext ]
-                certificateTemplateName = ASN1:PRINTABLESTRING:ZATCA-Code-Signing
-                subjectAltName = dirName:alt_names            
-                [ alt_names ]
-                SN = ''' + str(conf.get_param("csr_serial_number", '')) + '''
-                UID = ''' + str(conf.get_param("csr_organization_identifier", '')) + '''
-                title = ''' + str(conf.get_param("csr_invoice_type", '')) + '''
-                registeredAddress = ''' + str(conf.get_param("csr_location_address", '')) + '''
-                businessCategory = ''' + str(conf.get_param("csr_industry_business_category", '')) + '''
-            '''
-
-            f = open('/tmp/zatca.cnf', 'w+')
-            f.write(config_cnf)
-            f.close()
-
-            private_key = 'openssl ecparam -name secp256k1 -genkey -noout -out /tmp/zatcaprivatekey.pem'
-            public_key = 'openssl ec -in /tmp/zatcaprivatekey.pem -pubout -conv_form compressed -out /tmp/zatcapublickey.pem'
-            public_key_bin = 'openssl base64 -d -in /tmp/zatcapublickey.pem -out /tmp/zatcapublickey.bin'
-            csr = 'openssl req -new -sha256 -key /tmp/zatcaprivatekey.pem -extensions v3_req -config /tmp/zatca.cnf -out /tmp/zatca_taxpayper.csr'
-            csr_base64 = "openssl base64 -in /tmp/zatca_taxpayper.csr -out /tmp/zatca_taxpayper_64.csr"
+    zatca_connect_timeout = fields.Float("Connect Timeout (s)", config_parameter='zatca.connect_timeout',
+                                         default=client.DEFAULT_TIMEOUT[0])
+    zatca_read_timeout = fields.Float("Read Timeout (s)", config_parameter='zatca.read_timeout',
+                                      default=client.DEFAULT_TIMEOUT[1])
+    zatca_http_retries = fields.Integer("Retries", config_parameter='zatca.http_retries',
+                                        default=client.DEFAULT_RETRIES)
 
-            os.system(private_key)
-            os.system(public_key)
-            # self.csr_public_key = public_key
-            os.system(public_key_bin)
-            os.system(csr)
-            os.system(csr_base64)
-            # filepath = os.popen("find -name 'zatca_sdk'").read()
-            # filepath = filepath.replace('zatca_sdk', '').replace('\n', '')
-            # self.env['ir.config_parameter'].sudo().set_param("zatca_sdk_path", filepath)
+    def get_values(self):
+        res = super(ResConfigSettings, self).get_values()
+        res['csr_certificate'] = self.env['zatca.einvoice.configuration'].sudo().search(
+            [('company_id', '=', self.env.company.id)], limit=1).certificate
+        return res
 
-            self.compliance_api()
-            # self.compliance_api('/production/csids', 1)
-        #     CNF, PEM, CSR created
+    def set_values(self):
+        super(ResConfigSettings, self).set_values()
+        configuration = self._zatca_configuration()
+        if configuration.certificate != self.csr_certificate:
+            configuration.certificate = self.csr_certificate
 
-            # Signature validation
-            invoice_name = '.xml'
-            signature = 'openssl dgst -verify zatcapublickey.pem -signature zatcapublickey.bin ' + invoice_name
+    def generate_zatca_certificate(self):
+        conf = self.env['ir.config_parameter'].sudo()
+        try:
+            # key pair and CSR are built in memory and kept on the company configuration
+            private_key, csr = zatca_csr.generate(
+                country=conf.get_param("csr_country_name", ''),
+                organization_unit=conf.get_param("csr_organization_unit_name", ''),
+                organization=conf.get_param("csr_organization_name", ''),
+                common_name=conf.get_param("csr_common_name", ''),
+                serial_number=conf.get_param("csr_serial_number", ''),
+                organization_identifier=conf.get_param("csr_organization_identifier", ''),
+                invoice_type=conf.get_param("csr_invoice_type", ''),
+                location_address=conf.get_param("csr_location_address", ''),
+                business_category=conf.get_param("csr_industry_business_category", ''),
+            )
         except Exception as e:
             # raise exceptions.MissingError(e)
             raise exceptions.MissingError('Configuration values missing.')
+        self._zatca_configuration().write({'private_key': private_key, 'csr': csr})
+        self.compliance_api()
+
+    def _zatca_configuration(self):
+        configurations = self.env['zatca.einvoice.configuration'].sudo()
+        return configurations.search([('company_id', '=', self.env.company.id)], limit=1) or \
+            configurations.create({'company_id': self.env.company.id})
 
     def compliance_api(self, endpoint='/compliance', renew=0):
         link = "https://gw-apic-gov.gazt.gov.sa/e-invoicing/developer-portal"
@@ -103,9 +83,7 @@ class ResConfigSettings(models.TransientModel):
                        'Accept-Version': 'V2',
                        'Content-Type': 'application/json'}
 
-            f = open('/tmp/zatca_taxpayper_64.csr', 'r')
-            csr = f.read()
-            data = {'csr': csr.replace('\n', '')}
+            data = {'csr': self._zatca_configuration().csr}
         elif endpoint == '/production/csids' and not renew:
             user = conf.get_param("zatca_sb_bsToken", False)
             password = conf.get_param("zatca_sb_secret", False)
@@ -128,11 +106,10 @@ class ResConfigSettings(models.TransientModel):
                        'Accept-Version': 'V2',
                        'Authorization': 'Basic ' + auth,
                        'Content-Type': 'application/json'}
-            f = open('/tmp/zatca_taxpayper_64.csr', 'r')
-            csr = f.read()
-            data = {'csr': csr.replace('\n', '')}
+            data = {'csr': self._zatca_configuration().csr}
         try:
-            req = requests.post(link + endpoint, headers=headers, data=json.dumps(data))
+            req = client.post(link + endpoint, headers, json.dumps(data),
+                              **self.env['zatca.einvoice.configuration']._http_options())
             if req.status_code == 500:
                 raise exceptions.AccessError('Invalid Request, zatca, \ncontact system administer')
             elif req.status_code == 400:
@@ -162,3 +139,6 @@ class ResConfigSettings(models.TransientModel):
 
     def production_credentials_renew(self):
         self.compliance_api('/production/csids', 1)
+        # the renewed CSID comes with a new certificate
+        signing_certificate.clear()
+        self.env['zatca.einvoice.configuration'].clear_caches()
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+import base64
+import copy
+import json
+import uuid
+
+from odoo import api, fields, models, exceptions
+
+from ..tools import certificate as signing_certificate, dispatcher, hashing, signing, ubl
+from .zatca_invoice_chain import INITIAL_PIH
+
+# (variant, (KSA-2 invoice type transaction code, BT-3 invoice type code)), in submission
+# order: the invoice of each type comes first, its notes refer to it
+VARIANTS = (
+    ('standard_invoice', ('0100000', '388')),
+    ('standard_credit', ('0100000', '381')),
+    ('standard_debit', ('0100000', '383')),
+    ('simplified_invoice', ('0200000', '388')),
+    ('simplified_credit', ('0200000', '381')),
+    ('simplified_debit', ('0200000', '383')),
+)
+
+
+class ZatcaComplianceRun(models.Model):
+    _name = "zatca.compliance.run"
+    _description = "ZATCA compliance checks run"
+    _order = "id desc"
+
+    name = fields.Char(required=True, default=lambda self: 'Compliance checks %s' % fields.Datetime.now())
+    company_id = fields.Many2one('res.company', string='Company', required=True, default=lambda self: self.env.company)
+    egs_unit_id = fields.Many2one('zatca.egs.unit', string='EGS Unit', ondelete='cascade',
+                                  help="Credentials, key and certificate of the unit; by default the ones of the company.")
+    template_move_id = fields.Many2one('account.move', string='Template Invoice', required=True,
+                                       domain="[('move_type', '=', 'out_invoice'), ('state', '=', 'posted'), "
+                                              "('company_id', '=', company_id)]")
+    state = fields.Selection([('draft', 'Draft'), ('passed', 'Passed'), ('failed', 'Failed')],
+                             default='draft', required=True)
+    error = fields.Text(readonly=1)
+    date_start = fields.Datetime('Started On', readonly=1)
+    date_done = fields.Datetime('Done On', readonly=1)
+    line_ids = fields.One2many('zatca.compliance.run.line', 'run_id', string='Documents', readonly=1)
+    passed_count = fields.Integer('Passed', readonly=1)
+
+    @api.model
+    def _default_template(self, company):
+        return self.env['account.move'].search([('move_type', '=', 'out_invoice'), ('state', '=', 'posted'),
+                                                ('company_id', '=', company.id)], order='id desc', limit=1)
+
+    def action_run(self):
+        """Build the six mandatory documents of every run and submit them all at once.
+
+        Documents are derived in memory from the template invoice, moves and invoice
+        chain are left untouched. Answers are written on the run lines as they come in.
+        """
+        calls = []
+        started = self.browse()
+        for run in self:
+            run.line_ids.unlink()
+            run.write({'state': 'draft', 'error': False, 'date_start': fields.Datetime.now(), 'date_done': False})
+            try:
+                with self.env.cr.savepoint():
+                    link, headers = run._compliance_endpoint()
+                    lines = run._build_documents()
+            except Exception as e:
+                run.write({'state': 'failed', 'error': str(e), 'date_done': fields.Datetime.now()})
+                continue
+            started |= run
+            for line in lines:
+                calls.append((line.id, link, headers, json.dumps({
+                    'invoiceHash': line.invoice_hash,
+                    'uuid': line.uuid,
+                    'invoice': line.invoice,
+                })))
+
+        max_in_flight = int(self.env['ir.config_parameter'].sudo().get_param('zatca.onboarding_max_in_flight', 10))
+        lines = self.env['zatca.compliance.run.line']
+        for line_id, (status_code, text, error) in dispatcher.stream(
+                calls, max_in_flight, **self.env['zatca.einvoice.configuration']._http_options()):
+            lines.browse(line_id)._store_answer(status_code, text, error)
+
+        for run in started:
+            passed = len(run.line_ids.filtered(lambda l: l.state in ('passed', 'warning')))
+            run.write({'state': 'passed' if passed == len(VARIANTS) else 'failed', 'passed_count': passed,
+                       'date_done': fields.Datetime.now()})
+        return True
+
+    def _compliance_endpoint(self):
+        self.ensure_one()
+        if self.egs_unit_id:
+            link = self.env['ir.config_parameter'].sudo().get_param("zatca_link", False) or \
+                   "https://gw-apic-gov.gazt.gov.sa/e-invoicing/developer-portal"
+            headers = self.env['zatca.einvoice.configuration']._auth_headers(self.egs_unit_id.compliance_token,
+                                                                              self.egs_unit_id.compliance_secret)
+            return link + '/compliance/invoices', dict(headers)
+        return self.template_move_id._zatca_api_endpoint('compliance')
+
+    def _signing_material(self):
+        """Return the certificate values and the signer the documents of the run are signed with."""
+        self.ensure_one()
+        if self.egs_unit_id and not self.egs_unit_id.compliance_token:
+            raise exceptions.ValidationError('EGS unit %s has no compliance CSID' % self.egs_unit_id.name)
+        try:
+            if self.egs_unit_id:
+                # the binary security token is the base64 of the certificate value
+                certificate = signing_certificate.load(base64.b64decode(self.egs_unit_id.compliance_token).decode())
+                signer = signing.load(self.egs_unit_id.private_key)
+            else:
+                snapshot = self.env['zatca.einvoice.configuration']._get_snapshot(self.company_id.id)
+                certificate = signing_certificate.load(snapshot.certificate)
+                signer = signing.load(snapshot.private_key)
+        except (TypeError, ValueError) as e:
+            raise exceptions.ValidationError('ZATCA certificate or private key is invalid: %s' % e)
+        if not certificate or not signer:
+            raise exceptions.ValidationError('ZATCA certificate or private key is missing')
+        return {'certificate': certificate.certificate, 'digest': certificate.digest,
+                'issuer': certificate.issuer, 'serial_number': certificate.serial_number}, signer
+
+    def _build_documents(self):
+        """Create the lines of the run with their signed documents, chained from the initial PIH."""
+        self.ensure_one()
+        certificate, signer = self._signing_material()
+        template = self.template_move_id
+        data = template._zatca_prepare_invoice_data(certificate)
+        hash_method = template._zatca_hash_method()
+        previous_hash = INITIAL_PIH
+        vals_list = []
+        for icv, (variant, (ksa_2, bt_3)) in enumerate(VARIANTS, 1):
+            document = copy.deepcopy(data)
+            document.update(uuid=str(uuid.uuid4()), ksa_2=ksa_2, bt_3=bt_3, ksa_16=icv, ksa_13=previous_hash)
+            if bt_3 != '388':
+                # BR-KSA-56, KSA-10: credit and debit notes refer to an invoice and give a reason
+                document['billing_references'] = [(template.id, data['issue_date'])]
+                document['payment_means'] = dict(data.get('payment_means') or {}, instruction_note='Compliance check')
+            root = ubl.build_invoice(document)
+            invoice_hash = hashing.invoice_hash(root, hash_method)[0]
+            signing.sign_invoice(root, invoice_hash, signer)
+            vals_list.append({
+                'run_id': self.id,
+                'variant': variant,
+                'uuid': document['uuid'],
+                'invoice_hash': invoice_hash,
+                'invoice': base64.b64encode(ubl.serialize(root)).decode(),
+            })
+            previous_hash = invoice_hash
+        return self.env['zatca.compliance.run.line'].create(vals_list)
+
+
+class ZatcaComplianceRunLine(models.Model):
+    _name = "zatca.compliance.run.line"
+    _description = "ZATCA compliance check"
+    _order = "run_id, variant"
+
+    run_id = fields.Many2one('zatca.compliance.run', required=True, index=True, ondelete='cascade')
+    variant = fields.Selection([
+        ('standard_invoice', 'Standard Invoice'), ('standard_credit', 'Standard Credit Note'),
+        ('standard_debit', 'Standard Debit Note'), ('simplified_invoice', 'Simplified Invoice'),
+        ('simplified_credit', 'Simplified Credit Note'), ('simplified_debit', 'Simplified Debit Note'),
+    ], required=True)
+    uuid = fields.Char(readonly=1)
+    invoice_hash = fields.Char(readonly=1)
+    invoice = fields.Text(readonly=1)
+    state = fields.Selection([('pending', 'Pending'), ('passed', 'Passed'), ('warning', 'Passed with Warnings'),
+                              ('failed', 'Failed')], default='pending', required=True)
+    status_code = fields.Integer('HTTP Status', readonly=1)
+    status = fields.Char(readonly=1)
+    result = fields.Html(readonly=1)
+    error = fields.Text(readonly=1)
+
+    def _store_answer(self, status_code, text, error):
+        self.ensure_one()
+        if error or status_code not in (200, 202, 400):
+            self.write({'state': 'failed', 'status_code': status_code,
+                        'error': str(error) if error else 'HTTP %s %s' % (status_code, text or '')})
+            return
+        response = json.loads(text)
+        status_key = 'reportingStatus' if self.variant.startswith('simplified') else 'clearanceStatus'
+        response.setdefault(status_key, None)
+        validation = (response.get('validationResults') or {}).get('status')
+        self.write({
+            'state': {'PASS': 'passed', 'WARNING': 'warning'}.get(validation, 'failed'),
+            'status_code': status_code,
+            'status': response.get(status_key),
+            'result': self.env['account.move']._zatca_validation_results_html(response, [status_key]),
+        })
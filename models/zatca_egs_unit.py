@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+import json
+
+from odoo import fields, models, exceptions
+
+from ..tools import csr as zatca_csr, dispatcher
+
+DEFAULT_LINK = "https://gw-apic-gov.gazt.gov.sa/e-invoicing/developer-portal"
+
+
+class ZatcaEgsUnit(models.Model):
+    _name = "zatca.egs.unit"
+    _description = "ZATCA EGS unit"
+    _order = "company_id, name"
+
+    name = fields.Char('Name', required=True)
+    company_id = fields.Many2one('res.company', string='Company', required=True, default=lambda self: self.env.company)
+    state = fields.Selection([('draft', 'To Onboard'), ('compliance', 'Compliance CSID'),
+                              ('production', 'Production CSID'), ('failed', 'Failed')],
+                             default='draft', required=True, index=True, copy=False)
+    error = fields.Text(readonly=1, copy=False)
+
+    # CSR, empty taxpayer values are taken from the settings
+    csr_common_name = fields.Char("Common Name", required=True)  # CN
+    csr_serial_number = fields.Char("EGS Serial Number", required=True, copy=False)  # SN
+    csr_organization_unit_name = fields.Char("Organization Unit Name", required=True)  # OU
+    csr_organization_identifier = fields.Char("Organization Identifier")  # UID
+    csr_organization_name = fields.Char("Organization Name")  # O
+    csr_country_name = fields.Char("Country Name")  # C
+    csr_invoice_type = fields.Char("Invoice Type")  # title
+    csr_location_address = fields.Char("Location")  # registeredAddress
+    csr_industry_business_category = fields.Char("Industry")  # BusinessCategory
+    csr_otp = fields.Char("Otp", copy=False)
+
+    private_key = fields.Char(readonly=1, copy=False)
+    csr = fields.Char("CSR", readonly=1, copy=False)
+    compliance_token = fields.Char("Compliance CSID", readonly=1, copy=False)
+    compliance_secret = fields.Char(readonly=1, copy=False)
+    compliance_request_id = fields.Char(readonly=1, copy=False)
+    production_token = fields.Char("Production CSID", readonly=1, copy=False)
+    production_secret = fields.Char(readonly=1, copy=False)
+    production_request_id = fields.Char(readonly=1, copy=False)
+    date_onboarded = fields.Datetime('Onboarded On', readonly=1, copy=False)
+    compliance_run_ids = fields.One2many('zatca.compliance.run', 'egs_unit_id', string='Compliance Checks')
+
+    _sql_constraints = [
+        ('serial_number_uniq', 'unique(company_id, csr_serial_number)',
+         'The EGS serial number must be unique per company.'),
+    ]
+
+    def action_onboard(self):
+        """Onboard the pending units: CSR, compliance CSID, compliance checks then production CSID.
+
+        Each step is sent for all units at once by the concurrent dispatcher, with at
+        most 'zatca.onboarding_max_in_flight' requests in flight. Units failing a step
+        are left in the failed state with the reason, the others carry on; a failed
+        unit resumes from the step it failed.
+        """
+        units = self.filtered(lambda u: u.state in ('draft', 'failed'))
+        max_in_flight = int(self.env['ir.config_parameter'].sudo().get_param('zatca.onboarding_max_in_flight', 10))
+        options = self.env['zatca.einvoice.configuration']._http_options()
+
+        for step in ('compliance', 'production'):
+            calls = []
+            for unit in units.filtered(lambda u: not u[step + '_token']):
+                try:
+                    calls.append((unit.id,) + unit._onboarding_request(step))
+                except Exception as e:
+                    unit.write({'state': 'failed', 'error': '%s: %s' % (step, e)})
+            results = dispatcher.dispatch(calls, max_in_flight, **options)
+            units.browse(list(results))._store_csids(results, step)
+            units = units.filtered(lambda u: u[step + '_token'])
+            if step == 'compliance':
+                units = units._run_compliance_checks()
+        return self._onboarding_report()
+
+    def action_compliance_checks(self):
+        self._run_compliance_checks(force=True)
+        return self._onboarding_report()
+
+    def _run_compliance_checks(self, force=False):
+        """Run the compliance checks of the units, return the units that passed them.
+
+        :param force: run the checks again for the units that already passed them
+        """
+        runs = self.env['zatca.compliance.run']
+        for unit in self.filtered(lambda u: force or 'passed' not in u.compliance_run_ids.mapped('state')):
+            template = runs._default_template(unit.company_id)
+            if not template:
+                unit.write({'state': 'failed', 'error': 'checks: no posted customer invoice to use as template'})
+                continue
+            runs |= runs.create({'egs_unit_id': unit.id, 'company_id': unit.company_id.id,
+                                 'template_move_id': template.id})
+        runs.action_run()
+        for run in runs.filtered(lambda r: r.state == 'failed'):
+            run.egs_unit_id.write({'state': 'failed', 'error': 'checks: %s/%s documents passed %s' % (
+                run.passed_count, len(run.line_ids) or 6, run.error or '')})
+        return self.filtered(lambda u: u.compliance_run_ids[:1].state == 'passed')
+
+    def _onboarding_report(self):
+        counts = dict((state, 0) for state, label in self._fields['state'].selection)
+        for unit in self:
+            counts[unit.state] += 1
+        message = ', '.join('%s: %s' % (label, counts[state]) for state, label in self._fields['state'].selection)
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': 'ZATCA Onboarding of %s unit(s)' % len(self),
+                'message': message,
+                'type': 'warning' if counts['failed'] else 'success',
+                'sticky': bool(counts['failed']),
+            },
+        }
+
+    def _generate_csr(self):
+        self.ensure_one()
+        if self.csr:
+            return
+        conf = self.env['ir.config_parameter'].sudo()
+        private_key, csr = zatca_csr.generate(
+            country=self.csr_country_name or conf.get_param("csr_country_name", ''),
+            organization_unit=self.csr_organization_unit_name,
+            organization=self.csr_organization_name or conf.get_param("csr_organization_name", ''),
+            common_name=self.csr_common_name,
+            serial_number=self.csr_serial_number,
+            organization_identifier=self.csr_organization_identifier or conf.get_param("csr_organization_identifier", ''),
+            invoice_type=self.csr_invoice_type or conf.get_param("csr_invoice_type", ''),
+            location_address=self.csr_location_address or conf.get_param("csr_location_address", ''),
+            business_category=self.csr_industry_business_category or conf.get_param("csr_industry_business_category", ''),
+        )
+        self.write({'private_key': private_key, 'csr': csr, 'error': False})
+
+    def _onboarding_request(self, step):
+        """Return the url, headers and json body of the onboarding ``step``, 'compliance' or 'production'."""
+        self.ensure_one()
+        link = self.env['ir.config_parameter'].sudo().get_param("zatca_link", DEFAULT_LINK) or DEFAULT_LINK
+        if step == 'compliance':
+            self._generate_csr()
+            if not self.csr_otp:
+                raise exceptions.ValidationError('OTP is missing for EGS unit %s' % self.name)
+            headers = {'accept': 'application/json',
+                       'OTP': self.csr_otp,
+                       'Accept-Version': 'V2',
+                       'Content-Type': 'application/json'}
+            return link + '/compliance', headers, json.dumps({'csr': self.csr})
+        headers = dict(self.env['zatca.einvoice.configuration']._auth_headers(self.compliance_token,
+                                                                               self.compliance_secret))
+        return link + '/production/csids', headers, json.dumps({'compliance_request_id': self.compliance_request_id})
+
+    def _store_csids(self, results, step):
+        """Store the CSIDs answered to ``step``, 'compliance' or 'production', see ``action_onboard``."""
+        for unit in self:
+            status_code, text, error = results.get(unit.id, (None, None, None))
+            if error or status_code != 200:
+                unit.write({'state': 'failed',
+                            'error': '%s: %s' % (step, error or 'HTTP %s %s' % (status_code, text or ''))})
+                continue
+            response = json.loads(text)
+            vals = {
+                'state': step,
+                'error': False,
+                step + '_token': response['binarySecurityToken'],
+                step + '_secret': response['secret'],
+                step + '_request_id': response['requestID'],
+            }
+            if step == 'production':
+                vals['date_onboarded'] = fields.Datetime.now()
+            unit.write(vals)
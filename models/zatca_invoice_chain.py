@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from odoo import fields, models
+
+# BR-KSA-26: PIH of the first invoice, base64 of the SHA-256 of "0"
+INITIAL_PIH = "NWZlY2ViNjZmZmM4NmYzOGQ5NTI3ODZjNmQ2OTZjNzljMmRiYzIzOWRkNGU5MWI0NjcyOWQ3M2EyN2ZiNTdlOQ=="
+
+
+class ZatcaInvoiceChain(models.Model):
+    _name = "zatca.invoice.chain"
+    _description = "ZATCA invoice hash chain head"
+
+    company_id = fields.Many2one('res.company', string='Company', required=True, ondelete='cascade')
+    last_hash = fields.Char('Last Invoice Hash', required=True, default=INITIAL_PIH)
+    last_move_id = fields.Many2one('account.move', string='Last Invoice', ondelete='set null')
+    icv_sequence_id = fields.Many2one('ir.sequence', string='ICV Sequence', ondelete='restrict')
+
+    _sql_constraints = [
+        ('company_uniq', 'unique(company_id)', 'Only one ZATCA invoice chain is allowed per company.'),
+    ]
+
+    def _lock_for_company(self, company):
+        """Return the chain head of ``company``, row locked until the end of the transaction.
+
+        The head is created on first use and seeded with the hash of the last hashed
+        invoice of the company, so existing chains carry on where they stopped.
+        """
+        cr = self.env.cr
+        cr.execute("SELECT id FROM zatca_invoice_chain WHERE company_id = %s FOR UPDATE", [company.id])
+        row = cr.fetchone()
+        if not row:
+            last_move = self.env['account.move'].search([('company_id', '=', company.id),
+                                                         ('zatca_invoice_hash', '!=', False)],
+                                                        order='id desc', limit=1)
+            cr.execute("""
+                INSERT INTO zatca_invoice_chain (company_id, last_hash, last_move_id,
+                                                 create_uid, create_date, write_uid, write_date)
+                VALUES (%s, %s, %s, %s, now() at time zone 'UTC', %s, now() at time zone 'UTC')
+                ON CONFLICT (company_id) DO NOTHING
+            """, [company.id, last_move.zatca_invoice_hash or INITIAL_PIH, last_move.id or None,
+                  self.env.uid, self.env.uid])
+            cr.execute("SELECT id FROM zatca_invoice_chain WHERE company_id = %s FOR UPDATE", [company.id])
+            row = cr.fetchone()
+        return self.browse(row[0])
+
+    def _lock_for_companies(self, companies):
+        """Return the chain heads of ``companies`` by company, see ``_lock_for_company``.
+
+        The rows are locked in company id order: transactions touching several
+        companies take their locks in the same order and wait on each other instead of
+        deadlocking.
+        """
+        return dict((company, self._lock_for_company(company)) for company in companies.sorted('id'))
+
+    def _next_icv(self):
+        """Allocate the next invoice counter value (KSA-16) of the chain company.
+
+        The counter is a standard ``ir.sequence``, i.e. a PostgreSQL sequence, so
+        workers allocate values with ``nextval`` without row locks or cache clearing.
+        """
+        self.ensure_one()
+        if not self.icv_sequence_id:
+            # created once, under the chain row lock; carries on from the former global counter
+            counter = int(self.env['ir.config_parameter'].sudo().get_param('zatca.icv_counter', 0) or 0)
+            self.icv_sequence_id = self.env['ir.sequence'].sudo().create({
+                'name': 'ZATCA ICV %s' % self.company_id.name,
+                'code': 'zatca.icv',
+                'implementation': 'standard',
+                'company_id': self.company_id.id,
+                'number_next': counter + 1,
+                'number_increment': 1,
+                'padding': 0,
+            })
+        return int(self.icv_sequence_id.sudo()._next())
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+import json
+
+from odoo import api, fields, models, tools
+
+# former account.move columns: zatca.invoice.document field
+LEGACY_COLUMNS = [
+    ('zatca_compliance_invoices_api', 'legacy_validation_result'),
+]
+
+
+class ZatcaInvoiceDocument(models.Model):
+    """ZATCA artifacts of one move: generated and cleared XML, last validation results.
+
+    Kept apart from account.move so that reading moves, in lists or reports, does not
+    load them; the move only holds the id of its document.
+    """
+    _name = "zatca.invoice.document"
+    _description = "ZATCA invoice document"
+
+    move_id = fields.Many2one('account.move', required=True, index=True, ondelete='cascade', readonly=1)
+    invoice_blob_id = fields.Many2one('zatca.xml.blob', readonly=1)
+    cleared_blob_id = fields.Many2one('zatca.xml.blob', readonly=1)
+    validation_date = fields.Datetime('Last Submitted On', readonly=1)
+    validation_status = fields.Char(readonly=1)
+    submission_statuses = fields.Text(readonly=1)  # json list of (key, value)
+    validation_result = fields.Html(compute='_compute_validation_result')
+    # HTML stored before the validation messages
+    legacy_validation_result = fields.Html(readonly=1, prefetch=False)
+
+    _sql_constraints = [
+        ('move_uniq', 'unique(move_id)', 'A move has one ZATCA document.'),
+    ]
+
+    @api.depends('validation_date', 'validation_status', 'submission_statuses', 'legacy_validation_result')
+    def _compute_validation_result(self):
+        documents = self.filtered('validation_date')
+        messages = {}
+        if documents:
+            for message in self.env['zatca.validation.message'].sudo().search_read(
+                    [('move_id', 'in', documents.mapped('move_id').ids),
+                     ('date', 'in', list(set(documents.mapped('validation_date'))))],
+                    ['move_id', 'date', 'type', 'code', 'category', 'status', 'message'], order='id'):
+                messages.setdefault((message['move_id'][0], message['date']), []).append(message)
+        for document in self:
+            if document.validation_date:
+                document.validation_result = self.env['zatca.validation.message']._render(
+                    document.validation_status, messages.get((document.move_id.id, document.validation_date), []),
+                    json.loads(document.submission_statuses or '[]'))
+            else:
+                document.validation_result = document.legacy_validation_result
+
+    def init(self):
+        # the artifacts used to be stored on the move itself, move them once
+        cr = self.env.cr
+        if not tools.column_exists(cr, 'account_move', 'zatca_document_id'):
+            return
+        columns = [(column, field) for column, field in LEGACY_COLUMNS
+                   if tools.column_exists(cr, 'account_move', column)]
+        if columns:
+            self._migrate_move_columns(columns)
+        if tools.column_exists(cr, 'account_move', 'xml_sign_char_data'):
+            self._migrate_xml_sign_char_data()
+
+    def _migrate_move_columns(self, columns):
+        cr = self.env.cr
+        cr.execute("""
+            INSERT INTO zatca_invoice_document (move_id, create_uid, create_date, write_uid, write_date)
+                 SELECT m.id, %%(uid)s, now() at time zone 'UTC', %%(uid)s, now() at time zone 'UTC'
+                   FROM account_move m
+                  WHERE (%s)
+                    AND NOT EXISTS (SELECT 1 FROM zatca_invoice_document d WHERE d.move_id = m.id)
+        """ % ' OR '.join('m.%s IS NOT NULL' % column for column, field in columns), {'uid': self.env.uid})
+        cr.execute("""
+            UPDATE zatca_invoice_document d
+               SET %s
+              FROM account_move m
+             WHERE d.move_id = m.id
+        """ % ', '.join('%s = COALESCE(m.%s, d.%s)' % (field, column, field) for column, field in columns))
+        cr.execute("""
+            UPDATE account_move m
+               SET zatca_document_id = d.id
+              FROM zatca_invoice_document d
+             WHERE d.move_id = m.id AND m.zatca_document_id IS NULL
+        """)
+        for column, field in columns:
+            cr.execute('ALTER TABLE account_move DROP COLUMN "%s"' % column)
+
+    def _migrate_xml_sign_char_data(self):
+        # text copy of the generated invoice, computed from the blob since: only the
+        # documents found nowhere else are kept, as blobs, then the column is dropped
+        cr = self.env.cr
+        cr.execute("""
+            SELECT m.id, m.xml_sign_char_data
+              FROM account_move m
+         LEFT JOIN zatca_invoice_document d ON d.move_id = m.id
+             WHERE m.xml_sign_char_data IS NOT NULL AND m.xml_sign_char_data != ''
+               AND d.invoice_blob_id IS NULL
+               AND NOT EXISTS (SELECT 1 FROM ir_attachment a
+                                WHERE a.res_model = 'account.move' AND a.res_field = 'zatca_invoice'
+                                  AND a.res_id = m.id)
+        """)
+        contents = dict((move_id, text.encode('UTF-8')) for move_id, text in cr.fetchall())
+        if contents:
+            blobs = self.env['zatca.xml.blob']._store(list(contents.values()))
+            moves = self.env['account.move'].browse(list(contents))
+            moves._zatca_documents()
+            for move in moves:
+                move.zatca_document_id.invoice_blob_id = blobs[contents[move.id]]
+            moves.flush(['zatca_document_id'])
+            self.flush(['invoice_blob_id'])
+        cr.execute('ALTER TABLE account_move DROP COLUMN "xml_sign_char_data"')
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+
+from odoo import api, fields, models
+
+from ..tools import client, dispatcher
+
+# answers worth another attempt, anything else is final
+RETRY_STATUS_CODES = client.RETRY_STATUS_CODES
+# answers carrying validation results: accepted (202: with warnings) or rejected
+ACCEPTED_STATUS_CODES = (200, 202)
+REJECTED_STATUS_CODE = 400
+# seconds before the first retry, doubled at every attempt and capped
+RETRY_DELAY = 60
+MAX_RETRY_DELAY = 3600
+
+
+class ZatcaSubmission(models.Model):
+    _name = "zatca.submission"
+    _description = "ZATCA submission queue"
+    _order = "id"
+
+    move_id = fields.Many2one('account.move', string='Invoice', required=True, index=True, ondelete='cascade')
+    company_id = fields.Many2one(related='move_id.company_id', store=True)
+    kind = fields.Selection([('compliance', 'Compliance (sandbox)'), ('clearance', 'Clearance'),
+                             ('reporting', 'Reporting')], required=True)
+    state = fields.Selection([('pending', 'Pending'), ('in_flight', 'In flight'), ('done', 'Done'),
+                              ('failed', 'Failed')], default='pending', required=True, index=True)
+    attempts = fields.Integer(default=0)
+    next_attempt = fields.Datetime('Next Attempt', index=True, help="A retried submission is not sent before.")
+    date_start = fields.Datetime('Sent On')
+    date_done = fields.Datetime('Done On')
+    status_code = fields.Integer('HTTP Status')
+    response = fields.Text()
+    error = fields.Text()
+
+    @api.model
+    def _cron_dispatch(self, batch_size=200):
+        """Drain the queue: claim pending submissions by batch and send them concurrently."""
+        conf = self.env['ir.config_parameter'].sudo()
+        max_workers = int(conf.get_param('zatca.queue_max_workers', 4))
+        max_attempts = int(conf.get_param('zatca.queue_max_attempts', 5))
+        # submissions left in flight by an interrupted run go back to the queue
+        self.search([('state', '=', 'in_flight'),
+                     ('date_start', '<', fields.Datetime.now() - timedelta(hours=1))]).write({'state': 'pending'})
+        while True:
+            jobs = self._claim(batch_size)
+            if not jobs:
+                break
+            jobs._generate()
+            # release the chain locks before the HTTP calls
+            self.env.cr.commit()
+            jobs._dispatch(max_workers, max_attempts)
+            self.env.cr.commit()
+
+    @api.model
+    def _claim(self, limit):
+        self.env.cr.execute("""
+            SELECT id FROM zatca_submission
+             WHERE state = 'pending'
+               AND (next_attempt IS NULL OR next_attempt <= now() at time zone 'UTC')
+          ORDER BY id
+             LIMIT %s
+               FOR UPDATE SKIP LOCKED
+        """, [limit])
+        jobs = self.browse([row[0] for row in self.env.cr.fetchall()])
+        if jobs:
+            jobs.write({'state': 'in_flight', 'date_start': fields.Datetime.now()})
+            self.env.cr.commit()
+        return jobs
+
+    @api.model
+    def _settle(self, kind, results):
+        """Close the pending submissions of ``kind`` of moves answered another way, e.g. in batch.
+
+        :param results: dict mapping a move id to a ``(status_code, text, exception)`` tuple
+        """
+        accepted = [move_id for move_id, (status_code, text, error) in results.items()
+                    if not error and status_code in ACCEPTED_STATUS_CODES]
+        rejected = [move_id for move_id, (status_code, text, error) in results.items()
+                    if not error and status_code == REJECTED_STATUS_CODE]
+        for move_ids, vals in ((accepted, {'state': 'done', 'date_done': fields.Datetime.now(), 'error': False}),
+                               (rejected, {'state': 'failed', 'error': 'HTTP %s' % REJECTED_STATUS_CODE})):
+            if move_ids:
+                self.sudo().search([('move_id', 'in', move_ids), ('kind', '=', kind),
+                                    ('state', '=', 'pending')]).write(vals)
+
+    def _generate(self):
+        """Generate the missing XML of the moves, in move order for the PIH chain.
+
+        The chains stay locked until the caller commits, which it does before ``_dispatch``.
+        """
+        # chains locked up front in company order, as by create_xml_files
+        self.env['zatca.invoice.chain'].sudo()._lock_for_companies(
+            self.mapped('move_id').filtered(lambda m: not m.zatca_invoice_name).mapped('company_id'))
+        for job in self.sorted(lambda j: j.move_id.id):
+            if job.move_id._zatca_submitted(job.kind):
+                # reported or cleared meanwhile, by hand or in batch
+                job.write({'state': 'done', 'date_done': fields.Datetime.now(), 'error': False})
+            elif not job.move_id.zatca_invoice_name:
+                try:
+                    with self.env.cr.savepoint():
+                        job.move_id.create_xml_file()
+                except Exception as e:
+                    job.write({'state': 'failed', 'error': str(e), 'attempts': job.attempts + 1})
+
+    def _dispatch(self, max_workers=4, max_attempts=5):
+        """Send the generated XML of the moves, see ``_generate``."""
+        # ORM side: freeze the requests
+        calls = []
+        for job in self.filtered(lambda j: j.state not in ('done', 'failed')):
+            if job.move_id._zatca_submitted(job.kind):
+                job.write({'state': 'done', 'date_done': fields.Datetime.now(), 'error': False})
+                continue
+            try:
+                calls.append((job.id,) + job.move_id._zatca_api_request(job.kind))
+            except Exception as e:
+                job.write({'state': 'failed', 'error': str(e), 'attempts': job.attempts + 1})
+
+        # HTTP side: no ORM access from the worker threads
+        results = dispatcher.dispatch(calls, max_workers, **self.env['zatca.einvoice.configuration']._http_options())
+        retry_delay = int(self.env['ir.config_parameter'].sudo().get_param('zatca.queue_retry_delay', RETRY_DELAY))
+
+        for job in self.browse(list(results)):
+            status_code, text, error = results[job.id]
+            vals = {'attempts': job.attempts + 1, 'status_code': status_code, 'response': text}
+            if error or status_code in RETRY_STATUS_CODES:
+                vals.update(state='pending' if vals['attempts'] < max_attempts else 'failed',
+                            error=str(error) if error else 'HTTP %s' % status_code,
+                            next_attempt=fields.Datetime.now() + timedelta(
+                                seconds=min(retry_delay * 2 ** job.attempts, MAX_RETRY_DELAY)))
+            elif status_code in ACCEPTED_STATUS_CODES or status_code == REJECTED_STATUS_CODE:
+                try:
+                    with self.env.cr.savepoint():
+                        job.move_id._zatca_api_response(job.kind, status_code, text)
+                    if status_code == REJECTED_STATUS_CODE:
+                        # final, the validation messages stored on the move tell why
+                        vals.update(state='failed', error='HTTP %s' % status_code)
+                    else:
+                        vals.update(state='done', date_done=fields.Datetime.now(), error=False)
+                except Exception as e:
+                    vals.update(state='failed', error=str(e))
+            else:
+                vals.update(state='failed', error='HTTP %s' % status_code)
+            job.write(vals)
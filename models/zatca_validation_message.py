@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+import json
+
+from odoo import api, fields, models, tools
+
+# message fields of the ``validationResults`` lists, in display order
+MESSAGE_FIELDS = ('type', 'code', 'category', 'status')
+
+
+class ZatcaValidationMessage(models.Model):
+    """One message of the ``validationResults`` answered by ZATCA to the submission of a move.
+
+    Messages of every submission are kept, ``date`` tells the submission they belong to;
+    the validation results shown on the move are the ones of its last submission.
+    """
+    _name = "zatca.validation.message"
+    _description = "ZATCA validation message"
+    _order = "date desc, id"
+
+    move_id = fields.Many2one('account.move', required=True, index=True, ondelete='cascade', readonly=1)
+    company_id = fields.Many2one(related='move_id.company_id', store=True, index=True)
+    date = fields.Datetime(required=True, index=True, readonly=1)
+    kind = fields.Selection([('compliance', 'Compliance'), ('clearance', 'Clearance'), ('reporting', 'Reporting')],
+                            required=True, readonly=1)
+    type = fields.Char(readonly=1)
+    code = fields.Char(index=True, readonly=1)
+    category = fields.Char(readonly=1)
+    status = fields.Char(index=True, readonly=1)
+    message = fields.Text(readonly=1)
+
+    def init(self):
+        # "which codes hit the most invoices over a period"
+        tools.create_index(self.env.cr, 'zatca_validation_message_code_date_index', self._table,
+                           ['code', 'date', 'move_id'])
+
+    @api.model
+    def _store(self, answers):
+        """Store the validation results of answers to submissions, with one create for all messages.
+
+        :param answers: list of ``(move, kind, response, status_keys)``, ``response`` the decoded
+            json answer and ``status_keys`` the keys of the statuses shown with the results
+        """
+        date = fields.Datetime.now()
+        self.env['account.move'].concat(*[move for move, kind, response, status_keys in answers])._zatca_documents()
+        vals_list = []
+        for move, kind, response, status_keys in answers:
+            validation_status, messages = self._parse(response)
+            vals_list.extend(dict(message, move_id=move.id, kind=kind, date=date) for message in messages)
+            move._zatca_documents().write({
+                'validation_date': date,
+                'validation_status': validation_status,
+                'submission_statuses': json.dumps(
+                    [(key, response.get(key)) for key in status_keys if key != 'clearedInvoice']),
+            })
+        return self.sudo().create(vals_list)
+
+    @api.model
+    def _parse(self, response):
+        """Return the overall status and the messages of the ``validationResults`` of a response."""
+        validation_status = None
+        messages = []
+        for key, value in (response.get('validationResults') or {}).items():
+            if isinstance(value, list):
+                for val in value:
+                    message = dict((name, val.get(name) and str(val[name])) for name in MESSAGE_FIELDS)
+                    message['message'] = val.get('message') and str(val['message'])
+                    messages.append(message)
+            elif key == 'status':
+                validation_status = value
+        return validation_status, messages
+
+    @api.model
+    def _render(self, validation_status, messages, statuses):
+        """Return the HTML table of validation results.
+
+        :param messages: list of dicts with the message fields
+        :param statuses: list of ``(key, value)`` submission statuses shown below the messages
+        """
+        escape = tools.html_escape
+        rows = ["<table style='width:100%'>", "<tr><td  colspan='6'><b>validationResults</b></td></tr>"]
+        for qty, val in enumerate(messages, 1):
+            color = 'green' if str(val['status']).lower() == 'pass' else 'red'
+            cell = "<td  style='border: 1px solid black;color: %s;'>%%s</td>" % color
+            rows.append("<tr><td colspan='2' style='border: 1px solid black;'>%s</td>%s</tr>" % (
+                qty, ''.join("<td  style='border: 1px solid black;'><b>%s</b></td>" % name for name in MESSAGE_FIELDS)))
+            rows.append("<tr><td  style='border: 1px solid black;' colspan='2'></td>%s</tr>" % ''.join(
+                cell % escape(val[name] or '') for name in MESSAGE_FIELDS))
+            rows.append("<tr><td colspan='2'  style='border: 1px solid black;'><b>message</b></td>"
+                        "<td colspan='4'  style='border: 1px solid black;color: %s;'>%s</td></tr>"
+                        % (color, escape(val['message'] or '')))
+        rows.append("<tr><td>status</td><td colspan='3'>%s</td></tr>" % escape(validation_status or ''))
+        for key, value in statuses:
+            rows.append("<tr><td colspan='2'><b>%s</b></td><td colspan='4'>%s</td></tr>" % (escape(key), escape(str(value))))
+        rows.append("</table>")
+        return ''.join(rows)
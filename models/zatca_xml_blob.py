@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+import base64
+import gzip
+import hashlib
+
+from odoo import api, fields, models
+
+
+class ZatcaXmlBlob(models.Model):
+    """One gzip compressed XML document, addressed by the SHA-256 of its content.
+
+    The compressed bytes live in the filestore, the row only keeps the checksum and
+    the sizes, so documents never weigh on the reads of the records referring to them.
+    """
+    _name = "zatca.xml.blob"
+    _description = "ZATCA XML document"
+
+    checksum = fields.Char(required=True, index=True, readonly=1)
+    data = fields.Binary(attachment=True, readonly=1)
+    size = fields.Integer(readonly=1)
+    compressed_size = fields.Integer(readonly=1)
+
+    _sql_constraints = [
+        ('checksum_uniq', 'unique(checksum)', 'ZATCA XML documents are stored once.'),
+    ]
+
+    @api.model
+    def _store(self, contents):
+        """Return the blobs of raw XML ``contents``, as a dict keyed by content; missing ones are created."""
+        by_checksum = {hashlib.sha256(content).hexdigest(): content for content in contents}
+        blobs = {blob.checksum: blob for blob in self.sudo().search([('checksum', 'in', list(by_checksum))])}
+        vals_list = []
+        for checksum, content in by_checksum.items():
+            if checksum not in blobs:
+                compressed = gzip.compress(content)
+                vals_list.append({'checksum': checksum, 'data': base64.b64encode(compressed),
+                                  'size': len(content), 'compressed_size': len(compressed)})
+        for blob in self.sudo().create(vals_list):
+            blobs[blob.checksum] = blob
+        return {content: blobs[checksum] for checksum, content in by_checksum.items()}
+
+    def _content(self):
+        """Return the raw XML of the blob."""
+        self.ensure_one()
+        return gzip.decompress(base64.b64decode(self.sudo().with_context(bin_size=False).data))
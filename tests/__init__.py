@@ -0,0 +1,11 @@
+# -*- coding: utf-8 -*-
+
+from . import test_zatca_invoice_chain
+from . import test_zatca_submission
+from . import test_totals
+from . import test_money
+from . import test_ubl
+from . import test_hashing
+from . import test_signing
+from . import test_pool
+from . import test_zatca_generation
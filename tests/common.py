@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""Plain invoice data and keys for the tests of the ``tools`` modules, no ORM involved."""
+import time
+
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+ADDRESS = {
+    'street': 'King Fahd Road',
+    'street2': 'Olaya Towers',
+    'building_no': '1234',
+    'additional_no': '5678',
+    'district': 'Olaya',
+    'city': 'Riyadh',
+    'zip': '12345',
+    'state': 'Riyadh',
+    'country': 'SA',
+}
+
+
+def invoice_data(lines=1, icv=1, previous_hash='NWZlY2ViNjZmZmM4NmYzOGQ5NTI3ODZjNmQ2OTZjNzljMmRiYzIzOWRkNGU5MWI0NjcyOWQ3M2EyN2ZiNTdlOQ=='):
+    """Return the data of a standard tax invoice of ``lines`` lines, as ``_zatca_prepare_invoice_data`` does."""
+    invoice_lines = [{
+        'id': index,
+        'bt_129': '2.0',
+        'bt_131': '200.00',
+        'bt_136': '10.00' if index % 2 else None,
+        'tax_total': 1,
+        'ksa_11': '30.00',
+        'ksa_12': '230.00',
+        'name': 'Product %s' % index,
+        'item_identification': ('GTIN', '62800%08d' % index) if index % 3 == 0 else False,
+        'bt_151': 'S',
+        'bt_152': '15.00',
+        'bt_146': '105.0',
+        'bt_149': '1',
+    } for index in range(1, lines + 1)]
+    return {
+        'signature': {
+            'signature_method': 'http://www.w3.org/2001/04/xmldsig-more#ecdsa-sha256',
+            'invoice_digest': '',
+            'signed_properties_digest': '',
+            'signature_value': '',
+            'certificate': 'MIID3jCCA4SgAwIBAgITEQAAOAPF90Ajs/xcXwABAAA4AzAKBggqhkjOPQQDAjBi',
+            'signing_time': '2024-01-01T10:00:00Z',
+            'certificate_digest': 'ZDMwMmI0MTE1NzVjOTU2NTk4YzVlODhhYmI0ODU2NDUyNTU2YTVhYjhhMDFmN2FjYjk1YTA2OWQ0NjY2MjQ4NQ==',
+            'issuer': 'CN=TSZEINVOICE-SubCA-1, DC=extgazt, DC=gov, DC=local',
+            'serial_number': '379112742831380471835263969587287663520528387',
+        },
+        'bt_1': 'INV/2024/%05d' % icv,
+        'uuid': '8e6000cf-1a98-4174-b3e7-%012d' % icv,
+        'issue_date': '2024-01-01',
+        'issue_time': '10:00:00',
+        'due_date': '2024-01-31',
+        'ksa_2': '0100000',
+        'bt_3': '388',
+        'order_reference': False,
+        'billing_references': [],
+        'ksa_16': icv,
+        'ksa_13': previous_hash,
+        'qr': 'AQVTZWxsZXICDzMwMDAwMDAwMDAwMDAwMw==',
+        'seller': {
+            'identification': 'CRN',
+            'identification_no': '1010010000',
+            'address': ADDRESS,
+            'tax_scheme': True,
+            'vat': '300000000000003',
+            'registration_name': 'Seller Co.',
+        },
+        'buyer': {
+            'identification': 'NAT',
+            'identification_no': '2345',
+            'address': dict(ADDRESS, additional_no=False),
+            'tax_scheme': True,
+            'vat': '399999999900003',
+            'registration_name': 'Buyer Co.',
+        },
+        'delivery_date': '2024-01-01',
+        'payment_means': {'code': '10', 'instruction_note': False},
+        'lines': invoice_lines,
+        'tax_subtotals': [{'bt_116': '%.2f' % (lines * 200), 'bt_117': '%.2f' % (lines * 30), 'bt_118': 'S',
+                           'bt_119': '15.00', 'bt_120': None, 'bt_121': None}],
+        'bt_106': '%.2f' % (lines * 200),
+        'bt_109': '%.2f' % (lines * 200),
+        'bt_110': '%.2f' % (lines * 30),
+        'bt_111': '%.2f' % (lines * 30),
+        'bt_112': '%.2f' % (lines * 230),
+        'bt_113': False,
+        'bt_115': '%.2f' % (lines * 230),
+    }
+
+
+def private_key_value():
+    """Return a new EGS private key, PEM."""
+    private_key = ec.generate_private_key(ec.SECP256K1(), default_backend())
+    return private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                     serialization.NoEncryption()).decode()
+
+
+def best_time(function, *args, repeat=3):
+    """Return the best wall time of ``repeat`` calls of ``function``, in seconds."""
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
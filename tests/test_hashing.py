@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+"""Invoice hash: the stylesheet and the C14N paths, on documents built by ``tools.ubl``.
+
+The timings are logged; run with
+``--log-handler=odoo.addons.invoice_zatca_integrations.tests.test_hashing:INFO``.
+"""
+import logging
+
+from odoo.tests import common, tagged
+
+from ..tools import hashing, signing, ubl
+from .common import best_time, invoice_data
+
+_logger = logging.getLogger(__name__)
+
+LINES = (1, 100, 1000)
+
+
+def signed_document(lines):
+    root = ubl.build_invoice(invoice_data(lines))
+    signing.fill_signature(root, 'SW52b2ljZUhhc2g=', 'U2lnbmF0dXJlVmFsdWU=')
+    return root
+
+
+@tagged('post_install', '-at_install')
+class TestHashing(common.TransactionCase):
+
+    def test_same_digest(self):
+        for lines in LINES:
+            root = signed_document(lines)
+            digest, transformed = hashing.hash_xslt(root)
+            self.assertEqual(hashing.hash_c14n(root), (digest, transformed))
+            self.assertNotIn(b'UBLExtensions', transformed)
+            self.assertNotIn(b'AQVTZWxsZXICDzMwMDAwMDAwMDAwMDAwMw==', transformed)
+
+    def test_c14n_keeps_tree(self):
+        root = signed_document(3)
+        document = ubl.serialize(root)
+        hashing.hash_c14n(root)
+        self.assertEqual(ubl.serialize(root), document)
+        hashing.hash_c14n(root, keep=False)
+        self.assertEqual(ubl.serialize(root), document)
+
+    def test_benchmark(self):
+        for lines in LINES:
+            root = signed_document(lines)
+            xslt_time = best_time(hashing.hash_xslt, root)
+            c14n_time = best_time(hashing.hash_c14n, root, False)
+            _logger.info("%s lines: xslt %.2f ms, c14n %.2f ms", lines, xslt_time * 1000, c14n_time * 1000)
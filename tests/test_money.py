@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from odoo.tests import common, tagged
+
+from ..tools import money
+
+
+@tagged('post_install', '-at_install')
+class TestMoney(common.TransactionCase):
+
+    def test_plain(self):
+        # quantities and unit prices keep their decimals, never in exponent notation
+        for value, text in [(1e-05, '0.00001'), (-1e-07, '-0.0000001'), (1.0, '1.0'), (1, '1'),
+                            (12.375, '12.375'), (1e+22, '10000000000000000000000')]:
+            self.assertEqual(money.plain(value), text)
+
+    def test_format(self):
+        self.assertEqual([money.format(money.to_halalas(value)) for value in (1e-05, 0.005, 0.015, 1234.5)],
+                         ['0.00', '0.00', '0.02', '1234.50'])
@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+"""Process pool generation against the serial one: same hash chain, same documents.
+
+Both functions below follow ``account.move._zatca_generate_serial`` and
+``_zatca_generate_parallel`` without the ORM. Both are timed, the timings are logged;
+run with ``--log-handler=odoo.addons.invoice_zatca_integrations.tests.test_pool:INFO``.
+"""
+import base64
+import logging
+import multiprocessing
+import re
+import time
+
+import lxml.etree as ET
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.asymmetric import ec
+from odoo.tests import common, tagged
+
+from ..models.zatca_invoice_chain import INITIAL_PIH
+from ..tools import hashing, pool, signing, ubl
+from .common import invoice_data, private_key_value
+
+_logger = logging.getLogger(__name__)
+
+INVOICES = 200
+LINES = 10
+SIGNATURE_VALUE = re.compile(b'<ds:SignatureValue>[^<]*</ds:SignatureValue>')
+
+
+def serial(invoices, method, signer, previous_hash=INITIAL_PIH):
+    """Return the ``(previous hash, invoice hash, hashed document, document)`` of each invoice."""
+    generated = []
+    for data in invoices:
+        root = ubl.build_invoice(dict(data, ksa_13=previous_hash))
+        invoice_hash, hash_xml = hashing.invoice_hash(root, method)
+        signing.sign_invoice(root, invoice_hash, signer)
+        generated.append((previous_hash, invoice_hash, hash_xml, ubl.serialize(root)))
+        previous_hash = invoice_hash
+    return generated
+
+
+def pooled(executor, processes, invoices, method, signer, previous_hash=INITIAL_PIH):
+    """Same as ``serial``, with the CPU bound work done by ``executor``."""
+    chunksize = pool.chunksize(len(invoices), processes)
+    rendered = executor.map(pool.render, [(data, method) for data in invoices], chunksize=chunksize)
+    hashed = []
+    for hash_parts, document_parts in rendered:
+        invoice_hash, hash_xml = pool.chain_hash(hash_parts, previous_hash)
+        hashed.append((previous_hash, invoice_hash, hash_xml, document_parts))
+        previous_hash = invoice_hash
+    signatures = executor.map(pool.sign, [(entry[1], signer.value) for entry in hashed], chunksize=chunksize)
+    return [(previous, invoice_hash, hash_xml, pool.complete(document_parts, previous, invoice_hash, signature_value))
+            for (previous, invoice_hash, hash_xml, document_parts), signature_value in zip(hashed, signatures)]
+
+
+@tagged('post_install', '-at_install')
+class TestPool(common.TransactionCase):
+
+    def setUp(self):
+        super(TestPool, self).setUp()
+        self.signer = signing.parse(private_key_value())
+
+    def _check_signature(self, document, invoice_hash):
+        root = ET.fromstring(document)
+        signature_value = root.find('.//' + ubl.DS + 'Signature').findtext(ubl.DS + 'SignatureValue')
+        self.signer.private_key.public_key().verify(base64.b64decode(signature_value), base64.b64decode(invoice_hash),
+                                                    ec.ECDSA(hashes.SHA256()))
+        # the final document hashes to its invoice hash
+        self.assertEqual(hashing.invoice_hash(root)[0], invoice_hash)
+
+    def test_equivalence(self):
+        invoices = [invoice_data(3, icv) for icv in range(1, 21)]
+        for method in hashing.HASH_METHODS:
+            expected = serial(invoices, method, self.signer)
+            with pool.executor(2) as executor:
+                result = pooled(executor, 2, invoices, method, self.signer)
+            self.assertEqual([entry[:3] for entry in result], [entry[:3] for entry in expected])
+            for (previous, invoice_hash, hash_xml, document), entry in zip(result, expected):
+                # ECDSA signatures are randomized: the documents differ by their signature value only
+                self.assertEqual(SIGNATURE_VALUE.sub(b'', document), SIGNATURE_VALUE.sub(b'', entry[3]))
+                self._check_signature(document, invoice_hash)
+
+    def test_throughput(self):
+        invoices = [invoice_data(LINES, icv) for icv in range(1, INVOICES + 1)]
+        processes = max(multiprocessing.cpu_count(), 2)
+        start = time.perf_counter()
+        expected = serial(invoices, 'c14n', self.signer)
+        serial_time = time.perf_counter() - start
+        with pool.executor(processes) as executor:
+            start = time.perf_counter()
+            result = pooled(executor, processes, invoices, 'c14n', self.signer)
+            pooled_time = time.perf_counter() - start
+        self.assertEqual(result[-1][1], expected[-1][1])
+        _logger.info("%s invoices of %s lines: serial %.0f invoices/s, pool of %s processes %.0f invoices/s",
+                     INVOICES, LINES, INVOICES / serial_time, processes, INVOICES / pooled_time)
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""Invoice signature with the EGS secp256k1 key, and its throughput.
+
+The signatures per second are logged; run with
+``--log-handler=odoo.addons.invoice_zatca_integrations.tests.test_signing:INFO``.
+"""
+import base64
+import hashlib
+import logging
+import time
+
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from odoo.tests import common, tagged
+
+from ..tools import hashing, signing, ubl
+from .common import invoice_data, private_key_value
+
+_logger = logging.getLogger(__name__)
+
+SIGNATURES = 1000
+
+
+@tagged('post_install', '-at_install')
+class TestSigning(common.TransactionCase):
+
+    def setUp(self):
+        super(TestSigning, self).setUp()
+        self.signer = signing.parse(private_key_value())
+        self.public_key = self.signer.private_key.public_key()
+
+    def test_load(self):
+        self.assertIs(signing.load(self.signer.value), signing.load(self.signer.value))
+        self.assertIsNone(signing.load(False))
+        # bare base64 DER, as pasted from the CSR tooling
+        der = base64.b64encode(self.signer.private_key.private_bytes(
+            serialization.Encoding.DER, serialization.PrivateFormat.TraditionalOpenSSL,
+            serialization.NoEncryption())).decode()
+        self.assertEqual(signing.parse(der).private_key.private_numbers(), self.signer.private_key.private_numbers())
+
+    def test_sign_invoice(self):
+        root = ubl.build_invoice(invoice_data(2))
+        invoice_hash = hashing.invoice_hash(root)[0]
+        signing.sign_invoice(root, invoice_hash, self.signer)
+        # the signature is outside of the hashed document
+        self.assertEqual(hashing.invoice_hash(root)[0], invoice_hash)
+        signature = root.find('.//' + ubl.DS + 'Signature')
+        self.public_key.verify(base64.b64decode(signature.findtext(ubl.DS + 'SignatureValue')),
+                               base64.b64decode(invoice_hash), ec.ECDSA(hashes.SHA256()))
+        digests = [reference.findtext(ubl.DS + 'DigestValue') for reference in signature.iter(ubl.DS + 'Reference')]
+        self.assertEqual(digests[0], invoice_hash)
+        self.assertEqual(digests[1], signing.signed_properties_digest(
+            signature.find('.//' + ubl.XADES + 'SignedProperties')))
+
+    def test_throughput(self):
+        invoice_hashes = [base64.b64encode(hashlib.sha256(b'%d' % index).digest()).decode()
+                          for index in range(SIGNATURES)]
+        start = time.perf_counter()
+        signature_values = [self.signer.sign(invoice_hash) for invoice_hash in invoice_hashes]
+        elapsed = time.perf_counter() - start
+        _logger.info("%s signatures in %.1f ms: %.0f signatures/s", SIGNATURES, elapsed * 1000,
+                     SIGNATURES / elapsed)
+        for invoice_hash, signature_value in zip(invoice_hashes[:10], signature_values):
+            self.public_key.verify(base64.b64decode(signature_value), base64.b64decode(invoice_hash),
+                                   ec.ECDSA(hashes.SHA256()))
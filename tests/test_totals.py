@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""Totals engine against the former per-line float computation, on a 10,000 lines invoice.
+
+The legacy function below is the loop ``_zatca_prepare_invoice_data`` ran before
+``tools.totals``, kept as is for the comparison. Both are timed, the timings are
+logged; run with ``--log-handler=odoo.addons.invoice_zatca_integrations.tests.test_totals:INFO``.
+"""
+import logging
+import random
+import time
+from decimal import Decimal
+
+from odoo.tests import common, tagged
+
+from ..tools import money, totals
+
+_logger = logging.getLogger(__name__)
+
+LINES = 10000
+SEEDS = (1, 2, 3)
+
+
+def legacy(lines, prepaid):
+    """Return the line amounts, the VAT breakdown and the totals the way they were computed, as floats."""
+    bg_23 = {}
+    amounts = []
+    bt_106 = float(round(Decimal(str(0)), 2))
+    for quantity, price, discount, category, percent in lines:
+        if discount:
+            bt_137 = float(round(Decimal(str(price * quantity)), 2))
+            bt_136 = float(round(Decimal(str(bt_137 * discount / 100)), 2))
+        else:
+            bt_136 = float(round(Decimal(str(0)), 2))
+        bt_131 = float(round(Decimal(str(((price / 1) * quantity))), 2))
+        bt_131 -= float(round(Decimal(str(bt_136)), 2))
+        bt_131 = float(round(Decimal(str(bt_131)), 2))
+        bt_106 += float(round(Decimal(str(bt_131)), 2))
+        bt_106 = float(round(Decimal(str(bt_106)), 2))
+        bt_152 = float(round(Decimal(str(percent)), 2))
+        bt_152 = 100 if bt_152 > 100 else (0 if bt_152 < 0 else bt_152)
+        if category != 'S':
+            bt_152 = 0
+        bg_23.setdefault(category, {'bt_116': 0, 'bt_119': bt_152})
+        bg_23[category]['bt_116'] += bt_131
+        ksa_11 = float(round(Decimal(str(bt_131 * bt_152 / 100)), 2))
+        ksa_12 = float(round(Decimal(str(bt_131 + ksa_11)), 2))
+        amounts.append((bt_131, bt_136, ksa_11, ksa_12, bt_152))
+    bt_110 = 0.0
+    subtotals = []
+    for category, values in bg_23.items():
+        bt_116 = float(round(Decimal(str(values['bt_116'])), 2))
+        bt_117 = float(round(Decimal(str(bt_116 * (values['bt_119'] / 100))), 2)) if category == 'S' else 0.0
+        bt_110 += bt_117
+        subtotals.append((category, values['bt_119'], bt_116, bt_117))
+    bt_109 = float(round(Decimal(str(bt_106 - 0)), 2))
+    bt_112 = float(round(Decimal(str(bt_109 + bt_110)), 2))
+    bt_113 = float(round(Decimal(str(prepaid)), 2))
+    return amounts, subtotals, (bt_106, bt_109, bt_110, bt_112, bt_113)
+
+
+def random_lines(seed, count=LINES):
+    """Return ``(quantity, price, discount, category, percent)`` lines, one VAT rate for all."""
+    generator = random.Random(seed)
+    return [(generator.choice([1, 2, 3, 0.5, 1.25, 7, 12.375, 100]),
+             round(generator.uniform(0.01, 5000), generator.choice([2, 2, 3, 4])),
+             generator.choice([0, 0, 0, 5, 10, 12.5, 33.33]),
+             generator.choice('SSSSZEO'), 15.0) for i in range(count)]
+
+
+def is_tie(value):
+    """Whether the exact ``value``, in SAR, is half way between two halalas."""
+    return (value * 1000) % 10 == 5 and (value * 1000) == int(value * 1000)
+
+
+@tagged('post_install', '-at_install')
+class TestTotals(common.TransactionCase):
+
+    def _compare(self, seed):
+        lines = random_lines(seed)
+        start = time.perf_counter()
+        expected = legacy(lines, 123.45)
+        legacy_time = time.perf_counter() - start
+        start = time.perf_counter()
+        result = totals.compute(*zip(*lines), prepaid=money.to_halalas(123.45))
+        engine_time = time.perf_counter() - start
+
+        differences = []
+        for (quantity, price, discount, category, percent), old, new in zip(lines, expected[0], result.lines):
+            old = tuple(money.to_halalas(value) for value in old)
+            if old == tuple(new):
+                continue
+            differences.append((quantity, price, discount, old, tuple(new)))
+            # at most 1 halala on each rounded amount, 2 on their sum KSA-12
+            self.assertLessEqual(max(abs(a - b) for a, b in zip(old[:3], new[:3])), 1)
+            self.assertLessEqual(abs(old[3] - new[3]), 2)
+            # the float product tipped an exact tie the legacy way: one of the exact amounts is one
+            gross = Decimal(str(price)) * Decimal(str(quantity))
+            gross_halalas = money.line_amount(price, quantity)
+            exact = [gross, Decimal(gross_halalas) / 100 * Decimal(str(discount)) / 100,
+                     Decimal(new.bt_131) / 100 * new.bt_152 / 10000]
+            self.assertTrue(any(is_tie(value) for value in exact),
+                            "line %s x %s, %s %% differs without a tie: %s / %s" % (quantity, price, discount,
+                                                                                   old, tuple(new)))
+        # totals differ by the differences of the lines only
+        self.assertLessEqual(abs(money.to_halalas(expected[2][0]) - result.bt_106), len(differences))
+        self.assertLess(len(differences), LINES / 100)
+        _logger.info("seed %s: %s of %s lines differ by rounding ties, legacy %.1f ms, engine %.1f ms",
+                     seed, len(differences), LINES, legacy_time * 1000, engine_time * 1000)
+        for difference in differences[:5]:
+            _logger.info("quantity %s, price %s, discount %s: legacy %s, engine %s", *difference)
+        return differences
+
+    def test_cross_check(self):
+        for seed in SEEDS:
+            self._compare(seed)
+
+    def test_breakdown_rounding(self):
+        # BR-S-09: the VAT of the breakdown is computed on its sum, not summed from the lines
+        result = totals.compute([1, 1, 1], [0.05, 0.05, 0.05], [0, 0, 0], 'SSS', [15, 15, 15])
+        self.assertEqual([line.ksa_11 for line in result.lines], [1, 1, 1])
+        self.assertEqual([(subtotal.bt_116, subtotal.bt_117) for subtotal in result.subtotals], [(15, 2)])
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""UBL renderer scaling, from 1 to 5,000 invoice lines.
+
+The timings are logged; run with
+``--log-handler=odoo.addons.invoice_zatca_integrations.tests.test_ubl:INFO``.
+"""
+import logging
+
+import lxml.etree as ET
+from odoo.tests import common, tagged
+
+from ..tools import ubl
+from .common import best_time, invoice_data
+
+_logger = logging.getLogger(__name__)
+
+LINES = (1, 10, 100, 1000, 5000)
+
+
+@tagged('post_install', '-at_install')
+class TestUbl(common.TransactionCase):
+
+    def test_render(self):
+        root = ET.fromstring(ubl.render(invoice_data(3)))
+        self.assertEqual(len(root.findall(ubl.CAC + 'InvoiceLine')), 3)
+        self.assertEqual(root.findtext(ubl.CBC + 'ID'), 'INV/2024/00001')
+        self.assertEqual(root.find('.//' + ubl.DS + 'Signature').get('Id'), 'signature')
+
+    def test_scaling(self):
+        per_line = {}
+        for lines in LINES:
+            data = invoice_data(lines)
+            elapsed = best_time(ubl.render, data)
+            per_line[lines] = elapsed / lines
+            _logger.info("%s lines: %.2f ms, %.1f us per line", lines, elapsed * 1000, per_line[lines] * 1e6)
+        # linear: the cost of a line does not grow with the number of lines
+        self.assertLess(per_line[5000], per_line[100] * 3)
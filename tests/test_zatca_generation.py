@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.tests import tagged
+
+
+@tagged('post_install', '-at_install')
+class TestZatcaGeneration(AccountTestInvoicingCommon):
+    """Which moves ``create_xml_files`` generates again, see ``_zatca_prepare_changed``."""
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref='l10n_sa.sa_chart_template_standard'):
+        super(TestZatcaGeneration, cls).setUpClass(chart_template_ref=chart_template_ref)
+
+    def setUp(self):
+        super(TestZatcaGeneration, self).setUp()
+        # the document inputs of each move, as _zatca_prepare_invoice_data would collect them
+        self.inputs = {}
+        Move = type(self.env['account.move'])
+        patches = [
+            patch.object(Move, '_zatca_prepare_invoice_data', autospec=True,
+                         side_effect=lambda move, *args: {'bt_1': move.id, 'inputs': self.inputs[move.id]}),
+            patch.object(Move, '_zatca_certificate_values', autospec=True, return_value={'digest': 'certificate'}),
+        ]
+        self.prepare_invoice_data = patches[0].start()
+        patches[1].start()
+        for function in patches:
+            self.addCleanup(function.stop)
+
+    def _posted_invoice(self, generated=True):
+        invoice = self.env['account.move'].create({
+            'move_type': 'out_invoice',
+            'partner_id': self.partner_a.id,
+            'invoice_date': fields.Date.today(),
+            'invoice_line_ids': [(0, 0, {'product_id': self.product_a.id, 'price_unit': 100.0,
+                                         'tax_ids': [(6, 0, self.tax_sale_a.ids)]})],
+        })
+        invoice.action_post()
+        self.inputs[invoice.id] = 'price 100'
+        if generated:
+            invoice._zatca_prepare_changed(0, {})
+            invoice.zatca_invoice_name = 'stub.xml'
+        return invoice
+
+    def _prepared(self, invoice):
+        return list(invoice._zatca_prepare_changed(0, {}))
+
+    def test_unchanged_skipped(self):
+        invoice = self._posted_invoice(generated=False)
+        self.assertEqual(self._prepared(invoice), [invoice.id])
+        self.assertTrue(invoice.zatca_input_fingerprint)
+        invoice.zatca_invoice_name = 'stub.xml'
+        self.assertEqual(self._prepared(invoice), [], "unchanged inputs must keep the document")
+
+    def test_changed_regenerated(self):
+        invoice = self._posted_invoice()
+        fingerprint = invoice.zatca_input_fingerprint
+        self.inputs[invoice.id] = 'price 120'
+        self.assertEqual(self._prepared(invoice), [invoice.id])
+        self.assertNotEqual(invoice.zatca_input_fingerprint, fingerprint)
+
+    def test_submitted_never_regenerated(self):
+        reported = self._posted_invoice()
+        reported.zatca_reporting_status = 'REPORTED'
+        cleared = self._posted_invoice()
+        xml = b'<Invoice/>'
+        cleared._zatca_documents().cleared_blob_id = self.env['zatca.xml.blob']._store([xml])[xml]
+        sending = self._posted_invoice()
+        self.env['zatca.submission'].create({'move_id': sending.id, 'kind': 'reporting', 'state': 'in_flight'})
+        moves = reported | cleared | sending
+        for move in moves:
+            self.inputs[move.id] = 'price 120'
+        self.prepare_invoice_data.reset_mock()
+        self.assertEqual(self._prepared(moves), [], "ZATCA holds these documents, their ICV and hash")
+        self.assertFalse(self.prepare_invoice_data.called)
+
+    def test_missing_fingerprint_backfilled(self):
+        invoice = self._posted_invoice()
+        fingerprint = invoice.zatca_input_fingerprint
+        # generated before the fingerprints
+        invoice.zatca_input_fingerprint = False
+        self.assertEqual(self._prepared(invoice), [], "a document without fingerprint is kept")
+        self.assertEqual(invoice.zatca_input_fingerprint, fingerprint)
+        self.inputs[invoice.id] = 'price 120'
+        self.assertEqual(self._prepared(invoice), [invoice.id])
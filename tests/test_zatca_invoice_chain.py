@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+import threading
+
+from odoo import SUPERUSER_ID, api
+from odoo.tests import common, tagged
+
+
+@tagged('post_install', '-at_install')
+class TestZatcaInvoiceChain(common.TransactionCase):
+    """ICV allocation (KSA-16) from concurrent transactions, each on its own cursor.
+
+    The chain and its sequence are committed, so that the other cursors see them, and
+    removed again at the end of the test.
+    """
+    workers = 8
+    allocations = 25
+
+    def setUp(self):
+        super(TestZatcaInvoiceChain, self).setUp()
+        with self.registry.cursor() as cr:
+            env = api.Environment(cr, SUPERUSER_ID, {})
+            company = env['res.company'].create({'name': 'ZATCA ICV concurrency'})
+            chain = env['zatca.invoice.chain']._lock_for_company(company)
+            self.first_icv = chain._next_icv()
+            self.chain_id = chain.id
+        self.addCleanup(self._remove_chain)
+
+    def _remove_chain(self):
+        with self.registry.cursor() as cr:
+            chain = api.Environment(cr, SUPERUSER_ID, {})['zatca.invoice.chain'].browse(self.chain_id)
+            sequence, company = chain.icv_sequence_id, chain.company_id
+            partner = company.partner_id
+            chain.unlink()
+            sequence.unlink()
+            company.unlink()
+            partner.unlink()
+
+    def _allocate(self, lock):
+        """Allocate ICVs from ``workers`` threads at once, return them all."""
+        barrier = threading.Barrier(self.workers)
+        values = []
+        errors = []
+
+        def allocate():
+            try:
+                with self.registry.cursor() as cr:
+                    chains = api.Environment(cr, SUPERUSER_ID, {})['zatca.invoice.chain']
+                    chain = chains.browse(self.chain_id)
+                    barrier.wait(timeout=30)
+                    if lock:
+                        chain = chains._lock_for_company(chain.company_id)
+                    allocated = [chain._next_icv() for i in range(self.allocations)]
+                values.extend(allocated)
+            except Exception as e:
+                barrier.abort()
+                errors.append(e)
+
+        threads = [threading.Thread(target=allocate) for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertFalse(errors)
+        return values
+
+    def test_next_icv_concurrent(self):
+        values = self._allocate(lock=False)
+        self.assertEqual(len(values), self.workers * self.allocations)
+        self.assertEqual(len(set(values)), len(values), "an ICV was allocated twice")
+        self.assertTrue(all(value > self.first_icv for value in values))
+
+    def test_next_icv_concurrent_locked(self):
+        # as create_xml_files does: chain head locked, then ICVs allocated
+        values = self._allocate(lock=True)
+        self.assertEqual(sorted(values), list(range(self.first_icv + 1,
+                                                    self.first_icv + 1 + self.workers * self.allocations)))
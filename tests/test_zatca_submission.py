@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+import http.server
+import json
+import threading
+import uuid
+from unittest.mock import patch
+
+from odoo import fields
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.tests import tagged
+
+
+class StubGatewayHandler(http.server.BaseHTTPRequestHandler):
+    """ZATCA gateway stand-in: answers the ``(status, json)`` set for the request path."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers['Content-Length']))
+        self.server.requests.append((self.path, json.loads(body)))
+        status, answer = self.server.answers[self.path]
+        payload = json.dumps(answer).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@tagged('post_install', '-at_install')
+class TestZatcaSubmission(AccountTestInvoicingCommon):
+    """Submission queue against a local stub of the ZATCA gateway."""
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref='l10n_sa.sa_chart_template_standard'):
+        super(TestZatcaSubmission, cls).setUpClass(chart_template_ref=chart_template_ref)
+        cls.server = http.server.HTTPServer(('127.0.0.1', 0), StubGatewayHandler)
+        cls.server.answers = {}
+        cls.server.requests = []
+        cls.server_thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.server_thread.start()
+        url = 'http://127.0.0.1:%s' % cls.server.server_port
+        cls.env['zatca.einvoice.configuration'].create({
+            'company_id': cls.company_data['company'].id,
+            'clearance_url': url + '/invoices/clearance/single',
+            'reporting_url': url + '/invoices/reporting/single',
+            'compliance_url': url + '/compliance/invoices',
+        })
+        # retries are the queue's business here, not the session's
+        cls.env['ir.config_parameter'].sudo().set_param('zatca.http_retries', 0)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super(TestZatcaSubmission, cls).tearDownClass()
+
+    def setUp(self):
+        super(TestZatcaSubmission, self).setUp()
+        self.server.answers.clear()
+        del self.server.requests[:]
+
+    def _posted_invoice(self):
+        invoice = self.env['account.move'].create({
+            'move_type': 'out_invoice',
+            'partner_id': self.partner_a.id,
+            'invoice_date': fields.Date.today(),
+            'invoice_line_ids': [(0, 0, {'product_id': self.product_a.id, 'price_unit': 100.0,
+                                         'tax_ids': [(6, 0, self.tax_sale_a.ids)]})],
+        })
+        invoice.action_post()
+        # the XML itself is not under test: a generated document is stored as is
+        xml = b'<Invoice/>'
+        invoice._zatca_documents().invoice_blob_id = self.env['zatca.xml.blob']._store([xml])[xml]
+        invoice.write({'zatca_invoice_name': 'stub.xml', 'zatca_invoice_hash': 'stub-hash',
+                       'invoice_uuid': str(uuid.uuid4())})
+        return invoice
+
+    def _jobs(self, invoice, states=('pending', 'in_flight')):
+        return self.env['zatca.submission'].search([('move_id', '=', invoice.id), ('state', 'in', states)])
+
+    def test_post_enqueues_once(self):
+        invoice = self._posted_invoice()
+        self.assertEqual(len(self._jobs(invoice)), 1)
+        invoice.button_draft()
+        invoice.action_post()
+        self.assertEqual(len(self._jobs(invoice)), 1, "a move posted again must not be submitted twice")
+
+    def test_dispatch_reported(self):
+        invoice = self._posted_invoice()
+        self.server.answers['/invoices/reporting/single'] = (200, {
+            'reportingStatus': 'REPORTED',
+            'validationResults': {'status': 'PASS', 'infoMessages': [
+                {'type': 'INFO', 'code': 'XSD_ZATCA_VALID', 'category': 'XSD validation',
+                 'message': 'Complied with UBL 2.1 standards', 'status': 'PASS'}]},
+        })
+        job = self.env['zatca.submission'].create({'move_id': invoice.id, 'kind': 'reporting'})
+        job._dispatch(max_workers=2)
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(job.status_code, 200)
+        self.assertEqual(invoice.zatca_reporting_status, 'REPORTED')
+        self.assertEqual(self.server.requests, [('/invoices/reporting/single', {
+            'invoiceHash': 'stub-hash', 'uuid': invoice.invoice_uuid,
+            'invoice': 'PEludm9pY2UvPg=='})])
+        messages = self.env['zatca.validation.message'].search([('move_id', '=', invoice.id)])
+        self.assertEqual(messages.mapped('code'), ['XSD_ZATCA_VALID'])
+
+    def test_dispatch_retry_later(self):
+        invoice = self._posted_invoice()
+        self.server.answers['/invoices/reporting/single'] = (503, {})
+        job = self.env['zatca.submission'].create({'move_id': invoice.id, 'kind': 'reporting'})
+        job._dispatch(max_workers=2)
+        self.assertEqual((job.state, job.attempts, job.error), ('pending', 1, 'HTTP 503'))
+        self.assertGreater(job.next_attempt, fields.Datetime.now())
+        # not claimed again before its next attempt
+        with patch.object(self.env.cr, 'commit'):
+            claimed = self.env['zatca.submission']._claim(100)
+        self.assertNotIn(job, claimed)
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_dispatch_rejected(self):
+        invoice = self._posted_invoice()
+        self.server.answers['/invoices/reporting/single'] = (400, {
+            'reportingStatus': 'NOT_REPORTED',
+            'validationResults': {'status': 'ERROR', 'errorMessages': [
+                {'type': 'ERROR', 'code': 'BR-KSA-26', 'category': 'KSA', 'message': 'PIH', 'status': 'ERROR'}]},
+        })
+        job = self.env['zatca.submission'].create({'move_id': invoice.id, 'kind': 'reporting'})
+        job._dispatch(max_workers=2)
+        # a rejection is final, the validation messages tell why
+        self.assertEqual((job.state, job.status_code, job.error), ('failed', 400, 'HTTP 400'))
+        self.assertFalse(job.next_attempt)
+        self.assertEqual(invoice.zatca_reporting_status, 'NOT_REPORTED')
+        self.assertEqual(invoice.zatca_document_id.validation_status, 'ERROR')
+
+    def test_dispatch_unauthorized(self):
+        invoice = self._posted_invoice()
+        self.server.answers['/invoices/reporting/single'] = (401, {})
+        job = self.env['zatca.submission'].create({'move_id': invoice.id, 'kind': 'reporting'})
+        job._dispatch(max_workers=2)
+        self.assertEqual((job.state, job.attempts, job.error), ('failed', 1, 'HTTP 401'))
+        self.assertFalse(invoice.zatca_reporting_status)
+
+    def test_dispatch_reported_with_warnings(self):
+        invoice = self._posted_invoice()
+        self.server.answers['/invoices/reporting/single'] = (202, {
+            'reportingStatus': 'REPORTED',
+            'validationResults': {'status': 'WARNING', 'warningMessages': [
+                {'type': 'WARNING', 'code': 'BR-KSA-08', 'category': 'KSA', 'message': 'ID', 'status': 'WARNING'}]},
+        })
+        job = self.env['zatca.submission'].create({'move_id': invoice.id, 'kind': 'reporting'})
+        job._dispatch(max_workers=2)
+        self.assertEqual(job.state, 'done')
+        self.assertEqual(invoice.zatca_reporting_status, 'REPORTED')
+        self.assertEqual(invoice.zatca_document_id.validation_status, 'WARNING')
+
+    def test_dispatch_skips_reported(self):
+        invoice = self._posted_invoice()
+        invoice.zatca_reporting_status = 'REPORTED'
+        job = self.env['zatca.submission'].create({'move_id': invoice.id, 'kind': 'reporting'})
+        job._dispatch(max_workers=2)
+        self.assertEqual(job.state, 'done')
+        self.assertFalse(self.server.requests, "a reported move must not be reported again")
@@ -0,0 +1,3 @@
+# -*- coding: utf-8 -*-
+
+from . import certificate, client, csr, dispatcher, hashing, money, pool, signing, totals, ubl
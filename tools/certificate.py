@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Signing certificate (ZATCA "5. Signing Process", STEP # 3).
+
+The certificate value stored in the settings is the base64 body of the PEM, with or
+without the PEM armour. It is parsed once per value: the parsed certificate, its
+digest and its issuer/serial strings are cached by the SHA-256 fingerprint of the
+value, so every invoice of a worker reuses them until the CSID is renewed.
+"""
+import base64
+import hashlib
+import threading
+from collections import namedtuple
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+
+Certificate = namedtuple('Certificate', ['certificate', 'digest', 'issuer', 'serial_number', 'cert'])
+
+_lock = threading.Lock()
+_cache = {}
+
+PEM_HEADER = '-----BEGIN CERTIFICATE-----'
+PEM_FOOTER = '-----END CERTIFICATE-----'
+
+
+def fingerprint(value):
+    return hashlib.sha256(value.encode()).hexdigest()
+
+
+def parse(value):
+    """Parse a certificate value, without cache.
+
+    ``digest`` is the base64 of the hex SHA-256 of the value as stored, as expected
+    in ``xades:CertDigest``.
+    """
+    digest = base64.b64encode(fingerprint(value).encode()).decode('UTF-8')
+    body = value.replace(PEM_HEADER, '').replace(PEM_FOOTER, '')
+    # the DER is the PEM body decoded, no need to re-wrap it in 64 character lines
+    der = base64.b64decode(''.join(body.split()))
+    cert = x509.load_der_x509_certificate(der, default_backend())
+    return Certificate(value, digest, cert.issuer.rfc4514_string(), str(cert.serial_number), cert)
+
+
+def load(value):
+    """Return the cached ``Certificate`` of a certificate value, None for an empty value."""
+    if not value:
+        return None
+    key = fingerprint(value)
+    certificate = _cache.get(key)
+    if certificate is None:
+        with _lock:
+            certificate = _cache.get(key)
+            if certificate is None:
+                certificate = _cache[key] = parse(value)
+    return certificate
+
+
+def clear():
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+"""HTTP calls to the ZATCA gateway.
+
+Every call of a worker process goes through one pooled ``requests.Session``, so
+bulk submissions reuse the TCP/TLS connections to the gateway instead of opening
+one per invoice. Throttling (429) and server errors (5xx) are retried by urllib3
+with an exponential backoff, honouring ``Retry-After``.
+
+Nothing in here touches the ORM, so the functions can run in worker threads, see
+:mod:`.dispatcher` for concurrent submissions.
+"""
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+# (connect, read) timeouts in seconds
+DEFAULT_TIMEOUT = (10.0, 60.0)
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 0.5
+DEFAULT_POOL_SIZE = 10
+
+_lock = threading.Lock()
+_sessions = {}
+
+
+def _retry(retries, backoff):
+    options = dict(total=retries, connect=retries, read=retries, status=retries,
+                   backoff_factor=backoff, status_forcelist=RETRY_STATUS_CODES,
+                   raise_on_status=False, respect_retry_after_header=True)
+    # POST is not retried by default; urllib3 < 1.26 names the option method_whitelist
+    try:
+        return Retry(allowed_methods=frozenset(['POST']), **options)
+    except TypeError:
+        return Retry(method_whitelist=frozenset(['POST']), **options)
+
+
+def get_session(retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF, pool_size=DEFAULT_POOL_SIZE):
+    """Return the pooled session of the current process.
+
+    Sessions are keyed on the process id: a session inherited through a fork would
+    share its sockets with the parent, so prefork workers each open their own.
+    """
+    key = (os.getpid(), retries, backoff, pool_size)
+    session = _sessions.get(key)
+    if session is None:
+        with _lock:
+            session = _sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size,
+                                      max_retries=_retry(retries, backoff))
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _sessions[key] = session
+    return session
+
+
+def post(url, headers, data, timeout=DEFAULT_TIMEOUT, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+         pool_size=DEFAULT_POOL_SIZE):
+    session = get_session(retries, backoff, pool_size)
+    return session.post(url, headers=headers, data=data, timeout=timeout)
+
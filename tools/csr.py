@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""EGS key pair and certificate signing request (ZATCA onboarding).
+
+Builds, in memory, what the ZATCA onboarding guide produces with ``openssl ecparam``
+and ``openssl req``: a secp256k1 key and a SHA-256 signed CSR carrying the ZATCA
+certificate template name and the EGS identification in a ``subjectAltName``
+directory name.
+"""
+import base64
+
+from cryptography import x509
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+from cryptography.x509.oid import NameOID, ObjectIdentifier
+
+# Microsoft certificate template name, an ASN.1 PrintableString
+CERTIFICATE_TEMPLATE_OID = ObjectIdentifier('1.3.6.1.4.1.311.20.2')
+CERTIFICATE_TEMPLATE = 'ZATCA-Code-Signing'
+REGISTERED_ADDRESS_OID = ObjectIdentifier('2.5.4.26')
+
+
+def _printable_string(value):
+    value = value.encode('ascii')
+    return b'\x13' + bytes([len(value)]) + value
+
+
+def generate(country, organization_unit, organization, common_name, serial_number, organization_identifier,
+             invoice_type, location_address, business_category, template=CERTIFICATE_TEMPLATE):
+    """Return a new private key, PEM, and its CSR, base64 of the PEM as expected by the compliance API.
+
+    :param serial_number: EGS serial number (SN), e.g. ``1-Odoo|2-14|3-<uuid>``
+    :param organization_identifier: VAT number of the taxpayer (UID)
+    :param invoice_type: invoice types issued by the EGS (title), e.g. ``1100``
+    """
+    private_key = ec.generate_private_key(ec.SECP256K1(), default_backend())
+    subject = x509.Name([
+        x509.NameAttribute(NameOID.COUNTRY_NAME, country),
+        x509.NameAttribute(NameOID.ORGANIZATIONAL_UNIT_NAME, organization_unit),
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, organization),
+        x509.NameAttribute(NameOID.COMMON_NAME, common_name),
+    ])
+    alt_names = x509.Name([
+        x509.NameAttribute(NameOID.SURNAME, serial_number),
+        x509.NameAttribute(NameOID.USER_ID, organization_identifier),
+        x509.NameAttribute(NameOID.TITLE, invoice_type),
+        x509.NameAttribute(REGISTERED_ADDRESS_OID, location_address),
+        x509.NameAttribute(NameOID.BUSINESS_CATEGORY, business_category),
+    ])
+    csr = x509.CertificateSigningRequestBuilder().subject_name(subject).add_extension(
+        x509.UnrecognizedExtension(CERTIFICATE_TEMPLATE_OID, _printable_string(template)), critical=False,
+    ).add_extension(
+        x509.SubjectAlternativeName([x509.DirectoryName(alt_names)]), critical=False,
+    ).sign(private_key, hashes.SHA256(), default_backend())
+
+    private_key_pem = private_key.private_bytes(serialization.Encoding.PEM,
+                                                serialization.PrivateFormat.TraditionalOpenSSL,
+                                                serialization.NoEncryption()).decode()
+    csr_pem = csr.public_bytes(serialization.Encoding.PEM)
+    return private_key_pem, base64.b64encode(csr_pem).decode()
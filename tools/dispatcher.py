@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Concurrent submission of many ZATCA requests.
+
+An asyncio event loop, run in its own thread so it never meets the loop or the
+cursor of the calling worker, drives ``max_in_flight`` submitters. A token bucket
+shared by the submitters caps the request rate; the blocking HTTP calls themselves
+go through the pooled session of :mod:`.client` in an executor of the same size, so
+each in-flight request keeps a warm connection.
+
+Nothing in here touches the ORM.
+"""
+import asyncio
+import functools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from . import client
+
+DEFAULT_MAX_IN_FLIGHT = 20
+
+# end of the answers of a stream
+_DONE = object()
+
+
+class TokenBucket(object):
+    """Allow ``rate`` acquisitions per second on average, ``capacity`` in a burst.
+
+    Only used from the coroutines of one event loop, hence no lock.
+    """
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.stamp = time.monotonic()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+async def _submitter(loop, executor, bucket, pending, answers, options):
+    for key, url, headers, data in pending:
+        await bucket.acquire()
+        try:
+            response = await loop.run_in_executor(
+                executor, functools.partial(client.post, url, headers, data, **options))
+            answers.put((key, (response.status_code, response.text, None)))
+        except Exception as e:
+            answers.put((key, (None, None, e)))
+
+
+def stream(calls, max_in_flight=DEFAULT_MAX_IN_FLIGHT, rate=0, **options):
+    """POST every ``(key, url, headers, data)`` of ``calls`` concurrently, see ``dispatch``.
+
+    :return: generator of ``(key, (status_code, text, exception))`` pairs, in the order
+             the answers come in; the caller thread may handle them with the ORM while
+             the other requests are in flight
+    """
+    max_in_flight = max(1, int(max_in_flight))
+    options['pool_size'] = max(options.get('pool_size', client.DEFAULT_POOL_SIZE), max_in_flight)
+    # the submitters share one iterator, consumed in the dispatcher thread
+    pending = iter(calls)
+    answers = queue.Queue()
+    failure = []
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        executor = ThreadPoolExecutor(max_workers=max_in_flight)
+        try:
+            bucket = TokenBucket(rate)
+            submitters = [_submitter(loop, executor, bucket, pending, answers, options)
+                          for dummy in range(max_in_flight)]
+            loop.run_until_complete(asyncio.gather(*submitters))
+        except Exception as e:
+            failure.append(e)
+        finally:
+            executor.shutdown(wait=True)
+            loop.close()
+            answers.put(_DONE)
+
+    thread = threading.Thread(target=run, name='zatca-dispatcher', daemon=True)
+    thread.start()
+    for answer in iter(answers.get, _DONE):
+        yield answer
+    thread.join()
+    if failure:
+        raise failure[0]
+
+
+def dispatch(calls, max_in_flight=DEFAULT_MAX_IN_FLIGHT, rate=0, **options):
+    """POST every ``(key, url, headers, data)`` of ``calls`` concurrently.
+
+    :param max_in_flight: maximum number of requests waiting for an answer
+    :param rate: maximum number of requests started per second, 0 for no limit
+    :param options: :func:`.client.post` keyword arguments (timeout, retries, backoff)
+    :return: dict mapping each key to a ``(status_code, text, exception)`` tuple
+    """
+    return dict(stream(calls, max_in_flight, rate, **options))
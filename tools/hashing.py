@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+"""Invoice hash (ZATCA "5. Signing Process", STEP # 1).
+
+Two equivalent ways of removing the signature parts before hashing are offered:
+
+* ``xslt``: the historical stylesheet transform. The stylesheet is compiled once per
+  thread and reused, lxml XSLT objects must not be shared between threads. Module
+  globals are created after the fork, so prefork workers each hold their own copy.
+* ``c14n``: the ``UBLExtensions``, ``cac:Signature`` and QR
+  ``AdditionalDocumentReference`` nodes are detached from the already parsed tree,
+  which is canonicalized straight into the SHA-256 digest and then restored. For UBL
+  invoices, which carry no ``xml:id``/``xml:base`` attributes, the inclusive C14N
+  output of lxml is identical to C14N 1.1.
+"""
+import base64
+import hashlib
+import threading
+
+import lxml.etree as ET
+
+from .ubl import CAC, CBC, EXT
+
+HASH_METHODS = ('xslt', 'c14n')
+
+XSL_STYLESHEET = b'''<xsl:stylesheet xmlns:xsl="http://www.w3.org/1999/XSL/Transform"
+                xmlns:xs="http://www.w3.org/2001/XMLSchema"
+                xmlns="urn:oasis:names:specification:ubl:schema:xsd:Invoice-2"
+                xmlns:cac="urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2"
+                xmlns:cbc="urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2"
+                xmlns:ext="urn:oasis:names:specification:ubl:schema:xsd:CommonExtensionComponents-2"
+                exclude-result-prefixes="xs"
+                version="2.0">
+    <xsl:output omit-xml-declaration="yes" encoding="utf-8" indent="no"/>
+    <xsl:template match="node() | @*">
+        <xsl:copy>
+            <xsl:apply-templates select="node() | @*"/>
+        </xsl:copy>
+    </xsl:template>
+    <xsl:template match="//*[local-name()='Invoice']//*[local-name()='UBLExtensions']"></xsl:template>
+    <xsl:template match="//*[local-name()='AdditionalDocumentReference'][cbc:ID[normalize-space(text()) = 'QR']]"></xsl:template>
+     <xsl:template match="//*[local-name()='Invoice']/*[local-name()='Signature']"></xsl:template>
+</xsl:stylesheet>'''
+
+_local = threading.local()
+
+
+def get_transform():
+    """Return the compiled hash stylesheet of the current thread."""
+    transform = getattr(_local, 'transform', None)
+    if transform is None:
+        transform = _local.transform = ET.XSLT(ET.fromstring(XSL_STYLESHEET))
+    return transform
+
+
+class _DigestWriter(object):
+    """File-like object feeding everything written to it into a SHA-256 digest."""
+
+    def __init__(self, keep=False):
+        self.sha256 = hashlib.sha256()
+        self.chunks = [] if keep else None
+
+    def write(self, data):
+        self.sha256.update(data)
+        if self.chunks is not None:
+            self.chunks.append(data)
+        return len(data)
+
+
+def _signature_nodes(root):
+    nodes = list(root.iter(EXT + 'UBLExtensions'))
+    nodes += root.findall(CAC + 'Signature')
+    for reference in root.iter(CAC + 'AdditionalDocumentReference'):
+        document_id = reference.find(CBC + 'ID')
+        if document_id is not None and (document_id.text or '').strip() == 'QR':
+            nodes.append(reference)
+    return nodes
+
+
+def hash_xslt(root):
+    """Return the base64 invoice hash and the transformed document it is computed on."""
+    transformed_xml = ET.tostring(get_transform()(root.getroottree()))
+    return base64.b64encode(hashlib.sha256(transformed_xml).digest()).decode(), transformed_xml
+
+
+def hash_c14n(root, keep=True):
+    """Return the base64 invoice hash and, with ``keep``, the canonical document it is computed on.
+
+    The tree is left untouched: the stripped nodes are put back at their position.
+    """
+    detached = []
+    for node in _signature_nodes(root):
+        parent = node.getparent()
+        if parent is not None:
+            detached.append((parent.index(node), parent, node))
+    # put back in ascending position order, each node then lands at its original index
+    detached.sort(key=lambda item: item[0])
+    for index, parent, node in detached:
+        parent.remove(node)
+    try:
+        writer = _DigestWriter(keep=keep)
+        root.getroottree().write_c14n(writer, with_comments=False)
+    finally:
+        for index, parent, node in detached:
+            parent.insert(index, node)
+    return base64.b64encode(writer.sha256.digest()).decode(), b''.join(writer.chunks) if keep else None
+
+
+def invoice_hash(root, method='xslt'):
+    if method == 'c14n':
+        return hash_c14n(root)
+    return hash_xslt(root)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""SAR amounts as integer halalas.
+
+Values coming from the ORM, floats, are read from their shortest decimal
+representation (what ``Decimal(str(value))`` sees) and every rounding to halalas is
+done once, half to even, on the exact product. VAT rates are kept in hundredths of a
+percent. ZATCA rules applied on top of it:
+
+* BR-KSA-50: line VAT amount (KSA-11) = line net amount (BT-131) x rate, rounded;
+* BR-KSA-51: line amount with VAT (KSA-12) = BT-131 + KSA-11, no rounding;
+* BR-CO-15: invoice total with VAT (BT-112) = BT-109 + BT-110, no rounding.
+
+Amounts are written in the XML with exactly 2 decimals, see ``format``; quantities and
+unit prices keep their stored decimals, see ``plain``.
+"""
+import functools
+from decimal import Decimal
+
+HALALAS = 100
+# rates in hundredths of a percent
+MAX_RATE = 100 * 100
+
+
+@functools.lru_cache(maxsize=4096)
+def _decimal(value):
+    """Return ``(digits, exponent)`` integers with ``value == digits * 10 ** exponent``."""
+    text = str(value)
+    if 'e' in text or 'E' in text:
+        sign, digits, exponent = Decimal(text).as_tuple()
+        digits = int(''.join(map(str, digits)) or 0)
+        return -digits if sign else digits, exponent
+    integer, dot, fraction = text.partition('.')
+    return int(integer + fraction), -len(fraction)
+
+
+def _round(digits, exponent):
+    """Return ``digits * 10 ** exponent`` in hundredths, rounded half to even."""
+    if exponent >= -2:
+        return digits * 10 ** (exponent + 2)
+    divisor = 10 ** (-2 - exponent)
+    quotient, remainder = divmod(digits, divisor)
+    if 2 * remainder > divisor or (2 * remainder == divisor and quotient % 2):
+        quotient += 1
+    return quotient
+
+
+def to_halalas(value):
+    """Return an amount, float, int, str or Decimal, in halalas."""
+    return _round(*_decimal(value))
+
+
+def to_rate(percent):
+    """Return a VAT rate in percent as hundredths of a percent, within [0, 100] %."""
+    return min(max(_round(*_decimal(percent)), 0), MAX_RATE)
+
+
+def line_amount(price, quantity):
+    """Return the rounded amount of ``quantity`` at unit ``price``, both as stored."""
+    price_digits, price_exponent = _decimal(price)
+    quantity_digits, quantity_exponent = _decimal(quantity)
+    return _round(price_digits * quantity_digits, price_exponent + quantity_exponent)
+
+
+def percentage(halalas, percent):
+    """Return ``percent`` % of an amount in halalas, e.g. a line discount."""
+    digits, exponent = _decimal(percent)
+    return _round(halalas * digits, exponent - 4)
+
+
+def vat(halalas, rate):
+    """Return the VAT of an amount in halalas at ``rate`` hundredths of a percent (BR-KSA-50)."""
+    return _round(halalas * rate, -6)
+
+
+def plain(value):
+    """Return the exact decimal text of a value as stored, e.g. a quantity or a unit price, never with an exponent."""
+    digits, exponent = _decimal(value)
+    if exponent >= 0:
+        return str(digits * 10 ** exponent)
+    text = str(abs(digits)).rjust(1 - exponent, '0')
+    return '%s%s.%s' % ('-' if digits < 0 else '', text[:exponent], text[exponent:])
+
+
+def format(halalas):
+    """Return the 2 decimals text of an amount in halalas."""
+    # exact: below 2 ** 53 halalas, the float closest to halalas / 100 prints back as it
+    return '%.2f' % (halalas / HALALAS)
+
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""Process pool stage of the bulk invoice generation.
+
+Rendering, canonicalization and signing are CPU bound and run under the GIL in
+the Odoo worker. With a pool, the worker only prepares the plain invoice data
+(``account.move._zatca_build_data``) and chains the hashes:
+
+1. ``render``, in the pool: the document is rendered and serialized with
+   placeholders for the previous invoice hash (PIH), the invoice digest and the
+   signature value; the document the hash is computed on is kept as well. Both are
+   returned split around their placeholders.
+2. In the worker, in move order: the PIH is spliced into the hashed document and
+   hashed with SHA-256, which gives the PIH of the next invoice (BR-KSA-26).
+3. ``sign``, in the pool: the invoice hashes are signed.
+4. In the worker: PIH, digest and signature value are spliced into the document.
+
+Only plain data and bytes cross the process boundary. The pool is forked from the
+Odoo worker; its processes never touch the ORM nor the database connections they
+inherit.
+"""
+import base64
+import contextlib
+import hashlib
+import multiprocessing
+import re
+from concurrent.futures import ProcessPoolExecutor
+
+from . import hashing, signing, ubl
+
+# base64 alphabet only, the values they stand for are base64 texts
+PIH_PLACEHOLDER = b'ZATCAPIHPLACEHOLDERd41d8cd98f00b204e9800998ecf8427e'
+DIGEST_PLACEHOLDER = b'ZATCADIGESTPLACEHOLDERd41d8cd98f00b204e9800998ecf8427e'
+SIGNATURE_PLACEHOLDER = b'ZATCASIGNATUREPLACEHOLDERd41d8cd98f00b204e9800998ecf8427e'
+_PLACEHOLDERS = re.compile(b'(' + b'|'.join((PIH_PLACEHOLDER, DIGEST_PLACEHOLDER, SIGNATURE_PLACEHOLDER)) + b')')
+
+
+@contextlib.contextmanager
+def executor(processes):
+    """Yield a process pool of ``processes`` forked processes, or None below 2 processes."""
+    if processes < 2:
+        yield None
+        return
+    try:
+        pool = ProcessPoolExecutor(processes, mp_context=multiprocessing.get_context('fork'))
+    except TypeError:
+        # python < 3.7, fork is the default start method on Linux
+        pool = ProcessPoolExecutor(processes)
+    with pool:
+        yield pool
+
+
+def chunksize(count, processes):
+    # a few chunks per process, to balance the load without paying the IPC per invoice
+    return max(1, count // (processes * 4))
+
+
+def _split(document):
+    parts = _PLACEHOLDERS.split(document)
+    if parts.count(PIH_PLACEHOLDER) != 1:
+        raise ValueError('The PIH placeholder must appear once in the document.')
+    return parts
+
+
+def splice(parts, values):
+    """Join split ``parts``, each placeholder replaced by its value in ``values``."""
+    return b''.join(values[part] if index % 2 else part for index, part in enumerate(parts))
+
+
+def render(args):
+    """Return the split hashed document and the split document of a ``(data, hash method)`` tuple."""
+    data, method = args
+    root = ubl.build_invoice(dict(data, ksa_13=PIH_PLACEHOLDER.decode()))
+    signing.fill_signature(root, DIGEST_PLACEHOLDER.decode(), SIGNATURE_PLACEHOLDER.decode())
+    hashed = hashing.invoice_hash(root, method)[1]
+    return _split(hashed), _split(ubl.serialize(root))
+
+
+def chain_hash(hash_parts, previous_hash):
+    """Return the base64 invoice hash and the hashed document for the PIH ``previous_hash``."""
+    document = splice(hash_parts, {PIH_PLACEHOLDER: previous_hash.encode()})
+    return base64.b64encode(hashlib.sha256(document).digest()).decode(), document
+
+
+def sign(args):
+    """Return the signature value of a ``(invoice hash, private key value)`` tuple."""
+    invoice_hash, private_key = args
+    return signing.load(private_key).sign(invoice_hash)
+
+
+def complete(document_parts, previous_hash, invoice_hash, signature_value):
+    """Return the final document, see ``render``."""
+    return splice(document_parts, {
+        PIH_PLACEHOLDER: previous_hash.encode(),
+        DIGEST_PLACEHOLDER: invoice_hash.encode(),
+        SIGNATURE_PLACEHOLDER: signature_value.encode(),
+    })
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+"""XAdES signature of ZATCA invoices (ZATCA "5. Signing Process", STEP # 2, 4 and 5).
+
+The EGS private key, an ECDSA secp256k1 key, is loaded once per key value and
+worker and kept by the fingerprint of the value, like the certificate in
+:mod:`.certificate`.
+
+As done by the ZATCA SDK, the signature value is the ECDSA-SHA256 signature of the
+invoice hash bytes (STEP # 2); the ``ds:SignedInfo`` element only describes it.
+"""
+import base64
+import hashlib
+import threading
+
+import lxml.etree as ET
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+from .ubl import DS, XADES
+
+SIGNATURE_METHOD = 'http://www.w3.org/2001/04/xmldsig-more#ecdsa-sha256'
+
+_lock = threading.Lock()
+_cache = {}
+
+
+class Signer(object):
+    """ECDSA-SHA256 signer of a loaded private key.
+
+    ``value`` is the private key as stored, to hand the signer over to another process.
+    """
+
+    def __init__(self, private_key, value=None):
+        self.private_key = private_key
+        self.value = value
+
+    def sign(self, invoice_hash):
+        """Return the base64 signature value of a base64 invoice hash."""
+        signature = self.private_key.sign(base64.b64decode(invoice_hash), ec.ECDSA(hashes.SHA256()))
+        return base64.b64encode(signature).decode()
+
+
+def parse(value):
+    """Load a private key value, PEM or bare base64 DER, without cache."""
+    if '-----BEGIN' in value:
+        private_key = serialization.load_pem_private_key(value.encode(), None, default_backend())
+    else:
+        private_key = serialization.load_der_private_key(base64.b64decode(''.join(value.split())), None,
+                                                         default_backend())
+    return Signer(private_key, value)
+
+
+def load(value):
+    """Return the cached ``Signer`` of a private key value, None for an empty value."""
+    if not value:
+        return None
+    key = hashlib.sha256(value.encode()).hexdigest()
+    signer = _cache.get(key)
+    if signer is None:
+        with _lock:
+            signer = _cache.get(key)
+            if signer is None:
+                signer = _cache[key] = parse(value)
+    return signer
+
+
+def clear():
+    with _lock:
+        _cache.clear()
+
+
+def signed_properties_digest(signed_properties):
+    """Return the digest of a ``xades:SignedProperties`` element (STEP # 4).
+
+    The element is canonicalized with inclusive C14N, the canonicalization applied by
+    XML-DSig to a same-document reference without transforms, and, as for the
+    certificate digest, the base64 of the hex SHA-256 is used.
+    """
+    canonical = ET.tostring(signed_properties, method='c14n', with_comments=False)
+    return base64.b64encode(hashlib.sha256(canonical).hexdigest().encode()).decode()
+
+
+def sign_invoice(root, invoice_hash, signer):
+    """Complete the ``ds:Signature`` of a built document for its base64 invoice hash (STEP # 5)."""
+    fill_signature(root, invoice_hash, signer.sign(invoice_hash))
+
+
+def fill_signature(root, invoice_hash, signature_value):
+    """Fill the digests and the signature value into the ``ds:Signature`` of a built document."""
+    signature = root.find('.//' + DS + 'Signature')
+    for reference in signature.iter(DS + 'Reference'):
+        if reference.get('Id') == 'invoiceSignedData':
+            reference.find(DS + 'DigestValue').text = invoice_hash
+        elif reference.get('URI') == '#xadesSignedProperties':
+            signed_properties = signature.find('.//' + XADES + 'SignedProperties')
+            reference.find(DS + 'DigestValue').text = signed_properties_digest(signed_properties)
+    signature.find(DS + 'SignatureValue').text = signature_value
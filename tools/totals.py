@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""Invoice line amounts, VAT breakdown (BG-23) and document totals (BG-22).
+
+Quantities, unit prices, discounts and VAT rates are taken column-wise and every
+amount is computed in integer halalas by :mod:`.money`, in one pass over the lines:
+products and sums are exact, no float is re-entered along the way.
+
+Amounts are handed back in halalas and VAT rates in hundredths of a percent, rates of
+exempted, zero rated and out of scope lines are 0.
+"""
+import collections
+
+from . import money
+
+LineAmounts = collections.namedtuple('LineAmounts', 'bt_131 bt_136 ksa_11 ksa_12 bt_152')
+Subtotal = collections.namedtuple('Subtotal', 'bt_118 bt_119 bt_116 bt_117 line')
+Totals = collections.namedtuple('Totals', 'lines subtotals bt_106 bt_107 bt_109 bt_110 bt_112 bt_113 bt_115')
+
+
+def compute(quantities, prices, discounts, categories, percents, allowance=0, prepaid=0):
+    """Return the ``Totals`` of an invoice.
+
+    :param quantities: BT-129 of the lines
+    :param prices: BT-146 net unit prices of the lines, per BT-149 base quantity of 1
+    :param discounts: line discounts in percent, BT-138
+    :param categories: BT-151 VAT category codes of the lines, 'S', 'Z', 'E' or 'O'
+    :param percents: BT-152 VAT rates of the lines in percent, only used for category 'S'
+    :param allowance: BT-107 document level allowances, in halalas
+    :param prepaid: BT-113 paid amount, in halalas
+    """
+    lines = []
+    subtotals = collections.OrderedDict()
+    bt_106 = 0
+    for quantity, price, discount, category, percent in zip(quantities, prices, discounts, categories, percents):
+        gross = money.line_amount(price, quantity)  # BT-137
+        bt_136 = money.percentage(gross, discount) if discount else 0
+        bt_131 = gross - bt_136
+        bt_106 += bt_131
+        rate = money.to_rate(percent) if category == 'S' else 0
+        ksa_11 = money.vat(bt_131, rate)  # BR-KSA-50
+        lines.append(LineAmounts(bt_131, bt_136, ksa_11, bt_131 + ksa_11, rate))  # BR-KSA-51
+        key = (category, rate)
+        if key not in subtotals:
+            subtotals[key] = [0, len(lines) - 1]
+        subtotals[key][0] += bt_131
+
+    bt_110 = 0
+    breakdown = []
+    for (category, rate), (bt_116, line) in subtotals.items():
+        # BR-S-09, BR-Z-09, BR-E-09, BR-O-11: VAT of the breakdown, not the sum of the lines
+        bt_117 = money.vat(bt_116, rate)
+        bt_110 += bt_117
+        breakdown.append(Subtotal(category, rate, bt_116, bt_117, line))
+    bt_109 = bt_106 - allowance
+    bt_112 = bt_109 + bt_110  # BR-CO-15
+    return Totals(lines, breakdown, bt_106, allowance, bt_109, bt_110, bt_112, prepaid, bt_112 - prepaid)
@@ -0,0 +1,258 @@
+# -*- coding: utf-8 -*-
+"""UBL 2.1 renderer for ZATCA invoices.
+
+``build_invoice`` turns the plain invoice data prepared by
+``account.move._zatca_prepare_invoice_data`` into an lxml tree. Elements are appended
+top-down with ``SubElement``, so rendering time grows linearly with the number of
+invoice lines.
+"""
+import lxml.etree as ET
+
+NS_INVOICE = 'urn:oasis:names:specification:ubl:schema:xsd:Invoice-2'
+NS_CAC = 'urn:oasis:names:specification:ubl:schema:xsd:CommonAggregateComponents-2'
+NS_CBC = 'urn:oasis:names:specification:ubl:schema:xsd:CommonBasicComponents-2'
+NS_EXT = 'urn:oasis:names:specification:ubl:schema:xsd:CommonExtensionComponents-2'
+NS_SIG = 'urn:oasis:names:specification:ubl:schema:xsd:CommonSignatureComponents-2'
+NS_SAC = 'urn:oasis:names:specification:ubl:schema:xsd:SignatureAggregateComponents-2'
+NS_SBC = 'urn:oasis:names:specification:ubl:schema:xsd:SignatureBasicComponents-2'
+NS_DS = 'http://www.w3.org/2000/09/xmldsig#'
+NS_XADES = 'http://uri.etsi.org/01903/v1.3.2#'
+
+INVOICE_NSMAP = {None: NS_INVOICE, 'cac': NS_CAC, 'cbc': NS_CBC, 'ext': NS_EXT}
+SIGNATURES_NSMAP = {'sac': NS_SAC, 'sbc': NS_SBC, 'sig': NS_SIG}
+
+INV = '{%s}' % NS_INVOICE
+CAC = '{%s}' % NS_CAC
+CBC = '{%s}' % NS_CBC
+EXT = '{%s}' % NS_EXT
+SIG = '{%s}' % NS_SIG
+SAC = '{%s}' % NS_SAC
+SBC = '{%s}' % NS_SBC
+DS = '{%s}' % NS_DS
+XADES = '{%s}' % NS_XADES
+
+SHA256 = 'http://www.w3.org/2001/04/xmlenc#sha256'
+C14N11 = 'http://www.w3.org/2006/12/xml-c14n11'
+XPATH = 'http://www.w3.org/TR/1999/REC-xpath-19991116'
+XADES_URI = 'urn:oasis:names:specification:ubl:dsig:enveloped:xades'
+SIGNATURE_ID = 'urn:oasis:names:specification:ubl:signature:Invoice'
+
+
+def _node(parent, tag, text=None, attrib=None, nsmap=None):
+    node = ET.SubElement(parent, tag, attrib or {}, nsmap=nsmap)
+    if text is not None:
+        node.text = str(text)
+    return node
+
+
+def _amount(parent, tag, value):
+    return _node(parent, tag, value, {'currencyID': 'SAR'})
+
+
+def _tax_scheme(parent):
+    _node(_node(parent, CAC + 'TaxScheme'), CBC + 'ID', 'VAT')
+
+
+def _signature(parent, signature):
+    extension = _node(_node(parent, EXT + 'UBLExtensions'), EXT + 'UBLExtension')
+    _node(extension, EXT + 'ExtensionURI', XADES_URI)
+    signatures = _node(_node(extension, EXT + 'ExtensionContent'), SIG + 'UBLDocumentSignatures',
+                       nsmap=SIGNATURES_NSMAP)
+    information = _node(signatures, SAC + 'SignatureInformation')
+    _node(information, CBC + 'ID', 'urn:oasis:names:specification:ubl:signature:1')
+    _node(information, SBC + 'ReferencedSignatureID', SIGNATURE_ID)
+    ds_signature = _node(information, DS + 'Signature', attrib={'Id': 'signature'}, nsmap={'ds': NS_DS})
+
+    # STEP # 5 in "5. Signing Process"
+    signed_info = _node(ds_signature, DS + 'SignedInfo')
+    _node(signed_info, DS + 'CanonicalizationMethod', attrib={'Algorithm': C14N11})
+    _node(signed_info, DS + 'SignatureMethod', attrib={'Algorithm': signature['signature_method']})
+    reference = _node(signed_info, DS + 'Reference', attrib={'Id': 'invoiceSignedData', 'URI': ''})
+    transforms = _node(reference, DS + 'Transforms')
+    for xpath in ('not(//ancestor-or-self::ext:UBLExtensions)',
+                  'not(//ancestor-or-self::cac:Signature)',
+                  'not(//ancestor-or-self::cac:AdditionalDocumentReference[cbc:ID="QR"])'):
+        _node(_node(transforms, DS + 'Transform', attrib={'Algorithm': XPATH}), DS + 'XPath', xpath)
+    _node(transforms, DS + 'Transform', attrib={'Algorithm': C14N11})
+    _node(reference, DS + 'DigestMethod', attrib={'Algorithm': SHA256})
+    _node(reference, DS + 'DigestValue', signature['invoice_digest'])
+    reference = _node(signed_info, DS + 'Reference', attrib={
+        'Type': 'http://www.w3.org/2000/09/xmldsig#SignatureProperties', 'URI': '#xadesSignedProperties'})
+    _node(reference, DS + 'DigestMethod', attrib={'Algorithm': SHA256})
+    _node(reference, DS + 'DigestValue', signature['signed_properties_digest'])
+    _node(ds_signature, DS + 'SignatureValue', signature['signature_value'])
+    _node(_node(_node(ds_signature, DS + 'KeyInfo'), DS + 'X509Data'), DS + 'X509Certificate',
+          signature['certificate'])
+
+    # STEP # 3 in "5. Signing Process"
+    properties = _node(_node(ds_signature, DS + 'Object'), XADES + 'QualifyingProperties',
+                       attrib={'Target': 'signature'}, nsmap={'xades': NS_XADES})
+    signed_properties = _node(properties, XADES + 'SignedProperties', attrib={'Id': 'xadesSignedProperties'})
+    signature_properties = _node(signed_properties, XADES + 'SignedSignatureProperties')
+    _node(signature_properties, XADES + 'SigningTime', signature['signing_time'])
+    cert = _node(_node(signature_properties, XADES + 'SigningCertificate'), XADES + 'Cert')
+    digest = _node(cert, XADES + 'CertDigest')
+    _node(digest, DS + 'DigestMethod', attrib={'Algorithm': SHA256})
+    _node(digest, DS + 'DigestValue', signature['certificate_digest'])
+    issuer_serial = _node(cert, XADES + 'IssuerSerial')
+    _node(issuer_serial, DS + 'X509IssuerName', signature['issuer'])
+    _node(issuer_serial, DS + 'X509SerialNumber', signature['serial_number'])
+
+
+def _document_reference(parent, document_id, uuid=None, attachment=None):
+    reference = _node(parent, CAC + 'AdditionalDocumentReference')
+    _node(reference, CBC + 'ID', document_id)
+    if uuid is not None:
+        _node(reference, CBC + 'UUID', uuid)
+    if attachment is not None:
+        _node(_node(reference, CAC + 'Attachment'), CBC + 'EmbeddedDocumentBinaryObject', attachment,
+              {'mimeCode': 'text/plain'})
+
+
+def _postal_address(parent, address):
+    postal_address = _node(parent, CAC + 'PostalAddress')
+    _node(postal_address, CBC + 'StreetName', address['street'])
+    if address.get('street2'):
+        _node(postal_address, CBC + 'AdditionalStreetName', address['street2'])
+    _node(postal_address, CBC + 'BuildingNumber', address['building_no'])
+    if address.get('additional_no'):
+        _node(postal_address, CBC + 'PlotIdentification', address['additional_no'])
+    _node(postal_address, CBC + 'CitySubdivisionName', address['district'])
+    _node(postal_address, CBC + 'CityName', address['city'])
+    _node(postal_address, CBC + 'PostalZone', address['zip'])
+    _node(postal_address, CBC + 'CountrySubentity', address['state'])
+    _node(_node(postal_address, CAC + 'Country'), CBC + 'IdentificationCode', address['country'])
+
+
+def _party(parent, tag, party):
+    node = _node(_node(parent, tag), CAC + 'Party')
+    _node(_node(node, CAC + 'PartyIdentification'), CBC + 'ID', party['identification_no'],
+          {'schemeID': party['identification']})
+    if party.get('address'):
+        _postal_address(node, party['address'])
+    if party.get('tax_scheme'):
+        tax_scheme = _node(node, CAC + 'PartyTaxScheme')
+        if party.get('vat'):
+            _node(tax_scheme, CBC + 'CompanyID', party['vat'])
+        _tax_scheme(tax_scheme)
+    if party.get('registration_name'):
+        _node(_node(node, CAC + 'PartyLegalEntity'), CBC + 'RegistrationName', party['registration_name'])
+
+
+def _tax_category(parent, tag, category, percent=None, exemption=None):
+    node = _node(parent, tag)
+    _node(node, CBC + 'ID', category)
+    if percent is not None:
+        _node(node, CBC + 'Percent', percent)
+    if exemption:
+        _node(node, CBC + 'TaxExemptionReasonCode', exemption[0])
+        _node(node, CBC + 'TaxExemptionReason', exemption[1])
+    _tax_scheme(node)
+
+
+def _invoice_line(parent, line):
+    node = _node(parent, CAC + 'InvoiceLine')
+    _node(node, CBC + 'ID', line['id'])
+    _node(node, CBC + 'InvoicedQuantity', line['bt_129'], {'unitCode': 'PCE'})
+    _amount(node, CBC + 'LineExtensionAmount', line['bt_131'])
+    if line.get('bt_136') is not None:
+        allowance = _node(node, CAC + 'AllowanceCharge')
+        _node(allowance, CBC + 'ChargeIndicator', 'false')
+        _node(allowance, CBC + 'AllowanceChargeReasonCode', '95')
+        _node(allowance, CBC + 'AllowanceChargeReason', 'Discount')
+        _amount(allowance, CBC + 'Amount', line['bt_136'])
+        if line['bt_151'] != 'O':
+            _tax_category(allowance, CAC + 'TaxCategory', 'S', '15')
+    if line.get('tax_total'):  # BR-KSA-52 and BR-KSA-53
+        tax_total = _node(node, CAC + 'TaxTotal')
+        _amount(tax_total, CBC + 'TaxAmount', line['ksa_11'])
+        _amount(tax_total, CBC + 'RoundingAmount', line['ksa_12'])
+    item = _node(node, CAC + 'Item')
+    _node(item, CBC + 'Name', line['name'])
+    if line.get('item_identification'):
+        scheme_id, barcode = line['item_identification']
+        _node(_node(item, CAC + 'StandardItemIdentification'), CBC + 'ID', barcode, {'schemeID': scheme_id})
+    _tax_category(item, CAC + 'ClassifiedTaxCategory', line['bt_151'],
+                  line['bt_152'] if line['bt_151'] != 'O' else None)
+    price = _node(node, CAC + 'Price')
+    _amount(price, CBC + 'PriceAmount', line['bt_146'])
+    _node(price, CBC + 'BaseQuantity', line['bt_149'], {'unitCode': 'PCE'})
+
+
+def build_invoice(data):
+    """Return the root ``Invoice`` element of the UBL 2.1 document described by ``data``."""
+    root = ET.Element(INV + 'Invoice', nsmap=INVOICE_NSMAP)
+    if data.get('signature'):
+        _signature(root, data['signature'])
+        _node(root, CBC + 'UBLVersionID', '2.1')
+    _node(root, CBC + 'ProfileID', 'reporting:1.0')
+    _node(root, CBC + 'ID', data['bt_1'])
+    _node(root, CBC + 'UUID', data['uuid'])
+    _node(root, CBC + 'IssueDate', data['issue_date'])
+    _node(root, CBC + 'IssueTime', data['issue_time'])
+    _node(root, CBC + 'DueDate', data['due_date'])
+    _node(root, CBC + 'InvoiceTypeCode', data['bt_3'], {'name': data['ksa_2']})
+    _node(root, CBC + 'DocumentCurrencyCode', 'SAR')
+    _node(root, CBC + 'TaxCurrencyCode', 'SAR')
+    if data.get('order_reference'):
+        _node(_node(root, CAC + 'OrderReference'), CBC + 'ID', data['order_reference'])
+    for document_id, issue_date in data.get('billing_references', ()):  # BR-KSA-56
+        reference = _node(_node(root, CAC + 'BillingReference'), CAC + 'InvoiceDocumentReference')
+        _node(reference, CBC + 'ID', document_id)
+        _node(reference, CBC + 'IssueDate', issue_date)
+    _document_reference(root, 'ICV', uuid=data['ksa_16'])
+    _document_reference(root, 'PIH', attachment=data['ksa_13'])
+    if data.get('signature'):
+        _document_reference(root, 'QR', attachment=data['qr'])
+        signature = _node(root, CAC + 'Signature')  # BR-KSA-60
+        _node(signature, CBC + 'ID', SIGNATURE_ID)
+        _node(signature, CBC + 'SignatureMethod', XADES_URI)
+    _party(root, CAC + 'AccountingSupplierParty', data['seller'])
+    _party(root, CAC + 'AccountingCustomerParty', data['buyer'])
+    if data.get('delivery_date'):
+        _node(_node(root, CAC + 'Delivery'), CBC + 'ActualDeliveryDate', data['delivery_date'])
+    if data.get('payment_means'):
+        payment_means = _node(root, CAC + 'PaymentMeans')
+        if data['payment_means'].get('code'):
+            _node(payment_means, CBC + 'PaymentMeansCode', data['payment_means']['code'])
+        if data['payment_means'].get('instruction_note'):
+            _node(payment_means, CBC + 'InstructionNote', data['payment_means']['instruction_note'])
+
+    tax_total = _node(root, CAC + 'TaxTotal')
+    _amount(tax_total, CBC + 'TaxAmount', data['bt_110'])
+    for subtotal in data['tax_subtotals']:
+        node = _node(tax_total, CAC + 'TaxSubtotal')
+        _amount(node, CBC + 'TaxableAmount', subtotal['bt_116'])
+        _amount(node, CBC + 'TaxAmount', subtotal['bt_117'])
+        _tax_category(node, CAC + 'TaxCategory', subtotal['bt_118'],
+                      subtotal['bt_119'] if subtotal['bt_118'] != 'O' else None,
+                      (subtotal['bt_121'], subtotal['bt_120']) if subtotal['bt_118'] in ('E', 'O', 'Z') else None)
+    _amount(_node(root, CAC + 'TaxTotal'), CBC + 'TaxAmount', data['bt_111'])
+
+    monetary_total = _node(root, CAC + 'LegalMonetaryTotal')
+    _amount(monetary_total, CBC + 'LineExtensionAmount', data['bt_106'])
+    _amount(monetary_total, CBC + 'TaxExclusiveAmount', data['bt_109'])
+    _amount(monetary_total, CBC + 'TaxInclusiveAmount', data['bt_112'])
+    if data.get('bt_113'):
+        _amount(monetary_total, CBC + 'PrepaidAmount', data['bt_113'])
+    _amount(monetary_total, CBC + 'PayableAmount', data['bt_115'])
+
+    for line in data['lines']:
+        _invoice_line(root, line)
+    return root
+
+
+def set_invoice_digest(root, digest):
+    """Fill the invoice hash into the ``invoiceSignedData`` reference of a built document."""
+    for reference in root.iter(DS + 'Reference'):
+        if reference.get('Id') == 'invoiceSignedData':
+            reference.find(DS + 'DigestValue').text = digest
+
+
+def serialize(root):
+    return ET.tostring(root, xml_declaration=True, encoding='UTF-8')
+
+
+def render(data):
+    """Return the UBL 2.1 document described by ``data`` as UTF-8 bytes."""
+    return serialize(build_invoice(data))
@@ -1,3 +1,3 @@
 # -*- coding: utf-8 -*-
 
-from . import account_debit_note, account_move_reversal
+from . import account_debit_note, account_move_reversal, zatca_batch
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+
+class ZatcaBatch(models.TransientModel):
+    """Generate, sign and submit the ZATCA XML of many moves at once.
+
+    Moves are handled by chunks of ``chunk_size``, the work done is committed after
+    every chunk and counted on the wizard, where the progress of a running batch shows.
+    A move failing a step is rolled back alone,
+    logged and skipped by the next steps; the others carry on.
+    """
+    _name = "zatca.batch"
+    _description = "ZATCA batch processing"
+
+    move_ids = fields.Many2many('account.move', string='Invoices')
+    operation = fields.Selection([('generate', 'Generate and sign XML'),
+                                  ('submit', 'Generate, sign and submit')], default='submit', required=True)
+    kind = fields.Selection([('auto', 'Clearance or reporting'), ('compliance', 'Compliance (sandbox)')],
+                            string='Submission', default='auto', required=True,
+                            help="Clearance for standard invoices and reporting for simplified ones, "
+                                 "or compliance checks in the sandbox.")
+    chunk_size = fields.Integer(default=lambda self: int(
+        self.env['ir.config_parameter'].sudo().get_param('zatca.batch_chunk_size', 200)), required=True)
+    state = fields.Selection([('draft', 'Draft'), ('running', 'Running'), ('done', 'Done')], default='draft',
+                             required=True)
+    total_count = fields.Integer('To Process', readonly=1)
+    processed_count = fields.Integer('Processed', readonly=1)
+    done_count = fields.Integer('Done', readonly=1)
+    failed_count = fields.Integer('Failed', readonly=1)
+    log = fields.Text(readonly=1)
+
+    @api.model
+    def default_get(self, fields_list):
+        res = super(ZatcaBatch, self).default_get(fields_list)
+        if self.env.context.get('active_model') == 'account.move' and 'move_ids' in fields_list:
+            res['move_ids'] = [(6, 0, self.env.context.get('active_ids', []))]
+        return res
+
+    def action_run(self):
+        self.ensure_one()
+        # PIH chain follows the move ids
+        moves = self.move_ids.filtered(lambda m: m.state == 'posted'
+                                       and m.is_sale_document(include_receipts=True)).sorted('id')
+        self.write({'state': 'running', 'total_count': len(moves),
+                    'processed_count': 0, 'done_count': 0, 'failed_count': 0, 'log': False})
+        self.env.cr.commit()
+        chunk_size = max(self.chunk_size, 1)
+        for start in range(0, len(moves), chunk_size):
+            chunk = moves[start:start + chunk_size]
+            failed = {}
+            chunk._zatca_batch_generate(failed)
+            if self.operation == 'submit':
+                # release the chain locks before the HTTP calls
+                self.env.cr.commit()
+                chunk.filtered(lambda m: m.id not in failed)._zatca_batch_submit(
+                    None if self.kind == 'auto' else self.kind, failed)
+            self._log_chunk(chunk, failed)
+            # keep the work done so far whatever happens to the next chunks
+            self.env.cr.commit()
+            chunk.invalidate_cache(ids=chunk.ids)
+            _logger.info("ZATCA batch %s: %s/%s move(s) processed, %s failed.", self.id, self.processed_count,
+                         self.total_count, self.failed_count)
+        self.state = 'done'
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
+
+    def _log_chunk(self, chunk, failed):
+        lines = [self.log] if self.log else []
+        lines.extend('%s: %s' % (move.name, failed[move.id]) for move in chunk if move.id in failed)
+        self.write({
+            'processed_count': self.processed_count + len(chunk),
+            'done_count': self.done_count + len(chunk) - len(failed),
+            'failed_count': self.failed_count + len(failed),
+            'log': '\n'.join(lines) or False,
+        })